@@ -0,0 +1,139 @@
+"""API latency benchmark under concurrent load.
+
+Runs the FastAPI app in-process against a temporary SQLite database and reports
+latency percentiles for database backed endpoints, and how late the event loop
+wakes up from a short sleep while those endpoints are under load.
+
+    python benchmarks/api_latency.py --requests 2000 --concurrency 50
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+DATA_DIR = tempfile.mkdtemp(prefix="fta-bench-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{DATA_DIR}/bench.db")
+os.environ.setdefault("DISABLE_JOBS", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+
+from filetransferautomation import logs, migrations, models  # noqa: E402
+from filetransferautomation.__main__ import app  # noqa: E402
+from filetransferautomation.database import SessionLocal, engine  # noqa: E402
+
+DB_ENDPOINTS = (
+    "/api/v1/tasks",
+    "/api/v1/tasks/status",
+    "/api/v1/logs/tasks",
+    "/api/v1/logs/files",
+    "/api/v1/hosts",
+)
+PROBE_INTERVAL = 0.005
+
+
+def populate(task_count: int, runs_per_task: int):
+    """Add tasks, steps and log history."""
+    with SessionLocal() as db:
+        for task_id in range(1, task_count + 1):
+            db.add(
+                models.Task(
+                    task_id=task_id, name=f"task {task_id}", description="", active=1
+                )
+            )
+            db.add(
+                models.Step(
+                    task_id=task_id,
+                    sort_order=1,
+                    script="local_directory_download_files",
+                )
+            )
+        db.commit()
+    for task_id in range(1, task_count + 1):
+        for run in range(runs_per_task):
+            task_run_id = f"{task_id}-{run}"
+            logs.add_task_log_entry(task_run_id, task_id, "running")
+            logs.add_file_log_entry(task_run_id, task_id, 1, "file.txt", "downloaded")
+            logs.add_task_log_entry(task_run_id, task_id, "success")
+
+
+def percentiles(latencies: list[float]) -> dict:
+    """Latency percentiles in milliseconds."""
+    latencies = sorted(latencies)
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "count": len(latencies),
+        "p50_ms": round(quantiles[49] * 1000, 2),
+        "p95_ms": round(quantiles[94] * 1000, 2),
+        "p99_ms": round(quantiles[98] * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2),
+    }
+
+
+async def run(requests: int, concurrency: int) -> dict:
+    """Send requests with a fixed concurrency and time them."""
+    db_latencies: list[float] = []
+    loop_latencies: list[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)  # type: ignore
+
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+
+        async def request(number: int):
+            url = DB_ENDPOINTS[number % len(DB_ENDPOINTS)]
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(url)
+                db_latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+
+        async def probe(done: asyncio.Event):
+            while not done.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(PROBE_INTERVAL)
+                loop_latencies.append(time.perf_counter() - start - PROBE_INTERVAL)
+
+        done = asyncio.Event()
+        probe_task = asyncio.create_task(probe(done))
+        start = time.perf_counter()
+        await asyncio.gather(*(request(number) for number in range(requests)))
+        duration = time.perf_counter() - start
+        done.set()
+        await probe_task
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "requests_per_sec": round(requests / duration, 1),
+        "db_endpoints": percentiles(db_latencies),
+        "event_loop_lag": percentiles(loop_latencies),
+    }
+
+
+def main():
+    """Run benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--tasks", type=int, default=50)
+    parser.add_argument("--runs-per-task", type=int, default=20)
+    args = parser.parse_args()
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    migrations.upgrade(engine)
+    populate(args.tasks, args.runs_per_task)
+    result = asyncio.run(run(args.requests, args.concurrency))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
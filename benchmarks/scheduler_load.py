@@ -0,0 +1,395 @@
+"""Scheduler and dispatcher load test.
+
+Fills a temporary SQLite database with N tasks of no-op steps and one cron
+schedule each, using populate_test_data.py, then runs jobs.load_jobs,
+jobs.run_schedules and a run queue worker like the app does on startup, until
+every task has run once from load_jobs and once from its schedule. Reports load
+time, fire lag, dispatch latency from queued to started, threads, database
+contention and memory per N, and the first N where the scheduler stops keeping
+up.
+
+    python benchmarks/scheduler_load.py --tasks 10,100,1000,10000
+    python benchmarks/scheduler_load.py --tasks 100000 --timeout 600
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from collections import defaultdict, deque
+import datetime
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+DATA_DIR = tempfile.mkdtemp(prefix="fta-bench-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{DATA_DIR}/bench.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydantic import BaseModel  # noqa: E402
+import standins  # noqa: E402
+
+from filetransferautomation import (  # noqa: E402
+    database,
+    jobs,
+    metrics,
+    migrations,
+    models,
+    run_queue,
+    settings,
+    tasks,
+    worker,
+)
+from filetransferautomation.plugin_collection import (  # noqa: E402
+    Plugin,
+    register_plugin,
+)
+import populate_test_data  # noqa: E402
+
+enqueue_many = run_queue.enqueue_many
+run_task = tasks.run_task
+
+MB = 1024 * 1024
+NOOP_SCRIPT = "benchmark_noop"
+SAMPLE_SEC = 0.05
+POLL_SEC = 0.1
+
+
+class Input(BaseModel):
+    """Input data model."""
+
+    seconds: float | None = 0
+
+
+class Noop(Plugin):
+    """Step that only waits, loading the scheduler without any transfers."""
+
+    input_model = Input
+    arguments = input_model
+    name = NOOP_SCRIPT
+
+    def process(self):
+        """Wait."""
+        if self.arguments.seconds:
+            time.sleep(self.arguments.seconds)
+
+
+class RunTracker:
+    """Times task runs, from the fire time of their schedule to the end of the run.
+
+    The first run of each task is the one load_jobs queues, the second is the
+    first fire of its schedule.
+    """
+
+    def __init__(self, task_count: int):
+        """Init."""
+        self.task_count = task_count
+        self._lock = threading.Lock()
+        self.due: dict[int, datetime.datetime] = {}
+        self.dispatches: dict[int, int] = defaultdict(int)
+        self.queued: dict[int, deque[tuple[str, float]]] = defaultdict(deque)
+        self.in_flight = 0
+        self.done = {"startup": 0, "scheduled": 0}
+        self.all_done: dict[str, float] = {}
+        self.first_dispatch: dict[str, float] = {}
+        self.fire_lags: list[float] = []
+        self.dispatch_latencies: list[float] = []
+        self.run_times: list[float] = []
+
+    def enqueue_many(self, task_ids: list[int]) -> list[int]:
+        """Queue runs, like run_queue.enqueue_many, recording how late they fired."""
+        run_ids = enqueue_many(task_ids)
+        dispatched = time.perf_counter()
+        now = datetime.datetime.now()
+        with self._lock:
+            for task_id in task_ids:
+                self.dispatches[task_id] += 1
+                kind = {1: "startup", 2: "scheduled"}.get(self.dispatches[task_id], "")
+                if kind == "scheduled":
+                    self.fire_lags.append((now - self.due[task_id]).total_seconds())
+                self.first_dispatch.setdefault(kind, dispatched)
+                self.queued[task_id].append((kind, dispatched))
+                self.in_flight += 1
+        return run_ids
+
+    def run_task(self, task_id: int, *args, **kwargs) -> str | None:
+        """Run task, like tasks.run_task, timing the run from when it was queued."""
+        start = time.perf_counter()
+        with self._lock:
+            kind, dispatched = self.queued[task_id].popleft()
+        try:
+            return run_task(task_id, *args, **kwargs)
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.in_flight -= 1
+                if kind == "scheduled":
+                    self.dispatch_latencies.append(start - dispatched)
+                    self.run_times.append(end - start)
+                if kind:
+                    self.done[kind] += 1
+                    if self.done[kind] == self.task_count:
+                        self.all_done[kind] = end
+
+
+class ResourceSampler(standins.PeakRSS):
+    """Samples threads, resident memory and the database writer queue, keeping peaks."""
+
+    def __init__(self):
+        """Init."""
+        super().__init__(SAMPLE_SEC)
+        self.threads = 0
+        self.writer_queue = 0
+
+    def sample_once(self):
+        """Take one sample."""
+        super().sample_once()
+        self.threads = max(self.threads, threading.active_count())
+        if database.writer:
+            self.writer_queue = max(
+                self.writer_queue,
+                database.writer._work_queue.qsize(),  # type: ignore
+            )
+
+
+def histogram_totals(histogram: metrics.Histogram) -> tuple[dict[str, float], float]:
+    """Get bucket counts and sum of a histogram, over all labels."""
+    buckets: dict[str, float] = defaultdict(float)
+    total = 0.0
+    for name, labels, value in histogram.samples():
+        if name.endswith("_bucket"):
+            buckets[labels["le"]] += value
+        elif name.endswith("_sum"):
+            total += value
+    return buckets, total
+
+
+def percentile(values: list[float], fraction: float) -> float | None:
+    """Get a percentile, None without values."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def rounded(value: float | None, scale: float = 1, digits: int = 3) -> float | None:
+    """Round a value, after scaling it, keeping None."""
+    return None if value is None else round(value * scale, digits)
+
+
+def reset():
+    """Remove jobs, tasks and logs of the previous round."""
+    jobs.unload_jobs()
+    jobs.startup_runs_queued = False
+    with database.SessionLocal() as db:
+        for model in (
+            models.RunQueue,
+            models.Task,
+            models.Step,
+            models.Schedule,
+            models.TaskLog,
+            models.StepLog,
+            models.FileLog,
+        ):
+            db.query(model).delete()
+        db.commit()
+
+
+async def wait_for(condition, deadline: float) -> bool:
+    """Wait until a condition is true, False if the deadline passed first."""
+    while not condition():
+        if time.perf_counter() > deadline:
+            return False
+        await asyncio.sleep(POLL_SEC)
+    return True
+
+
+async def run_round(
+    task_count: int, steps_per_task: int, step_sec: float, cron: str, timeout: float
+) -> dict:
+    """Load N tasks and run them from load_jobs and from their schedules."""
+    reset()
+    start = time.perf_counter()
+    with database.SessionLocal() as db:
+        populate_test_data.add_load_test_data(
+            db,
+            task_count,
+            steps_per_task,
+            cron,
+            NOOP_SCRIPT,
+            json.dumps({"seconds": step_sec}),
+        )
+        db.commit()
+    populate_sec = time.perf_counter() - start
+
+    tracker = RunTracker(task_count)
+    run_queue.enqueue_many = tracker.enqueue_many
+    tasks.run_task = tracker.run_task
+    wait_before, wait_sum_before = histogram_totals(metrics.DB_SESSION_WAIT)
+    errors_before = metrics.TASK_RUNS.value(status="error")
+    fast_wait = metrics.format_value(0.01)
+
+    with ResourceSampler() as sampler:
+        start = time.perf_counter()
+        await jobs.load_jobs()
+        load_sec = time.perf_counter() - start
+        tracker.due = {job._args[0]: job.next_run() for job in jobs.scheduler._jobs}
+        schedule_runner = asyncio.ensure_future(jobs.run_schedules())
+        task_worker = asyncio.ensure_future(worker.run_worker())
+
+        first_fire = min(tracker.due.values(), default=datetime.datetime.now())
+        deadline = (
+            time.perf_counter()
+            + (first_fire - datetime.datetime.now()).total_seconds()
+            + timeout
+        )
+        await wait_for(lambda: tracker.done["scheduled"] >= task_count, deadline)
+        schedule_runner.cancel()
+        await wait_for(lambda: tracker.in_flight == 0, time.perf_counter() + timeout)
+        task_worker.cancel()
+        await asyncio.gather(schedule_runner, task_worker, return_exceptions=True)
+
+    wait_after, wait_sum_after = histogram_totals(metrics.DB_SESSION_WAIT)
+    waits = wait_after["+Inf"] - wait_before["+Inf"]
+    scheduled_sec = None
+    if "scheduled" in tracker.all_done:
+        scheduled_sec = (
+            tracker.all_done["scheduled"] - tracker.first_dispatch["scheduled"]
+        )
+    startup_sec = None
+    if "startup" in tracker.all_done:
+        startup_sec = tracker.all_done["startup"] - start
+
+    result = {
+        "tasks": task_count,
+        "steps": task_count * steps_per_task,
+        "populate_sec": rounded(populate_sec),
+        "load_jobs_sec": rounded(load_sec),
+        "load_ms_per_task": rounded(load_sec / task_count, 1000),
+        "startup_runs_sec": rounded(startup_sec),
+        "scheduled_runs_sec": rounded(scheduled_sec),
+        "scheduled_runs_per_sec": (
+            round(task_count / scheduled_sec, 1) if scheduled_sec else None
+        ),
+        "completed": tracker.done["scheduled"],
+        "error_runs": int(metrics.TASK_RUNS.value(status="error") - errors_before),
+        "fire_lag_p50_sec": rounded(percentile(tracker.fire_lags, 0.5)),
+        "fire_lag_p95_sec": rounded(percentile(tracker.fire_lags, 0.95)),
+        "fire_lag_max_sec": rounded(percentile(tracker.fire_lags, 1)),
+        "dispatch_p50_ms": rounded(percentile(tracker.dispatch_latencies, 0.5), 1000),
+        "dispatch_p95_ms": rounded(percentile(tracker.dispatch_latencies, 0.95), 1000),
+        "run_p50_ms": rounded(percentile(tracker.run_times, 0.5), 1000),
+        "run_p95_ms": rounded(percentile(tracker.run_times, 0.95), 1000),
+        "peak_threads": sampler.threads,
+        "peak_rss_mb": round(sampler.peak / MB, 1),
+        "peak_writer_queue": sampler.writer_queue,
+        "db_waits": int(waits),
+        "db_wait_mean_ms": rounded(
+            (wait_sum_after - wait_sum_before) / waits if waits else 0, 1000
+        ),
+        "db_waits_over_10ms": int(
+            waits - (wait_after[fast_wait] - wait_before[fast_wait])
+        ),
+    }
+    print(
+        f"{task_count} tasks: load {result['load_jobs_sec']} s, "
+        f"fire lag p95 {result['fire_lag_p95_sec']} s, "
+        f"dispatch p95 {result['dispatch_p95_ms']} ms, "
+        f"{result['peak_threads']} threads, {result['peak_rss_mb']} MB",
+        file=sys.stderr,
+    )
+    return result
+
+
+def scaling_limit(results: list[dict], max_lag: float) -> tuple[int | None, str]:
+    """Get the first number of tasks the scheduler doesn't keep up with, and why."""
+    for result in results:
+        reasons = []
+        if result["completed"] < result["tasks"]:
+            reasons.append(
+                f"{result['tasks'] - result['completed']} scheduled runs "
+                "not done before the timeout"
+            )
+        if result["error_runs"]:
+            reasons.append(f"{result['error_runs']} runs failed")
+        if (result["fire_lag_p95_sec"] or 0) > max_lag:
+            reasons.append(
+                f"p95 fire lag {result['fire_lag_p95_sec']} s over {max_lag} s"
+            )
+        if reasons:
+            return result["tasks"], ", ".join(reasons)
+    return None, ""
+
+
+async def run(args: argparse.Namespace) -> list[dict]:
+    """Run a round per number of tasks."""
+    results = []
+    for task_count in [int(count) for count in args.tasks.split(",")]:
+        results.append(
+            await run_round(
+                task_count, args.steps, args.step_sec, args.cron, args.timeout
+            )
+        )
+    return results
+
+
+def main():
+    """Run benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--tasks", default="10,100,1000,10000", help="numbers of tasks, one round each"
+    )
+    parser.add_argument("--steps", type=int, default=2, help="no-op steps per task")
+    parser.add_argument(
+        "--step-sec", type=float, default=0, help="seconds each no-op step waits"
+    )
+    parser.add_argument(
+        "--worker-concurrency",
+        type=int,
+        default=settings.WORKER_CONCURRENCY,
+        help="task runs the worker runs at the same time",
+    )
+    parser.add_argument("--cron", default="* * * * *", help="schedule of each task")
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=120,
+        help="seconds to wait for runs after the first scheduled fire",
+    )
+    parser.add_argument(
+        "--max-lag",
+        type=float,
+        default=1,
+        help="p95 fire lag in seconds the scheduler must keep up with",
+    )
+    parser.add_argument("--output", help="write results to this JSON file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    settings.WORKER_CONCURRENCY = args.worker_concurrency
+    settings.WORK_DIR = os.path.join(DATA_DIR, "work")
+    os.makedirs(settings.WORK_DIR)
+    register_plugin(Noop)
+    migrations.upgrade(database.engine)
+
+    results = asyncio.run(run(args))
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    limit, reason = scaling_limit(results, args.max_lag)
+    if limit:
+        print(f"Stops scaling at {limit} tasks: {reason}.")
+    else:
+        print(f"Kept up with {results[-1]['tasks']} tasks.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""In-process SFTP, FTP and SMTP servers standing in for the e2e test containers.
+
+Each server serves a local directory, or counts mailed bytes, on 127.0.0.1 and
+a free port, from daemon threads of the benchmark process. Also holds helpers
+the benchmarks share, like free_port and PeakRSS.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import resource
+import socket
+import threading
+import time
+
+from aiosmtpd.controller import Controller
+import paramiko
+from pyftpdlib.authorizers import DummyAuthorizer
+from pyftpdlib.handlers import FTPHandler
+from pyftpdlib.servers import ThreadedFTPServer
+
+USERNAME = "bench"
+PASSWORD = "bench"
+RSS_SAMPLE_SEC = 0.01
+
+
+def free_port() -> int:
+    """Get a free TCP port on localhost."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class PeakRSS:
+    """Samples resident memory of the process in a thread, keeping the peak."""
+
+    def __init__(self, interval: float = RSS_SAMPLE_SEC):
+        """Init."""
+        self.peak = 0
+        self.interval = interval
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self.sample, daemon=True)
+
+    @staticmethod
+    def rss() -> int:
+        """Get resident memory in bytes."""
+        try:
+            with open("/proc/self/statm") as statm:
+                return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def sample_once(self):
+        """Take one sample."""
+        self.peak = max(self.peak, self.rss())
+
+    def sample(self):
+        """Sample until stopped."""
+        while not self._done.is_set():
+            self.sample_once()
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        """Start sampling."""
+        self.peak = self.rss()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        """Stop sampling."""
+        self._done.set()
+        self._thread.join()
+
+
+class SFTPAuthServer(paramiko.ServerInterface):
+    """SSH server accepting the benchmark user."""
+
+    def check_auth_password(self, username, password):
+        """Check password."""
+        if (username, password) == (USERNAME, PASSWORD):
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        """Get allowed auths."""
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        """Allow sessions."""
+        return paramiko.OPEN_SUCCEEDED
+
+
+class SFTPFileHandle(paramiko.SFTPHandle):
+    """Open file of the SFTP stand-in."""
+
+    def stat(self):
+        """Stat open file."""
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as exc:
+            return paramiko.SFTPServer.convert_errno(exc.errno)
+
+    def chattr(self, attr):
+        """Ignore attribute changes."""
+        return paramiko.SFTP_OK
+
+
+class DirectorySFTPServer(paramiko.SFTPServerInterface):
+    """SFTP server serving a local directory as its root."""
+
+    def __init__(self, server, *args, root: str, **kwargs):
+        """Init."""
+        super().__init__(server, *args, **kwargs)
+        self.root = root
+
+    def local_path(self, path: str) -> str:
+        """Get local path of a remote path."""
+        return os.path.join(self.root, self.canonicalize(path).lstrip("/"))
+
+    def list_folder(self, path):
+        """List folder."""
+        try:
+            local = self.local_path(path)
+            return [
+                paramiko.SFTPAttributes.from_stat(
+                    os.stat(os.path.join(local, name)), name
+                )
+                for name in os.listdir(local)
+            ]
+        except OSError as exc:
+            return paramiko.SFTPServer.convert_errno(exc.errno)
+
+    def stat(self, path):
+        """Stat path."""
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self.local_path(path)))
+        except OSError as exc:
+            return paramiko.SFTPServer.convert_errno(exc.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        """Open file."""
+        try:
+            fd = os.open(
+                self.local_path(path), flags | getattr(os, "O_BINARY", 0), 0o644
+            )
+        except OSError as exc:
+            return paramiko.SFTPServer.convert_errno(exc.errno)
+        if flags & os.O_WRONLY:
+            mode = "ab" if flags & os.O_APPEND else "wb"
+        elif flags & os.O_RDWR:
+            mode = "a+b" if flags & os.O_APPEND else "r+b"
+        else:
+            mode = "rb"
+        handle = SFTPFileHandle(flags)
+        handle.filename = path
+        handle.readfile = handle.writefile = os.fdopen(fd, mode)
+        return handle
+
+    def remove(self, path):
+        """Remove file."""
+        try:
+            os.remove(self.local_path(path))
+        except OSError as exc:
+            return paramiko.SFTPServer.convert_errno(exc.errno)
+        return paramiko.SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        """Rename file."""
+        try:
+            os.replace(self.local_path(oldpath), self.local_path(newpath))
+        except OSError as exc:
+            return paramiko.SFTPServer.convert_errno(exc.errno)
+        return paramiko.SFTP_OK
+
+    posix_rename = rename
+
+    def chattr(self, path, attr):
+        """Ignore attribute changes."""
+        return paramiko.SFTP_OK
+
+
+class SFTPStandIn:
+    """Paramiko SFTP server on a free port."""
+
+    def __init__(self, root: str):
+        """Start server."""
+        logging.getLogger("paramiko.transport").setLevel(logging.CRITICAL)
+        self.root = root
+        self.port = free_port()
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.socket = socket.socket()
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(("127.0.0.1", self.port))
+        self.socket.listen(16)
+        self.transports: list[paramiko.Transport] = []
+        threading.Thread(target=self.serve, name="sftp-standin", daemon=True).start()
+
+    def serve(self):
+        """Accept connections."""
+        while True:
+            try:
+                connection, _ = self.socket.accept()
+            except OSError:
+                return None
+            transport = paramiko.Transport(connection)
+            transport.add_server_key(self.host_key)
+            transport.set_subsystem_handler(
+                "sftp", paramiko.SFTPServer, DirectorySFTPServer, root=self.root
+            )
+            transport.start_server(server=SFTPAuthServer())
+            self.transports.append(transport)
+
+    def close(self):
+        """Stop server."""
+        self.socket.close()
+        for transport in self.transports:
+            transport.close()
+
+
+class FTPStandIn:
+    """Pyftpdlib server on a free port."""
+
+    def __init__(self, root: str):
+        """Start server."""
+        logging.getLogger("pyftpdlib").setLevel(logging.WARNING)
+        authorizer = DummyAuthorizer()
+        authorizer.add_user(USERNAME, PASSWORD, root, perm="elradfmwMT")
+        handler = type("BenchFTPHandler", (FTPHandler,), {"authorizer": authorizer})
+        self.server = ThreadedFTPServer(("127.0.0.1", 0), handler)
+        self.port = self.server.address[1]
+        threading.Thread(
+            target=self.server.serve_forever,
+            kwargs={"handle_exit": False},
+            name="ftp-standin",
+            daemon=True,
+        ).start()
+
+    def close(self):
+        """Stop server."""
+        self.server.close_all()
+
+
+class SinkHandler:
+    """Accepts mail and counts it."""
+
+    def __init__(self):
+        """Init."""
+        self.messages = 0
+        self.bytes = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        """Count received mail."""
+        self.messages += 1
+        self.bytes += len(envelope.content)
+        return "250 OK"
+
+
+class SMTPStandIn:
+    """Aiosmtpd server on a free port that drops all mail."""
+
+    def __init__(self):
+        """Start server."""
+        self.handler = SinkHandler()
+        self.port = free_port()
+        self.controller = Controller(
+            self.handler,
+            hostname="127.0.0.1",
+            port=self.port,
+            loop=asyncio.new_event_loop(),
+            server_kwargs={"data_size_limit": 2**40},
+        )
+        self.controller.start()
+
+    def close(self):
+        """Stop server."""
+        self.controller.stop()
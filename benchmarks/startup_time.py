@@ -0,0 +1,158 @@
+"""Cold start benchmark.
+
+Times, each in a fresh interpreter and against a temporary SQLite database:
+importing the app and the command line runner, loading the plugin of one step
+script, and starting the API with main() until it answers its first request.
+Also reports which protocol libraries each case imported, since plugin modules
+should only be imported when a step uses them.
+
+    python benchmarks/startup_time.py --repeat 5
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+import standins
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROTOCOL_MODULES = ("paramiko", "pysftp", "smbclient", "ftplib", "email.mime")
+FIRST_REQUEST_TIMEOUT = 60
+POLL_SEC = 0.01
+
+REPORT = f"""
+import json, sys
+print(json.dumps({{
+    "seconds": time.perf_counter() - start,
+    "modules": len(sys.modules),
+    "protocol_modules": [m for m in {PROTOCOL_MODULES!r} if m in sys.modules],
+}}))
+"""
+
+CASES = {
+    "import_app": """
+import time
+start = time.perf_counter()
+import filetransferautomation.__main__
+""",
+    "import_cli": """
+import time
+start = time.perf_counter()
+import filetransferautomation.cli
+""",
+    "first_plugin": """
+import time
+start = time.perf_counter()
+from filetransferautomation.plugin_collection import get_plugin
+assert get_plugin("local_directory_download_files")
+""",
+}
+
+SERVE = """
+import sys
+from filetransferautomation import settings
+settings.FOLDERS_DIR = sys.argv[1] + "/folders"
+settings.WORK_DIR = sys.argv[1] + "/work"
+sys.argv = ["file-transfer-automation", "-p", sys.argv[2]]
+from filetransferautomation.__main__ import main
+main()
+"""
+
+
+def environment(data_dir: str) -> dict:
+    """Get the environment of a benchmark process."""
+    return {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{data_dir}/bench.db",
+        "DISABLE_JOBS": "1",
+        "PYTHONPATH": ROOT,
+    }
+
+
+def run_case(code: str) -> dict:
+    """Run code in a new interpreter, getting its report."""
+    with tempfile.TemporaryDirectory(prefix="fta-bench-") as data_dir:
+        output = subprocess.run(
+            [sys.executable, "-c", code + REPORT],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=data_dir,
+            env=environment(data_dir),
+        ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def first_request(path: str = "/api/v1/tasks") -> dict:
+    """Start the API in a new interpreter and time until a request succeeds."""
+    with tempfile.TemporaryDirectory(prefix="fta-bench-") as data_dir:
+        port = standins.free_port()
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-c", SERVE, data_dir, str(port)],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            cwd=data_dir,
+            env=environment(data_dir),
+        )
+        try:
+            while time.perf_counter() - start < FIRST_REQUEST_TIMEOUT:
+                if process.poll() is not None:
+                    raise RuntimeError("API exited before answering a request")
+                try:
+                    with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}"):
+                        return {"seconds": time.perf_counter() - start}
+                except (urllib.error.URLError, ConnectionError):
+                    time.sleep(POLL_SEC)
+            raise RuntimeError("API did not answer a request in time")
+        finally:
+            process.terminate()
+            process.wait()
+
+
+def summarize(runs: list[dict]) -> dict:
+    """Get the median and spread of the timings of a case."""
+    seconds = [run["seconds"] for run in runs]
+    return {
+        **{key: value for key, value in runs[-1].items() if key != "seconds"},
+        "median_ms": round(statistics.median(seconds) * 1000, 1),
+        "min_ms": round(min(seconds) * 1000, 1),
+        "max_ms": round(max(seconds) * 1000, 1),
+    }
+
+
+def main():
+    """Run benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="runs per case")
+    parser.add_argument("--output", help="write results to this JSON file")
+    args = parser.parse_args()
+
+    results = {}
+    for name, code in CASES.items():
+        results[name] = summarize([run_case(code) for _ in range(args.repeat)])
+    results["first_request"] = summarize([first_request() for _ in range(args.repeat)])
+    for name, result in results.items():
+        print(
+            f"{name}: {result['median_ms']} ms median, "
+            f"protocol modules {result.get('protocol_modules', '-')}",
+            file=sys.stderr,
+        )
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
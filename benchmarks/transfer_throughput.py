@@ -0,0 +1,298 @@
+"""Transfer throughput benchmark of the step plugins.
+
+Starts in-process stand-ins for SFTP, FTP and SMTP servers, see standins.py, and
+runs the ftp, sftp, local_directory and mail plugins over a matrix of file sizes
+and file counts, against a temporary SQLite database. Records MB/s, files/s,
+CPU time and peak RSS of the process, stand-ins included, as a JSON baseline,
+and compares it to an earlier baseline.
+
+    pip install -e .[bench]
+    python benchmarks/transfer_throughput.py --output baseline.json
+    python benchmarks/transfer_throughput.py --compare baseline.json
+"""
+from __future__ import annotations
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+DATA_DIR = tempfile.mkdtemp(prefix="fta-bench-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{DATA_DIR}/bench.db")
+os.environ.setdefault("DISABLE_JOBS", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import standins  # noqa: E402
+
+from filetransferautomation import migrations, models, settings  # noqa: E402
+from filetransferautomation.database import engine  # noqa: E402
+from filetransferautomation.step_plugins import (  # noqa: E402
+    ftp,
+    local_directory,
+    mail,
+    sftp,
+)
+
+MB = 1024 * 1024
+
+
+def run_plugin(plugin_class, arguments: dict, host, workspace_directory: str):
+    """Run a step plugin outside a task, logging to the benchmark database."""
+    variables = {
+        "task_id": 0,
+        "step_id": 0,
+        "host": host,
+        "workspace_id": str(uuid.uuid4()),
+        "workspace_directory": workspace_directory,
+    }
+    plugin_class(json.dumps(arguments), variables).process()
+
+
+def measure(
+    name: str, direction: str, file_size: int, file_count: int, function
+) -> dict:
+    """Time a transfer of files and get its throughput and resource use."""
+    cpu_start = time.process_time()
+    with standins.PeakRSS() as peak_rss:
+        start = time.perf_counter()
+        function()
+        seconds = time.perf_counter() - start
+    cpu_sec = time.process_time() - cpu_start
+    result = {
+        "plugin": name,
+        "direction": direction,
+        "file_size": file_size,
+        "file_count": file_count,
+        "seconds": round(seconds, 4),
+        "mb_per_sec": round(file_size * file_count / MB / seconds, 2),
+        "files_per_sec": round(file_count / seconds, 2),
+        "cpu_sec": round(cpu_sec, 4),
+        "peak_rss_mb": round(peak_rss.peak / MB, 1),
+    }
+    print(
+        f"{name} {direction} {file_count} x {file_size} bytes: "
+        f"{result['mb_per_sec']} MB/s, {result['files_per_sec']} files/s",
+        file=sys.stderr,
+    )
+    return result
+
+
+def make_files(directory: str, file_size: int, file_count: int):
+    """Write random files."""
+    data = os.urandom(file_size)
+    for number in range(file_count):
+        with open(os.path.join(directory, f"bench{number:05d}.dat"), "wb") as file:
+            file.write(data)
+
+
+def clear_directory(directory: str):
+    """Remove all files in a directory."""
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+
+
+def run_matrix(sizes: list[int], counts: list[int], max_total: int) -> list[dict]:
+    """Run each plugin over the matrix of file sizes and counts."""
+    workspace = os.path.join(DATA_DIR, "workspace")
+    remote = os.path.join(DATA_DIR, "remote")
+    os.makedirs(workspace)
+    os.makedirs(remote)
+
+    sftp_server = standins.SFTPStandIn(remote)
+    ftp_server = standins.FTPStandIn(remote)
+    smtp_server = standins.SMTPStandIn()
+    settings.SMTP_HOSTNAME = "127.0.0.1"
+    settings.SMTP_PORT = smtp_server.port
+    settings.SMTP_TLS = False
+    settings.SMTP_USERNAME = ""
+    settings.SMTP_MAX_MESSAGE_SIZE = max_total * 2
+
+    def host(port: int | None = None, directory: str | None = "/") -> models.Host:
+        return models.Host(
+            name="bench",
+            host="127.0.0.1",
+            port=port,
+            username=standins.USERNAME,
+            password=standins.PASSWORD,
+            directory=directory,
+        )
+
+    transfers = (
+        ("sftp", sftp.Upload, sftp.Download, host(sftp_server.port)),
+        ("ftp", ftp.Upload, ftp.Download, host(ftp_server.port)),
+        (
+            "local_directory",
+            local_directory.UploadFiles,
+            local_directory.DownloadFiles,
+            host(directory=remote),
+        ),
+    )
+    arguments = {"file_filter": "*", "delete_files": False}
+    mail_arguments = {
+        "file_filter": "*",
+        "from_address": "bench@example.com",
+        "to_addresses": ["bench@example.com"],
+        "subject": "Benchmark",
+        "body": "Benchmark",
+    }
+
+    results = []
+    try:
+        for file_size in sizes:
+            for file_count in counts:
+                if file_size * file_count > max_total:
+                    continue
+                for name, upload, download, transfer_host in transfers:
+                    make_files(workspace, file_size, file_count)
+                    results.append(
+                        measure(
+                            name,
+                            "upload",
+                            file_size,
+                            file_count,
+                            lambda: run_plugin(
+                                upload, arguments, transfer_host, workspace
+                            ),
+                        )
+                    )
+                    clear_directory(workspace)
+                    results.append(
+                        measure(
+                            name,
+                            "download",
+                            file_size,
+                            file_count,
+                            lambda: run_plugin(
+                                download, arguments, transfer_host, workspace
+                            ),
+                        )
+                    )
+                    clear_directory(workspace)
+                    clear_directory(remote)
+
+                make_files(workspace, file_size, file_count)
+                results.append(
+                    measure(
+                        "mail",
+                        "send",
+                        file_size,
+                        file_count,
+                        lambda: run_plugin(
+                            mail.SendFiles, mail_arguments, None, workspace
+                        ),
+                    )
+                )
+                clear_directory(workspace)
+    finally:
+        sftp_server.close()
+        ftp_server.close()
+        smtp_server.close()
+        mail.pool.close_all()
+    return results
+
+
+def git_commit() -> str:
+    """Get the current commit, if run from a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def case_key(result: dict) -> tuple:
+    """Get the matrix case of a result."""
+    return (
+        result["plugin"],
+        result["direction"],
+        result["file_size"],
+        result["file_count"],
+    )
+
+
+def compare(baseline: dict, current: dict, max_regression: float) -> bool:
+    """Print throughput change per case, False if any case regressed too much."""
+    before = {case_key(result): result for result in baseline["results"]}
+    passed = True
+    print(f"Compared to {baseline.get('commit') or 'baseline'}:")
+    for result in current["results"]:
+        old = before.get(case_key(result))
+        if not old:
+            continue
+        change = (result["mb_per_sec"] / old["mb_per_sec"] - 1) * 100
+        regressed = change < -max_regression
+        passed = passed and not regressed
+        print(
+            f"{'REGRESSED ' if regressed else ''}{result['plugin']} "
+            f"{result['direction']} {result['file_count']} x {result['file_size']}: "
+            f"{old['mb_per_sec']} -> {result['mb_per_sec']} MB/s ({change:+.1f}%), "
+            f"cpu {old['cpu_sec']} -> {result['cpu_sec']} s, "
+            f"rss {old['peak_rss_mb']} -> {result['peak_rss_mb']} MB"
+        )
+    return passed
+
+
+def main():
+    """Run benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", default="4096,1048576,33554432", help="file sizes in bytes"
+    )
+    parser.add_argument("--counts", default="1,100", help="numbers of files")
+    parser.add_argument(
+        "--max-total", type=int, default=256 * MB, help="skip larger cases, in bytes"
+    )
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="compare to this JSON baseline")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=10,
+        help="fail if MB/s drops more than this percentage",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    migrations.upgrade(engine)
+
+    result = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "results": run_matrix(
+            [int(size) for size in args.sizes.split(",")],
+            [int(count) for count in args.counts.split(",")],
+            args.max_total,
+        ),
+    }
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(result, output, indent=2)
+    else:
+        print(json.dumps(result, indent=2))
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            if not compare(json.load(baseline), result, args.max_regression):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
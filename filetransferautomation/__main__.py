@@ -6,25 +6,29 @@ import asyncio
 import logging
 import sys
 
+import anyio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
 
 from filetransferautomation import (
+    diagnostics,
     folders,
     hosts,
     jobs,
     logs,
+    metrics,
+    migrations,
     plugins,
     schedules,
     settings,
+    smtp_pool,
     steps,
     tasks,
 )
 from filetransferautomation.folders import setup_std_folders
-from filetransferautomation.jobs import load_jobs, run_schedules
+from filetransferautomation.jobs import run_log_retention, run_schedules
+from filetransferautomation.worker import run_worker
 
-from . import models
 from .database import engine
 
 if not settings.DEV_MODE:
@@ -44,63 +48,83 @@ if settings.DEV_MODE:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=[logs.NEXT_CURSOR_HEADER],
     )
 
 
 app.include_router(
-    tasks.router,
-    prefix="/api/v1/tasks",
-    tags=["tasks"],
+    metrics.router,
+    prefix="/metrics",
+    tags=["metrics"],
 )
 
-app.include_router(
-    hosts.router,
-    prefix="/api/v1/hosts",
-    tags=["hosts"],
-)
+# Processes without the api role, only schedulers and workers, serve metrics only.
+if "api" in settings.ROLES:
+    app.include_router(
+        tasks.router,
+        prefix="/api/v1/tasks",
+        tags=["tasks"],
+    )
 
-app.include_router(
-    steps.router,
-    prefix="/api/v1/steps",
-    tags=["steps"],
-)
+    app.include_router(
+        hosts.router,
+        prefix="/api/v1/hosts",
+        tags=["hosts"],
+    )
 
-app.include_router(
-    schedules.router,
-    prefix="/api/v1/schedules",
-    tags=["schedules"],
-)
+    app.include_router(
+        steps.router,
+        prefix="/api/v1/steps",
+        tags=["steps"],
+    )
 
-app.include_router(
-    folders.router,
-    prefix="/api/v1/folders",
-    tags=["folders"],
-)
+    app.include_router(
+        schedules.router,
+        prefix="/api/v1/schedules",
+        tags=["schedules"],
+    )
 
-app.include_router(
-    logs.router,
-    prefix="/api/v1/logs",
-    tags=["logs"],
-)
+    app.include_router(
+        folders.router,
+        prefix="/api/v1/folders",
+        tags=["folders"],
+    )
 
-app.include_router(
-    jobs.router,
-    prefix="/api/v1/jobs",
-    tags=["jobs"],
-)
+    app.include_router(
+        logs.router,
+        prefix="/api/v1/logs",
+        tags=["logs"],
+    )
 
-app.include_router(
-    plugins.router,
-    prefix="/api/v1/plugins",
-    tags=["plugins"],
-)
+    app.include_router(
+        jobs.router,
+        prefix="/api/v1/jobs",
+        tags=["jobs"],
+    )
+
+    app.include_router(
+        plugins.router,
+        prefix="/api/v1/plugins",
+        tags=["plugins"],
+    )
+
+if settings.ENABLE_DIAGNOSTICS:
+    app.include_router(
+        diagnostics.router,
+        prefix="/api/v1/diagnostics",
+        tags=["diagnostics"],
+    )
 
 
 @app.on_event("startup")
 async def startup():
     """Start File Transfer Automation."""
 
-    models.Base.metadata.create_all(bind=engine)
+    # Sync endpoints run in this thread pool, keeping blocking calls off the loop.
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = settings.API_THREADPOOL_SIZE
+
+    migrations.upgrade(engine)
 
     setup_std_folders()
 
@@ -108,9 +132,21 @@ async def startup():
     folders_data = folders.load_folders()
     logging.info(f"{len(folders_data)} folders loaded.")
 
-    if not settings.DISABLE_JOBS:
-        await load_jobs()
+    # The scheduler runs only while this process holds the scheduler lease,
+    # queueing runs that worker processes claim.
+    if "scheduler" in settings.ROLES and not settings.DISABLE_JOBS:
         asyncio.ensure_future(run_schedules())
+        if settings.LOG_RETENTION_DAYS:
+            asyncio.ensure_future(run_log_retention())
+    if "worker" in settings.ROLES:
+        asyncio.ensure_future(run_worker())
+
+
+@app.on_event("shutdown")
+def shutdown():
+    """Stop File Transfer Automation."""
+    jobs.release_scheduler_lease()
+    smtp_pool.pool.close_all()
 
 
 def get_arguments() -> argparse.Namespace:
@@ -133,16 +169,20 @@ def get_arguments() -> argparse.Namespace:
 
 def main():
     """Startup."""
+    import uvicorn
+
     args = get_arguments()
 
     reload = False
     if settings.DEV_MODE:
         reload = True
 
+    # Reloading needs an import string, otherwise pass the app already imported
+    # rather than importing this module a second time under its package name.
     uvicorn.run(
-        "filetransferautomation.__main__:app",
+        "filetransferautomation.__main__:app" if reload else app,
         host="0.0.0.0",
-        port=args.port,
+        port=int(args.port),
         reload=reload,
     )
 
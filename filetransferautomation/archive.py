@@ -0,0 +1,116 @@
+"""Zip and tar archives streamed while they are built."""
+from __future__ import annotations
+
+from collections.abc import Iterator
+import io
+import os
+import queue
+import tarfile
+import threading
+import zipfile
+
+from filetransferautomation.transfer import CHUNK_SIZE, copy_fileobj
+
+ARCHIVE_FORMATS = {
+    "zip": "application/zip",
+    "tar": "application/x-tar",
+    "tar.gz": "application/gzip",
+}
+QUEUE_CHUNKS = 8
+
+
+class ArchiveCancelled(Exception):
+    """The reader of a streamed archive went away."""
+
+
+class QueueWriter(io.RawIOBase):
+    """Unseekable file that hands written data to a bounded queue."""
+
+    def __init__(self, chunks: queue.Queue, cancelled: threading.Event):
+        """Init."""
+        self.chunks = chunks
+        self.cancelled = cancelled
+        self.buffer = bytearray()
+
+    def writable(self) -> bool:
+        """Writable."""
+        return True
+
+    def write(self, data) -> int:
+        """Buffer data, putting full chunks on the queue."""
+        self.buffer += data
+        if len(self.buffer) >= CHUNK_SIZE:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        """Put buffered data on the queue."""
+        if not self.buffer:
+            return None
+        self.put(bytes(self.buffer))
+        self.buffer.clear()
+
+    def put(self, item):
+        """Put an item on the queue, waiting while it is full."""
+        while True:
+            if self.cancelled.is_set():
+                raise ArchiveCancelled()
+            try:
+                return self.chunks.put(item, timeout=1)
+            except queue.Full:
+                continue
+
+
+def write_archive(
+    to_file: QueueWriter, directory: str, names: list[str], archive_format: str
+):
+    """Write files in a directory to an archive."""
+    if archive_format == "zip":
+        with zipfile.ZipFile(to_file, "w", zipfile.ZIP_DEFLATED) as archive:
+            for name in names:
+                path = os.path.join(directory, name)
+                info = zipfile.ZipInfo.from_file(path, name)
+                info.compress_type = zipfile.ZIP_DEFLATED
+                with open(path, "rb") as from_file, archive.open(
+                    info, "w", force_zip64=True
+                ) as archive_file:
+                    copy_fileobj(from_file, archive_file)  # type: ignore
+    else:
+        mode = "w|gz" if archive_format == "tar.gz" else "w|"
+        with tarfile.open(fileobj=to_file, mode=mode) as archive:  # type: ignore
+            for name in names:
+                archive.add(os.path.join(directory, name), name)
+    to_file.flush()
+
+
+def stream_archive(
+    directory: str, names: list[str], archive_format: str
+) -> Iterator[bytes]:
+    """Yield an archive of files in chunks, built in a thread as it is read."""
+    chunks: queue.Queue = queue.Queue(QUEUE_CHUNKS)
+    cancelled = threading.Event()
+    done = object()
+    errors: list[Exception] = []
+
+    def build():
+        to_file = QueueWriter(chunks, cancelled)
+        try:
+            write_archive(to_file, directory, names, archive_format)
+        except ArchiveCancelled:
+            return None
+        except Exception as exc:
+            errors.append(exc)
+        try:
+            to_file.put(done)
+        except ArchiveCancelled:
+            return None
+
+    thread = threading.Thread(target=build, name="archive", daemon=True)
+    thread.start()
+    try:
+        while (chunk := chunks.get()) is not done:
+            yield chunk
+    finally:
+        cancelled.set()
+    if errors:
+        raise errors[0]
@@ -0,0 +1,91 @@
+"""Bandwidth shaping of file transfers with shared token buckets."""
+from __future__ import annotations
+
+import threading
+import time
+
+from filetransferautomation import metrics, models, settings
+
+PRIORITIES = ("high", "normal", "low")
+DEFAULT_PRIORITY = "normal"
+
+
+class TokenBucket:
+    """Token bucket of bytes per second, serving more urgent priorities first.
+
+    Each priority keeps the time its reservations are paid up to, counting the
+    bytes of its own and more urgent priorities only. A high priority transfer
+    gets the full rate, less urgent ones get what is left.
+    """
+
+    def __init__(self, rate: float, burst: float = settings.BANDWIDTH_BURST):
+        """Init."""
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._paid_until = [0.0] * len(PRIORITIES)
+
+    def reserve(self, count: int, priority: int = 1) -> float:
+        """Take bytes from the bucket, getting the seconds to wait before sending."""
+        now = time.monotonic()
+        burst_sec = self.burst / self.rate
+        with self._lock:
+            for rank in range(priority, len(PRIORITIES)):
+                self._paid_until[rank] = (
+                    max(self._paid_until[rank], now - burst_sec) + count / self.rate
+                )
+            return max(self._paid_until[priority] - now, 0)
+
+
+_lock = threading.Lock()
+_buckets: dict[tuple[str, int], TokenBucket] = {}
+
+
+def get_bucket(scope: str, key: int, rate: float) -> TokenBucket:
+    """Get the bucket of a scope, updated to the current rate."""
+    with _lock:
+        bucket = _buckets.get((scope, key))
+        if not bucket:
+            bucket = _buckets[(scope, key)] = TokenBucket(rate)
+        bucket.rate = rate
+    return bucket
+
+
+def get_priority(task: models.Task | None) -> str:
+    """Get the priority class of a task."""
+    if task and task.priority in PRIORITIES:
+        return task.priority
+    return DEFAULT_PRIORITY
+
+
+class Throttle:
+    """Shapes one file transfer through the global, host and task buckets."""
+
+    def __init__(self, host: models.Host | None, task: models.Task | None):
+        """Init."""
+        self.priority = get_priority(task)
+        self.labels = {
+            "host": host.name if host and host.name else "",
+            "task": task.name if task else "",
+            "priority": self.priority,
+        }
+        self.buckets = []
+        if settings.BANDWIDTH_LIMIT > 0:
+            self.buckets.append(get_bucket("global", 0, settings.BANDWIDTH_LIMIT))
+        if host and host.host_id and (host.max_bytes_per_sec or 0) > 0:
+            self.buckets.append(
+                get_bucket("host", host.host_id, host.max_bytes_per_sec)
+            )
+        if task and task.task_id and (task.max_bytes_per_sec or 0) > 0:
+            self.buckets.append(
+                get_bucket("task", task.task_id, task.max_bytes_per_sec)
+            )
+
+    def __call__(self, count: int):
+        """Count a chunk sent or received, sleeping as long as the buckets ask."""
+        metrics.SHAPED_BYTES.inc(count, **self.labels)
+        rank = PRIORITIES.index(self.priority)
+        wait = max((bucket.reserve(count, rank) for bucket in self.buckets), default=0)
+        if wait > 0:
+            metrics.BANDWIDTH_WAIT.inc(wait, **self.labels)
+            time.sleep(wait)
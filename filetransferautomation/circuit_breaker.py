@@ -0,0 +1,200 @@
+"""Per host circuit breakers, failing fast on hosts that can't be connected to."""
+from __future__ import annotations
+
+from collections.abc import Iterator
+from contextlib import contextmanager
+import datetime
+import logging
+import threading
+import time
+
+from filetransferautomation import metrics, models, settings
+from filetransferautomation.database import SessionLocal, serialized_write
+from filetransferautomation.models import HostCircuit
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of connecting to a host while its circuit is open."""
+
+
+class CircuitBreaker:
+    """Circuit of one host, opened by consecutive connection failures.
+
+    While open, connecting fails at once. After CIRCUIT_OPEN_SEC it is half open
+    and lets one connection through as a trial, closing again when it succeeds
+    and opening again when it fails. Changes are stored in the host_circuit
+    table, so processes that don't connect to hosts can report them.
+    """
+
+    def __init__(self, host_id: int, name: str):
+        """Init."""
+        self.host_id = host_id
+        self.name = name
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.opened_time: datetime.datetime | None = None
+        self.trial_running = False
+        self.last_error = ""
+        self._lock = threading.Lock()
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logging.info(f"Circuit of host '{self.name}' is {state}.")
+        self.state = state
+        metrics.HOST_CIRCUIT_STATE.set(STATE_VALUES[state], host=self.name)
+
+    def _snapshot(self) -> HostCircuit:
+        return HostCircuit(
+            host_id=self.host_id,
+            state=self.state,
+            failures=self.failures,
+            last_error=self.last_error,
+            opened_at=self.opened_time,
+            updated_at=datetime.datetime.now(),
+        )
+
+    def _save(self, circuit: HostCircuit):
+        try:
+            save_circuit(circuit)
+        except Exception as exc:
+            logging.warning(
+                f"Failed to store circuit of host '{self.name}', message: '{exc}'."
+            )
+
+    def before_connect(self):
+        """Check a connection may be tried, raising CircuitOpenError if not."""
+        circuit = None
+        with self._lock:
+            if (
+                self.state == OPEN
+                and self.opened_at is not None
+                and time.monotonic() - self.opened_at >= settings.CIRCUIT_OPEN_SEC
+            ):
+                self._set_state(HALF_OPEN)
+                circuit = self._snapshot()
+            allowed = self.state == CLOSED or (
+                self.state == HALF_OPEN and not self.trial_running
+            )
+            if allowed and self.state == HALF_OPEN:
+                self.trial_running = True
+        if circuit:
+            self._save(circuit)
+        if allowed:
+            return None
+        metrics.CIRCUIT_REJECTIONS.inc(host=self.name)
+        raise CircuitOpenError(
+            f"circuit of host '{self.name}' is {self.state} after {self.failures} "
+            f"failed connections, last error: '{self.last_error}'"
+        )
+
+    def success(self):
+        """Record a successful connection, closing the circuit."""
+        circuit = None
+        with self._lock:
+            if self.state != CLOSED or self.failures:
+                self.failures = 0
+                self._set_state(CLOSED)
+                circuit = self._snapshot()
+            self.trial_running = False
+        if circuit:
+            self._save(circuit)
+
+    def failure(self, error: Exception):
+        """Record a failed connection, opening the circuit at the threshold."""
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error)
+            if (
+                self.state == HALF_OPEN
+                or self.failures >= settings.CIRCUIT_FAILURE_THRESHOLD
+            ):
+                self.opened_at = time.monotonic()
+                self.opened_time = datetime.datetime.now()
+                self._set_state(OPEN)
+            self.trial_running = False
+            circuit = self._snapshot()
+        self._save(circuit)
+
+    def end_trial(self):
+        """Let another trial connection through, if one was running."""
+        with self._lock:
+            self.trial_running = False
+
+
+_lock = threading.Lock()
+_breakers: dict[int, CircuitBreaker] = {}
+
+
+def get_breaker(host: models.Host) -> CircuitBreaker:
+    """Get the circuit breaker of a host."""
+    with _lock:
+        breaker = _breakers.get(host.host_id)
+        if not breaker:
+            breaker = _breakers[host.host_id] = CircuitBreaker(
+                host.host_id, host.name or ""
+            )
+        return breaker
+
+
+@serialized_write
+def save_circuit(circuit: HostCircuit):
+    """Store the circuit state of a host."""
+    with SessionLocal() as db:
+        db.merge(circuit)
+        db.commit()
+
+
+def circuit_state(circuit: HostCircuit | None) -> dict:
+    """Get a stored circuit state, with when a trial connection is let through."""
+    if not circuit:
+        return {"state": CLOSED, "failures": 0, "last_error": "", "retry_in_sec": None}
+    retry_in = None
+    if circuit.state == OPEN and circuit.opened_at:
+        open_sec = (datetime.datetime.now() - circuit.opened_at).total_seconds()
+        retry_in = max(settings.CIRCUIT_OPEN_SEC - open_sec, 0)
+    return {
+        "state": circuit.state,
+        "failures": circuit.failures,
+        "last_error": circuit.last_error,
+        "retry_in_sec": retry_in,
+    }
+
+
+def get_states() -> dict[int, dict]:
+    """Get the stored circuit state per host id, of hosts that failed to connect."""
+    with SessionLocal() as db:
+        return {
+            circuit.host_id: circuit_state(circuit)
+            for circuit in db.query(HostCircuit).all()
+        }
+
+
+def get_state(host_id: int) -> dict:
+    """Get the stored circuit state of a host, closed if it never failed to connect."""
+    with SessionLocal() as db:
+        return circuit_state(db.get(HostCircuit, host_id))
+
+
+@contextmanager
+def guard(host: models.Host | None) -> Iterator[None]:
+    """Connect to a host in the block, failing fast while its circuit is open."""
+    if not host or not host.host_id:
+        yield None
+        return None
+    breaker = get_breaker(host)
+    breaker.before_connect()
+    try:
+        yield None
+    except Exception as exc:
+        breaker.failure(exc)
+        raise
+    else:
+        breaker.success()
+    finally:
+        breaker.end_trial()
@@ -0,0 +1,73 @@
+"""Run tasks once from the command line, without the API or the scheduler."""
+from __future__ import annotations
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import sys
+
+from filetransferautomation import migrations, settings, smtp_pool, tasks
+from filetransferautomation.database import engine
+
+EXIT_SUCCESS = 0
+EXIT_ERROR = 1
+EXIT_NOT_RUN = 3
+
+
+def run_tasks(task_ids: list[int], parallel: int = 1) -> dict[int, str | None]:
+    """Run tasks, some in parallel, getting the status of each run."""
+    if parallel <= 1:
+        return {task_id: tasks.run_task(task_id) for task_id in task_ids}
+    with ThreadPoolExecutor(parallel, thread_name_prefix="task") as executor:
+        return dict(zip(task_ids, executor.map(tasks.run_task, task_ids)))
+
+
+def exit_code(statuses: dict[int, str | None]) -> int:
+    """Get the exit code of task runs, an error outranks a task not run."""
+    if "error" in statuses.values():
+        return EXIT_ERROR
+    if None in statuses.values():
+        return EXIT_NOT_RUN
+    return EXIT_SUCCESS
+
+
+def get_arguments(args: list[str] | None = None) -> argparse.Namespace:
+    """Get CLI arguments."""
+    parser = argparse.ArgumentParser(
+        description="Run File Transfer Automation tasks once and exit, "
+        f"with exit code {EXIT_SUCCESS} when all tasks succeed, {EXIT_ERROR} "
+        f"when a task fails and {EXIT_NOT_RUN} when a task is missing or inactive.",
+    )
+    parser.add_argument("task_ids", type=int, nargs="+", help="ids of tasks to run")
+    parser.add_argument(
+        "-p",
+        "--parallel",
+        type=int,
+        default=1,
+        help="number of tasks to run at the same time, default 1",
+    )
+    return parser.parse_args(args)
+
+
+def main(args: list[str] | None = None) -> int:
+    """Run tasks and exit."""
+    arguments = get_arguments(args)
+    logging.basicConfig(
+        level=logging.DEBUG if settings.DEV_MODE else logging.INFO, stream=sys.stderr
+    )
+    logging.getLogger("smbprotocol").setLevel(logging.ERROR)
+    logging.getLogger("paramiko").setLevel(logging.ERROR)
+
+    migrations.upgrade(engine)
+    os.makedirs(settings.WORK_DIR, exist_ok=True)
+
+    statuses = run_tasks(arguments.task_ids, arguments.parallel)
+    smtp_pool.pool.close_all()
+    for task_id, status in statuses.items():
+        logging.info(f"Task id: {task_id}, status: {status or 'not run'}.")
+    return exit_code(statuses)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,122 @@
 """Database."""
-from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+from __future__ import annotations
 
-from filetransferautomation import settings
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import threading
+import time
+
+from sqlalchemy import Connection, create_engine, event
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from filetransferautomation import metrics, settings
 
 SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    # connect_args={"check_same_thread": False},
-    # echo=True,
-    pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20,
-)
+WRITER_THREAD_NAME = "db-writer"
+
+
+class TimedQueuePool(QueuePool):
+    """Queue pool recording how long checkouts wait for a connection."""
+
+    def _do_get(self):
+        """Get a connection from the pool."""
+        start_time = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.DB_SESSION_WAIT.observe(time.perf_counter() - start_time)
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Use WAL so readers don't block behind the writer."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_KB}")
+    cursor.execute(
+        f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_SEC * 1000)}"
+    )
+    cursor.close()
+
+
+database_url = make_url(SQLALCHEMY_DATABASE_URL)
+is_sqlite = database_url.get_backend_name() == "sqlite"
+is_sqlite_file = is_sqlite and database_url.database not in (None, "", ":memory:")
+
+if is_sqlite_file:
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        connect_args={
+            "check_same_thread": False,
+            "timeout": settings.SQLITE_BUSY_TIMEOUT_SEC,
+        },
+        poolclass=TimedQueuePool,
+        pool_size=10,
+        max_overflow=20,
+    )
+
+    event.listen(engine, "connect", set_sqlite_pragmas)
+
+else:
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        # echo=True,
+        poolclass=TimedQueuePool,
+        pool_pre_ping=True,
+        pool_size=10,
+        max_overflow=20,
+    )
+
+writer = None
+if is_sqlite_file and not settings.SQLITE_DISABLE_WRITER_THREAD:
+    writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix=WRITER_THREAD_NAME)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
+
+
+def upsert_add(db: Session | Connection, model, keys: dict, increments: dict):
+    """Insert a row, or add increments to the existing row with the same keys."""
+    table = model.__table__
+    bind = db.get_bind() if isinstance(db, Session) else db
+    dialect = bind.dialect.name
+    if dialect == "mysql":
+        stmt = mysql.insert(table).values(**keys, **increments)
+        stmt = stmt.on_duplicate_key_update(
+            {
+                name: table.c[name] + stmt.inserted[name]  # type: ignore
+                for name in increments
+            }
+        )
+    else:
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        stmt = insert(table).values(**keys, **increments)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={
+                name: table.c[name] + stmt.excluded[name]  # type: ignore
+                for name in increments
+            },
+        )
+    db.execute(stmt)
+
+
+def serialized_write(function):
+    """Run a database write on the single writer thread when using SQLite.
+
+    SQLite allows one writer at a time, queueing writes on one thread avoids
+    "database is locked" errors when many task threads log at once.
+    """
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not writer or threading.current_thread().name.startswith(WRITER_THREAD_NAME):
+            return function(*args, **kwargs)
+        return writer.submit(function, *args, **kwargs).result()
+
+    return wrapper
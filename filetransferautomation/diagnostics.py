@@ -0,0 +1,208 @@
+"""Stack sampling and memory diagnostics of a running process."""
+from __future__ import annotations
+
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from filetransferautomation import settings
+
+router = APIRouter()
+
+MAX_SAMPLE_SEC = 60
+GROUP_BY = ("filename", "lineno", "traceback")
+PLUGIN_DIRECTORY = os.path.join(os.path.dirname(__file__), "step_plugins")
+
+_runs_lock = threading.Lock()
+_thread_runs: dict[int, dict] = {}
+_snapshot: tracemalloc.Snapshot | None = None
+
+
+def set_thread_run(**run):
+    """Set task run info, like task_id, task_run_id and step_id, of this thread."""
+    with _runs_lock:
+        _thread_runs.setdefault(threading.get_ident(), {}).update(run)
+
+
+def clear_thread_run():
+    """Clear task run info of this thread."""
+    with _runs_lock:
+        _thread_runs.pop(threading.get_ident(), None)
+
+
+@contextmanager
+def thread_run(**run) -> Iterator[None]:
+    """Set task run info of this thread in the block, cleared even when it fails."""
+    set_thread_run(**run)
+    try:
+        yield None
+    finally:
+        clear_thread_run()
+
+
+def thread_runs() -> dict[int, dict]:
+    """Get task run info per thread ident."""
+    with _runs_lock:
+        return {ident: dict(run) for ident, run in _thread_runs.items()}
+
+
+def thread_label(ident: int, runs: dict[int, dict], names: dict[int, str]) -> str:
+    """Get root frame label of a thread, the task and step it runs if any."""
+    run = runs.get(ident)
+    if run:
+        return f"task_id={run.get('task_id')};step_id={run.get('step_id')}"
+    return f"thread={names.get(ident, ident)}"
+
+
+def collapse_stack(frame) -> list[str]:
+    """Get frames of a stack as module:function, outermost first."""
+    stack = []
+    while frame:
+        code = frame.f_code
+        module = os.path.splitext(os.path.basename(code.co_filename))[0]
+        stack.append(f"{module}:{code.co_name}")
+        frame = frame.f_back
+    return stack[::-1]
+
+
+def sample_stacks(
+    duration_sec: float, interval_sec: float, tasks_only: bool = False
+) -> Counter:
+    """Sample stacks of all threads, counted per collapsed stack."""
+    stacks: Counter = Counter()
+    own_ident = threading.get_ident()
+    end_time = time.monotonic() + duration_sec
+    while time.monotonic() < end_time:
+        runs = thread_runs()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident or (tasks_only and ident not in runs):
+                continue
+            stack = [thread_label(ident, runs, names)] + collapse_stack(frame)
+            stacks[";".join(stack)] += 1
+        time.sleep(interval_sec)
+    return stacks
+
+
+@router.get("/stacks", response_class=PlainTextResponse)
+def get_stacks(
+    seconds: float = 5,
+    interval_ms: float = Query(10, ge=1),
+    tasks_only: bool = False,
+) -> PlainTextResponse:
+    """Sample thread stacks, returned as collapsed stacks for flamegraph tools."""
+    if not 0 < seconds <= MAX_SAMPLE_SEC:
+        raise HTTPException(
+            status_code=400, detail=f"seconds must be between 0 and {MAX_SAMPLE_SEC}"
+        )
+    stacks = sample_stacks(seconds, interval_ms / 1000, tasks_only)
+    return PlainTextResponse(
+        "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+    )
+
+
+@router.get("/threads")
+def get_threads():
+    """List threads and the task runs they are running."""
+    runs = thread_runs()
+    return [
+        {
+            "ident": thread.ident,
+            "native_id": thread.native_id,
+            "name": thread.name,
+            **runs.get(thread.ident, {}),  # type: ignore
+        }
+        for thread in threading.enumerate()
+    ]
+
+
+def plugin_runs(traceback: tracemalloc.Traceback, runs: list[dict]) -> list[dict]:
+    """Get task runs running the step plugin that made an allocation."""
+    for frame in traceback:
+        if os.path.dirname(frame.filename) == PLUGIN_DIRECTORY:
+            module = os.path.splitext(os.path.basename(frame.filename))[0]
+            return [
+                run
+                for run in runs
+                if str(run.get("script", "")).startswith(f"{module}_")
+            ]
+    return []
+
+
+def statistic_to_dict(statistic, runs: list[dict]) -> dict:
+    """Get a tracemalloc statistic, attributed to running task steps."""
+    return {
+        "size": statistic.size,
+        "size_diff": getattr(statistic, "size_diff", None),
+        "count": statistic.count,
+        "count_diff": getattr(statistic, "count_diff", None),
+        "traceback": [
+            f"{frame.filename}:{frame.lineno}" for frame in statistic.traceback
+        ],
+        "task_runs": plugin_runs(statistic.traceback, runs),
+    }
+
+
+@router.post("/tracemalloc/start")
+def start_tracemalloc(frames: int = settings.TRACEMALLOC_FRAMES):
+    """Start tracing memory allocations."""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    return {"tracing": True, "frames": tracemalloc.get_traceback_limit()}
+
+
+@router.post("/tracemalloc/stop")
+def stop_tracemalloc():
+    """Stop tracing memory allocations and drop the saved snapshot."""
+    global _snapshot
+    tracemalloc.stop()
+    _snapshot = None
+    return {"tracing": False}
+
+
+def take_snapshot(group_by: str) -> tracemalloc.Snapshot:
+    """Take a snapshot, leaving out tracemalloc's own allocations."""
+    if group_by not in GROUP_BY:
+        raise HTTPException(
+            status_code=400, detail=f"group_by must be one of {', '.join(GROUP_BY)}"
+        )
+    if not tracemalloc.is_tracing():
+        raise HTTPException(status_code=409, detail="tracemalloc is not started")
+    return tracemalloc.take_snapshot().filter_traces(
+        (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        )
+    )
+
+
+@router.post("/tracemalloc/snapshot")
+def save_snapshot(limit: int = 20, group_by: str = "traceback"):
+    """Save a snapshot to diff against, and get its largest allocations."""
+    global _snapshot
+    _snapshot = take_snapshot(group_by)
+    runs = list(thread_runs().values())
+    return [
+        statistic_to_dict(statistic, runs)
+        for statistic in _snapshot.statistics(group_by)[:limit]
+    ]
+
+
+@router.get("/tracemalloc/diff")
+def diff_snapshot(limit: int = 20, group_by: str = "traceback"):
+    """Get the largest allocation changes since the saved snapshot."""
+    if not _snapshot:
+        raise HTTPException(status_code=409, detail="no snapshot saved")
+    runs = list(thread_runs().values())
+    return [
+        statistic_to_dict(statistic, runs)
+        for statistic in take_snapshot(group_by).compare_to(_snapshot, group_by)[:limit]
+    ]
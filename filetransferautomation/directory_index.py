@@ -0,0 +1,129 @@
+"""Cached directory listings with file metadata, sorted for paging."""
+from __future__ import annotations
+
+import base64
+from bisect import bisect_left, bisect_right
+import datetime
+import json
+import os
+import threading
+import time
+
+from filetransferautomation import settings
+from filetransferautomation.common import compare_filter
+
+SORT_KEYS = ("name", "size", "timestamp")
+
+
+def encode_cursor(key: tuple) -> str:
+    """Encode the sort key of the last file of a page as an opaque cursor."""
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Decode a cursor to a sort key, ValueError if it is malformed."""
+    try:
+        value, name = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception as exc:
+        raise ValueError("malformed cursor") from exc
+    return value, name
+
+
+class DirectoryListing:
+    """Files in a directory at one point in time, with lazily sorted views."""
+
+    def __init__(self, path: str, skip_prefix: str = ""):
+        """Scan directory."""
+        self.path = path
+        self.mtime_ns = os.stat(path).st_mtime_ns
+        self.scanned = time.monotonic()
+        self.files: list[tuple[str, int, float]] = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if skip_prefix and entry.name.startswith(skip_prefix):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                self.files.append((entry.name, stat.st_size, stat.st_mtime))
+        self._sorted: dict[str, tuple[list, list]] = {}
+        self._lock = threading.Lock()
+
+    def sorted(self, sort: str) -> tuple[list[tuple], list[tuple[str, int, float]]]:
+        """Get sort keys and files sorted ascending by a sort key, then name."""
+        with self._lock:
+            if sort not in self._sorted:
+                column = SORT_KEYS.index(sort)
+                files = sorted(self.files, key=lambda file: (file[column], file[0]))
+                keys = [(file[column], file[0]) for file in files]
+                self._sorted[sort] = (keys, files)
+            return self._sorted[sort]
+
+    def page(
+        self,
+        sort: str = "name",
+        descending: bool = False,
+        file_filter: str = "",
+        limit: int = 100,
+        after: tuple | None = None,
+    ) -> tuple[list[dict], tuple | None]:
+        """Get a page of files after a sort key, and the sort key of the last file."""
+        keys, files = self.sorted(sort)
+        if descending:
+            index = bisect_left(keys, after) - 1 if after else len(files) - 1
+            step = -1
+        else:
+            index = bisect_right(keys, after) if after else 0
+            step = 1
+
+        page: list[dict] = []
+        last_key = None
+        while 0 <= index < len(files):
+            name, size, mtime = files[index]
+            if not file_filter or compare_filter(name, file_filter):
+                if len(page) == limit:
+                    return page, last_key
+                last_key = keys[index]
+                page.append(
+                    {
+                        "name": name,
+                        "size": size,
+                        "timestamp": datetime.datetime.fromtimestamp(mtime),
+                    }
+                )
+            index += step
+        return page, None
+
+
+class DirectoryIndex:
+    """Keeps listings of directories, rescanned when the directory mtime changes."""
+
+    def __init__(self):
+        """Init."""
+        self._lock = threading.Lock()
+        self._listings: dict[str, DirectoryListing] = {}
+
+    def listing(self, path: str, skip_prefix: str = "") -> DirectoryListing:
+        """Get a listing of a directory, from cache if it is still current."""
+        with self._lock:
+            listing = self._listings.get(path)
+        if (
+            listing
+            and listing.mtime_ns == os.stat(path).st_mtime_ns
+            and time.monotonic() - listing.scanned < settings.FOLDER_INDEX_TTL_SEC
+        ):
+            return listing
+
+        listing = DirectoryListing(path, skip_prefix)
+        with self._lock:
+            if len(listing.files) >= settings.FOLDER_INDEX_MIN_FILES:
+                self._listings[path] = listing
+            else:
+                self._listings.pop(path, None)
+        return listing
+
+
+index = DirectoryIndex()
@@ -1,17 +1,27 @@
 """Folders."""
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import os
+from typing import BinaryIO
+import uuid
 
-from fastapi import APIRouter, HTTPException, UploadFile
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Form, HTTPException, Query, Request, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
 
-from filetransferautomation import models, settings
+from filetransferautomation import archive, directory_index, models, settings
+from filetransferautomation.common import compare_filter
 from filetransferautomation.database import SessionLocal
+from filetransferautomation.logs import NEXT_CURSOR_HEADER
 from filetransferautomation.shemas import Folder as FolderSchema
 
 router = APIRouter()
 
+UPLOAD_TEMP_PREFIX = ".upload-"
+CHUNK_SIZE = 1024 * 1024
+
 
 def load_folders():
     """Load folders from database."""
@@ -45,42 +55,299 @@ def get_folder(id: int) -> FolderSchema | None:
 
 
 @router.get("/{id}/files")
-def get_files(id: int):
-    """List files in folder."""
+def get_files(
+    id: int,
+    response: Response,
+    limit: int = 1000,
+    cursor: str = "",
+    sort: str = "name",
+    order: str = "asc",
+    file_filter: str = "",
+):
+    """List files in folder with size and timestamp, paged with X-Next-Cursor."""
     folder = get_folder(id)
     if not folder:
         raise HTTPException(status_code=404, detail="folder not found")
-    files = os.listdir(os.path.join(settings.FOLDERS_DIR, folder.name))
+    if sort not in directory_index.SORT_KEYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"sort must be one of {', '.join(directory_index.SORT_KEYS)}",
+        )
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be asc or desc")
+
+    listing = directory_index.index.listing(
+        os.path.join(settings.FOLDERS_DIR, folder.name), UPLOAD_TEMP_PREFIX
+    )
+    try:
+        files, last_key = listing.page(
+            sort,
+            order == "desc",
+            file_filter,
+            limit,
+            directory_index.decode_cursor(cursor) if cursor else None,
+        )
+    except (ValueError, TypeError) as exc:
+        raise HTTPException(status_code=400, detail="invalid cursor") from exc
+    if last_key:
+        response.headers[NEXT_CURSOR_HEADER] = directory_index.encode_cursor(last_key)
     return files
 
 
+def folder_size(path: str) -> int:
+    """Get total size of the files in a folder."""
+    with os.scandir(path) as entries:
+        return sum(entry.stat().st_size for entry in entries if entry.is_file())
+
+
+def upload_size(file: UploadFile) -> int:
+    """Get size of an uploaded file."""
+    if file.size is not None:
+        return file.size
+    size = file.file.seek(0, os.SEEK_END)
+    file.file.seek(0)
+    return size
+
+
+def check_quota(path: str, max_size: int | None, files: list[UploadFile]):
+    """Raise if the uploaded files don't fit in the folder quota."""
+    if max_size is None:
+        return None
+    replaced = 0
+    for file in files:
+        existing = os.path.join(path, str(file.filename))
+        if os.path.isfile(existing):
+            replaced += os.path.getsize(existing)
+    needed = folder_size(path) - replaced + sum(upload_size(file) for file in files)
+    if needed > max_size:
+        raise HTTPException(
+            status_code=413,
+            detail=f"folder quota exceeded, {needed} of {max_size} bytes",
+        )
+
+
+def save_file(path: str, file_data: BinaryIO, expected_sha256: str = "") -> dict:
+    """Copy file data in chunks to a temp file next to path, checking the checksum.
+
+    Gets the result with the temp_path, to be renamed to path by replace_files.
+    """
+    directory, filename = os.path.split(path)
+    temp_path = os.path.join(
+        directory, f"{UPLOAD_TEMP_PREFIX}{uuid.uuid4().hex}-{filename}"
+    )
+    sha256 = hashlib.sha256()
+    size = 0
+    try:
+        with open(temp_path, "wb") as new_file:
+            while chunk := file_data.read(CHUNK_SIZE):
+                new_file.write(chunk)
+                sha256.update(chunk)
+                size += len(chunk)
+        if expected_sha256 and sha256.hexdigest() != expected_sha256.lower():
+            raise HTTPException(
+                status_code=422, detail=f"checksum mismatch for '{filename}'"
+            )
+    except BaseException:
+        remove_files([temp_path])
+        raise
+    return {
+        "filename": filename,
+        "size": size,
+        "sha256": sha256.hexdigest(),
+        "temp_path": temp_path,
+    }
+
+
+def remove_files(paths: list[str]):
+    """Remove files, ignoring those already gone."""
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def replace_files(directory: str, results: list[dict]):
+    """Rename saved temp files to their filenames in a directory."""
+    for result in results:
+        os.replace(result.pop("temp_path"), os.path.join(directory, result["filename"]))
+
+
 @router.post("/{id}/uploadfiles")
-async def create_upload_files(id: int, files: list[UploadFile]):
-    """Upload files to a folder."""
-    folder = get_folder(id)
+async def create_upload_files(
+    id: int, files: list[UploadFile], sha256: list[str] = Form([])
+):
+    """Upload files to a folder, optionally verified by sha256 given per file.
+
+    Files are renamed into the folder only when all of them are saved and verified.
+    """
+    folder = await run_in_threadpool(get_folder, id)
     if not folder:
         raise HTTPException(status_code=404, detail="folder not found")
+    if sha256 and len(sha256) != len(files):
+        raise HTTPException(
+            status_code=422, detail="give one sha256 checksum per file, or none"
+        )
 
+    path = os.path.join(settings.FOLDERS_DIR, folder.name)
+    uploads = [
+        (file, sha256[index] if sha256 else "")
+        for index, file in enumerate(files)
+        if file.filename
+    ]
+    files = [file for file, _ in uploads]
     for file in files:
-        if file.filename:
-            with open(
-                os.path.join(settings.FOLDERS_DIR, folder.name, file.filename), "wb"
-            ) as new_file:
-                new_file.write(file.file.read())
+        file.filename = os.path.basename(str(file.filename))
+    await run_in_threadpool(check_quota, path, folder.max_size, files)
 
-    return {"filenames": [file.filename for file in files]}
+    semaphore = asyncio.Semaphore(settings.UPLOAD_PARALLEL_FILES)
+
+    async def upload(file: UploadFile, expected_sha256: str) -> dict:
+        async with semaphore:
+            return await run_in_threadpool(
+                save_file,
+                os.path.join(path, str(file.filename)),
+                file.file,
+                expected_sha256,
+            )
+
+    results = await asyncio.gather(
+        *(upload(file, expected_sha256) for file, expected_sha256 in uploads),
+        return_exceptions=True,
+    )
+    saved = [result for result in results if isinstance(result, dict)]
+    for result in results:
+        if isinstance(result, BaseException):
+            await run_in_threadpool(
+                remove_files, [saved_file["temp_path"] for saved_file in saved]
+            )
+            raise result
+    await run_in_threadpool(replace_files, path, saved)
+
+    return {"filenames": [file.filename for file in files], "files": saved}
+
+
+def file_etag(stat: os.stat_result) -> str:
+    """Get a strong ETag from file modification time and size."""
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def parse_range(range_header: str, size: int) -> tuple[int, int] | None:
+    """Get first and last byte of a single bytes range, None to send it all."""
+    unit, _, ranges = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in ranges:
+        return None
+    first, _, last = ranges.strip().partition("-")
+    try:
+        if not first:
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        raise HTTPException(
+            status_code=416,
+            detail="range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
+
+
+def read_range(path: str, start: int, end: int):
+    """Yield a byte range of a file in chunks."""
+    with open(path, "rb") as file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def folder_file_path(folder, filename: str) -> str:
+    """Get path to a file in a folder, 404 if it doesn't exist."""
+    path = os.path.join(settings.FOLDERS_DIR, folder.name, os.path.basename(filename))
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="file not found")
+    return path
 
 
 @router.get("/{id}/download/{filename}")
-async def download_file(id: int, filename: str):
-    """Download a file from folder."""
+def download_file(id: int, filename: str, request: Request):
+    """Download a file from folder, supporting Range, If-Range and ETag."""
     folder = get_folder(id)
     if not folder:
         raise HTTPException(status_code=404, detail="folder not found")
-    return FileResponse(
-        path=os.path.join(settings.FOLDERS_DIR, folder.name, filename),
-        filename=filename,
+    path = folder_file_path(folder, filename)
+    stat = os.stat(path)
+    etag = file_etag(stat)
+    headers = {"ETag": etag, "Accept-Ranges": "bytes"}
+
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    byte_range = None
+    if range_header and (not if_range or if_range == etag):
+        byte_range = parse_range(range_header, stat.st_size)
+    if not byte_range:
+        return FileResponse(
+            path=path,
+            filename=filename,
+            media_type="application/octet-stream",
+            headers=headers,
+            stat_result=stat,
+        )
+
+    start, end = byte_range
+    return StreamingResponse(
+        read_range(path, start, end),
+        status_code=206,
         media_type="application/octet-stream",
+        headers={
+            **headers,
+            "Content-Range": f"bytes {start}-{end}/{stat.st_size}",
+            "Content-Length": str(end - start + 1),
+            "Content-Disposition": f'attachment; filename="{filename}"',
+        },
+    )
+
+
+@router.get("/{id}/archive")
+def download_archive(
+    id: int,
+    archive_format: str = "zip",
+    file_filter: str = "*",
+    files: list[str] = Query([]),
+):
+    """Download files in a folder as an archive streamed while it is built."""
+    folder = get_folder(id)
+    if not folder:
+        raise HTTPException(status_code=404, detail="folder not found")
+    if archive_format not in archive.ARCHIVE_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"archive_format must be one of {', '.join(archive.ARCHIVE_FORMATS)}",
+        )
+
+    path = os.path.join(settings.FOLDERS_DIR, folder.name)
+    listing = directory_index.index.listing(path, UPLOAD_TEMP_PREFIX)
+    wanted = set(files)
+    names = [
+        name
+        for name, _, _ in listing.sorted("name")[1]
+        if compare_filter(name, file_filter) and (not wanted or name in wanted)
+    ]
+    return StreamingResponse(
+        archive.stream_archive(path, names, archive_format),
+        media_type=archive.ARCHIVE_FORMATS[archive_format],
+        headers={
+            "Content-Disposition": (
+                f'attachment; filename="{folder.name}.{archive_format}"'
+            )
+        },
     )
 
 
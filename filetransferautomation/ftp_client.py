@@ -5,8 +5,9 @@ from __future__ import annotations
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
-    from _typeshed import SupportsRead
+    from _typeshed import SupportsRead, SupportsWrite
 
+from collections.abc import Callable
 import ftplib
 from ftplib import FTP
 
@@ -57,11 +58,43 @@ class FTPClient:
             )
         return self._file_data
 
-    def send_file(self, filename: str, file_data: SupportsRead[bytes]) -> bool:
+    def download(
+        self,
+        filename: str,
+        to_file: SupportsWrite[bytes],
+        callback: Callable[[bytes], None] | None = None,
+    ):
+        """Download remote file into a file object, block by block."""
+
+        def write_block(data: bytes):
+            to_file.write(data)
+            if callback:
+                callback(data)
+
+        if self._connection:
+            self._connection.retrbinary(f"RETR {filename}", callback=write_block)
+
+    def size(self, filename: str) -> int | None:
+        """Get size of remote file, if the server supports it."""
+        if self._connection:
+            try:
+                return self._connection.size(filename)
+            except ftplib.all_errors:
+                return None
+        return None
+
+    def send_file(
+        self,
+        filename: str,
+        file_data: SupportsRead[bytes],
+        callback: Callable[[bytes], None] | None = None,
+    ) -> bool:
         """Upload file to remote."""
         if self._connection:
             try:
-                self._connection.storbinary(f"STOR {filename}", file_data)
+                self._connection.storbinary(
+                    f"STOR {filename}", file_data, callback=callback
+                )
             except ftplib.all_errors:
                 return False
             else:
@@ -0,0 +1,124 @@
+"""Per host limits of sessions and parallel transfers, shared by task runs."""
+from __future__ import annotations
+
+from collections import OrderedDict, deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+import threading
+import time
+
+from filetransferautomation import host_tuning, metrics, models, settings
+
+
+class FairSemaphore:
+    """Semaphore handing freed slots to waiting tasks in turn.
+
+    Waiters queue per task, a freed slot goes to the first waiter of the next task
+    in round robin order, so a task with many files can't starve the others.
+    """
+
+    def __init__(self, limit: int):
+        """Init."""
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+        self.limit = limit
+        self.in_use = 0
+        self._lock = threading.Lock()
+        self._waiting: OrderedDict[int, deque[threading.Event]] = OrderedDict()
+
+    @property
+    def waiting(self) -> int:
+        """Number of waiters."""
+        with self._lock:
+            return sum(len(waiters) for waiters in self._waiting.values())
+
+    def set_limit(self, limit: int):
+        """Change the limit, handing new slots to waiters at once."""
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+        with self._lock:
+            self.limit = limit
+            while self._waiting and self.in_use < self.limit:
+                self.in_use += 1
+                self._wake_next()
+
+    def acquire(self, task_id: int):
+        """Take a slot, waiting for the turn of the task when none is free."""
+        with self._lock:
+            if self.in_use < self.limit and not self._waiting:
+                self.in_use += 1
+                return None
+            event = threading.Event()
+            self._waiting.setdefault(task_id, deque()).append(event)
+        event.wait()
+
+    def release(self):
+        """Free a slot, or hand it over to the next waiting task."""
+        with self._lock:
+            if self._waiting and self.in_use <= self.limit:
+                self._wake_next()
+            else:
+                self.in_use -= 1
+
+    def _wake_next(self):
+        """Wake the first waiter of the next task, moving the task to the back."""
+        task_id, waiters = next(iter(self._waiting.items()))
+        waiters.popleft().set()
+        if waiters:
+            self._waiting.move_to_end(task_id)
+        else:
+            del self._waiting[task_id]
+
+
+_lock = threading.Lock()
+_semaphores: dict[tuple[str, int], FairSemaphore] = {}
+
+
+def get_semaphore(kind: str, host_id: int, limit: int) -> FairSemaphore:
+    """Get the semaphore of a kind of host slot, updated to the current limit."""
+    with _lock:
+        semaphore = _semaphores.get((kind, host_id))
+        if not semaphore:
+            semaphore = _semaphores[(kind, host_id)] = FairSemaphore(limit)
+    if semaphore.limit != limit:
+        semaphore.set_limit(limit)
+    return semaphore
+
+
+@contextmanager
+def slot(
+    kind: str, host: models.Host | None, task_id: int, limit: int | None
+) -> Iterator[None]:
+    """Hold a slot of a host, no limit when the host or a positive limit isn't set."""
+    if not host or not host.host_id or not limit or limit < 1:
+        yield None
+        return None
+    semaphore = get_semaphore(kind, host.host_id, limit)
+    labels = {"host": host.name or "", "kind": kind}
+    start = time.perf_counter()
+    metrics.HOST_SLOT_WAITERS.inc(**labels)
+    try:
+        semaphore.acquire(task_id)
+    finally:
+        metrics.HOST_SLOT_WAITERS.dec(**labels)
+    metrics.HOST_SLOT_WAIT.observe(time.perf_counter() - start, **labels)
+    try:
+        yield None
+    finally:
+        semaphore.release()
+
+
+def session(host: models.Host | None, task_id: int):
+    """Hold one of the max_sessions connections of a host."""
+    return slot("session", host, task_id, host.max_sessions if host else None)
+
+
+def transfer(host: models.Host | None, task_id: int):
+    """Hold one of the max_parallel_transfers file transfers of a host.
+
+    With auto tuning, the parallel transfers learned for the host are the limit.
+    """
+    limit = host.max_parallel_transfers if host else None
+    if settings.AUTOTUNE_TRANSFERS:
+        limit = host_tuning.get_concurrency(host)
+    return slot("transfer", host, task_id, limit)
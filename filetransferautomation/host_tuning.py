@@ -0,0 +1,167 @@
+"""Auto tuning of parallel transfers per host, additive increase multiplicative decrease."""
+from __future__ import annotations
+
+import datetime
+import logging
+import threading
+import time
+
+from filetransferautomation import metrics, models, settings
+from filetransferautomation.database import SessionLocal, serialized_write
+from filetransferautomation.models import HostTuning
+
+START_CONCURRENCY = 1
+DECREASE_FACTOR = 0.5
+THROUGHPUT_TOLERANCE = 0.1
+# Seconds after which a tuner takes over the tuning stored by other processes.
+REFRESH_SEC = 60
+
+
+class Tuner:
+    """Learns the parallel transfers of one host from finished file transfers.
+
+    Every AUTOTUNE_WINDOW_FILES files it estimates the host throughput as the mean
+    rate per file times the parallel transfers. Too many errors, or a throughput
+    that dropped since the last window, halve the parallel transfers, otherwise
+    one more is tried.
+    """
+
+    def __init__(self, concurrency: int, bytes_per_sec: float | None = None):
+        """Init."""
+        self.concurrency = concurrency
+        self.bytes_per_sec = bytes_per_sec
+        self.loaded_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.files = 0
+        self.errors = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def record(self, error: bool, size: int | None, duration_sec: float | None):
+        """Count a finished transfer, getting the new concurrency when it changed."""
+        with self._lock:
+            self.files += 1
+            if error:
+                self.errors += 1
+            elif size and duration_sec:
+                self.bytes += size
+                self.seconds += duration_sec
+            if self.files < settings.AUTOTUNE_WINDOW_FILES:
+                return None
+            return self._adjust()
+
+    def refresh(self, tuning: HostTuning):
+        """Continue from the tuning stored in the database."""
+        with self._lock:
+            self.concurrency = tuning.concurrency
+            self.bytes_per_sec = tuning.bytes_per_sec
+
+    def _adjust(self) -> int | None:
+        concurrency = self.concurrency
+        bytes_per_sec = self.bytes / self.seconds * concurrency if self.seconds else 0
+        if self.errors / self.files > settings.AUTOTUNE_MAX_ERROR_RATE or (
+            self.bytes_per_sec
+            and bytes_per_sec < self.bytes_per_sec * (1 - THROUGHPUT_TOLERANCE)
+        ):
+            self.concurrency = max(int(concurrency * DECREASE_FACTOR), 1)
+        else:
+            self.concurrency = min(concurrency + 1, settings.AUTOTUNE_MAX_TRANSFERS)
+        self.bytes_per_sec = bytes_per_sec
+        self._reset()
+        if self.concurrency == concurrency:
+            return None
+        return self.concurrency
+
+
+_lock = threading.Lock()
+_tuners: dict[int, Tuner] = {}
+
+
+def load_tuning(host_id: int) -> HostTuning | None:
+    """Get the tuning learned for a host in earlier runs."""
+    with SessionLocal() as db:
+        return db.get(HostTuning, host_id)
+
+
+@serialized_write
+def save_tuning(host_id: int, concurrency: int, bytes_per_sec: float | None):
+    """Store the tuning learned for a host."""
+    with SessionLocal() as db:
+        db.merge(
+            HostTuning(
+                host_id=host_id,
+                concurrency=concurrency,
+                bytes_per_sec=bytes_per_sec,
+                updated_at=datetime.datetime.now(),
+            )
+        )
+        db.commit()
+
+
+def get_tuner(host_id: int) -> Tuner:
+    """Get the tuner of a host, starting from the tuning stored in the database.
+
+    The stored tuning is read again every REFRESH_SEC, so processes sharing a
+    host continue from each other's tuning. It is read without holding the lock
+    of all tuners, so other hosts don't wait for the database.
+    """
+    with _lock:
+        tuner = _tuners.get(host_id)
+        if tuner and time.monotonic() - tuner.loaded_at < REFRESH_SEC:
+            return tuner
+        if tuner:
+            tuner.loaded_at = time.monotonic()
+    if tuner:
+        try:
+            tuning = load_tuning(host_id)
+        except Exception as exc:
+            logging.warning(
+                f"Failed to read tuning of host id {host_id}, message: '{exc}'."
+            )
+            return tuner
+        if tuning:
+            tuner.refresh(tuning)
+        return tuner
+    tuning = load_tuning(host_id)
+    with _lock:
+        tuner = _tuners.get(host_id)
+        if not tuner:
+            if tuning:
+                tuner = Tuner(tuning.concurrency, tuning.bytes_per_sec)
+            else:
+                tuner = Tuner(START_CONCURRENCY)
+            _tuners[host_id] = tuner
+        return tuner
+
+
+def get_concurrency(host: models.Host | None) -> int:
+    """Get the parallel transfers of a host, 1 when auto tuning is off."""
+    if not settings.AUTOTUNE_TRANSFERS or not host or not host.host_id:
+        return 1
+    concurrency = get_tuner(host.host_id).concurrency
+    if host.max_parallel_transfers:
+        return min(concurrency, host.max_parallel_transfers)
+    return concurrency
+
+
+def record(
+    host: models.Host | None,
+    status: str,
+    size: int | None = None,
+    duration_sec: float | None = None,
+):
+    """Feed a finished file transfer to the tuner of its host."""
+    if not settings.AUTOTUNE_TRANSFERS or not host or not host.host_id:
+        return None
+    if status not in metrics.FINAL_FILE_STATUSES:
+        return None
+    tuner = get_tuner(host.host_id)
+    concurrency = tuner.record(status == "error", size, duration_sec)
+    if concurrency is None:
+        return None
+    logging.info(f"Parallel transfers of host '{host.name}' tuned to {concurrency}.")
+    metrics.HOST_TRANSFER_CONCURRENCY.set(concurrency, host=host.name or "")
+    save_tuning(host.host_id, concurrency, tuner.bytes_per_sec)
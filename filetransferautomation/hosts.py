@@ -3,7 +3,7 @@ from __future__ import annotations
 
 from fastapi import APIRouter, HTTPException
 
-from filetransferautomation import models, shemas
+from filetransferautomation import circuit_breaker, models, shemas
 from filetransferautomation.database import SessionLocal
 from filetransferautomation.models import Host
 
@@ -22,15 +22,20 @@ def get_host(host_id: int) -> models.Host | None:
 
 
 @router.get("")
-async def get_hosts():
-    """Get all hosts."""
+def get_hosts():
+    """Get all hosts, with the circuit breaker state of each."""
+    circuits = circuit_breaker.get_states()
     with SessionLocal() as db:
         result = db.query(models.Host).all()
+        for db_host in result:
+            db_host.circuit = circuits.get(
+                db_host.host_id, circuit_breaker.circuit_state(None)
+            )
         return result
 
 
 @router.post("", status_code=201)
-async def add_host(host: shemas.AddHost):
+def add_host(host: shemas.AddHost):
     """Add a host."""
     with SessionLocal() as db:
         db_host = Host(**host.dict())
@@ -41,7 +46,7 @@ async def add_host(host: shemas.AddHost):
 
 
 @router.put("/{host_id}")
-async def update_host(host_id: int, host: shemas.AddHost):
+def update_host(host_id: int, host: shemas.AddHost):
     """Update a host."""
     with SessionLocal() as db:
         db_host = db.query(Host).filter(Host.host_id == host_id)
@@ -56,7 +61,7 @@ async def update_host(host_id: int, host: shemas.AddHost):
 
 
 @router.delete("/{host_id}", status_code=204)
-async def delete_host(host_id: int):
+def delete_host(host_id: int):
     """Delete a host."""
     with SessionLocal() as db:
         db_host = db.query(Host).filter(Host.host_id == host_id)
@@ -2,40 +2,140 @@
 from __future__ import annotations
 
 import asyncio
+import datetime
 import logging
 
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from scheduleplus.scheduler import Scheduler
 
-from filetransferautomation import schedules, tasks
+from filetransferautomation import (
+    leases,
+    metrics,
+    retention,
+    run_queue,
+    schedules,
+    settings,
+    tasks,
+)
 
 router = APIRouter()
 
 scheduler = Scheduler()
 
+SCHEDULER_LEASE = "scheduler"
+
+lease_expires: datetime.datetime | None = None
+jobs_loaded = False
+# Runs of all tasks are queued on the first load of the jobs in a process only,
+# not again when the scheduler lease is taken back or the jobs are reloaded.
+startup_runs_queued = False
+due_task_ids: list[int] = []
+
+
+def is_leader() -> bool:
+    """Check if this process holds the scheduler lease."""
+    return bool(lease_expires and lease_expires > datetime.datetime.now())
+
+
+def hold_scheduler_lease() -> bool:
+    """Take or renew the scheduler lease when half of it has run out."""
+    global lease_expires
+    renew_at = datetime.timedelta(seconds=settings.SCHEDULER_LEASE_SEC / 2)
+    if lease_expires and lease_expires - datetime.datetime.now() > renew_at:
+        return True
+    leader = is_leader()
+    lease_expires = leases.acquire(
+        SCHEDULER_LEASE, leases.PROCESS_ID, settings.SCHEDULER_LEASE_SEC
+    )
+    if lease_expires and not leader:
+        logging.info(f"Took the scheduler lease as '{leases.PROCESS_ID}'.")
+    if not lease_expires and leader:
+        logging.info("Lost the scheduler lease.")
+    return bool(lease_expires)
+
+
+def release_scheduler_lease():
+    """Give up the scheduler lease, letting another process take over at once."""
+    global lease_expires
+    if lease_expires:
+        leases.release(SCHEDULER_LEASE, leases.PROCESS_ID)
+        lease_expires = None
+    unload_jobs()
+
 
 async def run_schedules() -> None:
-    """Run all schedules."""
+    """Run all schedules while this process is the scheduler leader."""
     while True:
-        await asyncio.to_thread(scheduler.run_function_jobs)
+        try:
+            if await asyncio.to_thread(hold_scheduler_lease):
+                if not jobs_loaded:
+                    await load_jobs()
+                await asyncio.to_thread(run_due_jobs)
+            elif jobs_loaded:
+                unload_jobs()
+        except Exception as exc:
+            logging.error(f"Running schedules failed, message: '{exc}'.")
         await asyncio.sleep(1)
 
 
+def run_due_jobs():
+    """Run due jobs and record how late they fire."""
+    now = datetime.datetime.now()
+    for job in scheduler._jobs:
+        if job._func and job.next_run() <= now:
+            metrics.SCHEDULER_LAG.observe((now - job.next_run()).total_seconds())
+    scheduler.run_function_jobs()
+    # Runs stay due until they are committed to the queue, to retry on the next tick.
+    task_ids = due_task_ids[:]
+    run_queue.enqueue_many(task_ids)
+    del due_task_ids[: len(task_ids)]
+
+
+def queue_run(task_id: int):
+    """Collect a run of a due job, queued together with the others by run_due_jobs."""
+    due_task_ids.append(task_id)
+
+
+async def run_log_retention() -> None:
+    """Archive old log rows periodically, while this process is the scheduler leader."""
+    while True:
+        try:
+            if is_leader():
+                await asyncio.to_thread(retention.apply_retention)
+        except Exception as exc:
+            logging.error(f"Log retention failed, message: '{exc}'.")
+        await asyncio.sleep(settings.LOG_RETENTION_INTERVAL_SEC)
+
+
+def unload_jobs():
+    """Remove all jobs from the scheduler."""
+    global jobs_loaded
+    scheduler._next_job_id = 1
+    scheduler._jobs = []
+    jobs_loaded = False
+
+
 async def load_jobs():
-    """Load jobs in scheduler."""
+    """Load jobs in scheduler, queueing a run of each task on the first load."""
+    global jobs_loaded, startup_runs_queued
     logging.info("Loading jobs.")
-    tasks_data = await tasks.get_active_tasks()
+    tasks_data = await asyncio.to_thread(tasks.get_active_tasks)
     logging.info(f"{len(tasks_data)} jobs loaded.")
+    task_ids = []
     for task in tasks_data:
         if task.active:
             for schedule in task.schedules:
                 job = scheduler.cron(str(schedule.cron))
                 if job._id:
-                    await schedules.update_schedule_job_id(
-                        schedule.schedule_id, job._id
+                    await asyncio.to_thread(
+                        schedules.update_schedule_job_id, schedule.schedule_id, job._id
                     )
-                job.do_function(tasks.run_task_threaded, task.task_id)
-                tasks.run_task_threaded(task.task_id)
+                job.do_function(queue_run, task.task_id)
+                task_ids.append(task.task_id)
+    if not startup_runs_queued:
+        await asyncio.to_thread(run_queue.enqueue_many, task_ids)
+        startup_runs_queued = True
+    jobs_loaded = True
 
 
 @router.get("")
@@ -57,8 +157,11 @@ async def get_jobs():
 @router.get("/reload")
 async def reload_jobs():
     """Reload jobs."""
-    scheduler._next_job_id = 1
-    scheduler._jobs = []
+    if not is_leader():
+        raise HTTPException(
+            status_code=409, detail="jobs are loaded by another scheduler process"
+        )
+    unload_jobs()
     await load_jobs()
     return_data = []
     for job in scheduler._jobs:
@@ -0,0 +1,49 @@
+"""Leases in the database, electing one process at a time to do a job."""
+from __future__ import annotations
+
+import datetime
+import os
+import socket
+
+from sqlalchemy import delete, insert, or_, update
+from sqlalchemy.exc import IntegrityError
+
+from filetransferautomation.database import SessionLocal, serialized_write
+from filetransferautomation.models import Lease
+
+PROCESS_ID = f"{socket.gethostname()}-{os.getpid()}"
+
+
+@serialized_write
+def acquire(name: str, holder: str, ttl_sec: float) -> datetime.datetime | None:
+    """Take or renew a lease, getting when it expires, None if another holder has it."""
+    now = datetime.datetime.now()
+    expires_at = now + datetime.timedelta(seconds=ttl_sec)
+    with SessionLocal() as db:
+        result = db.execute(
+            update(Lease)
+            .where(
+                Lease.name == name, or_(Lease.holder == holder, Lease.expires_at < now)
+            )
+            .values(holder=holder, expires_at=expires_at)
+        )
+        if not result.rowcount:  # type: ignore
+            try:
+                db.execute(
+                    insert(Lease).values(
+                        name=name, holder=holder, expires_at=expires_at
+                    )
+                )
+            except IntegrityError:
+                db.rollback()
+                return None
+        db.commit()
+    return expires_at
+
+
+@serialized_write
+def release(name: str, holder: str):
+    """Give up a lease, if held."""
+    with SessionLocal() as db:
+        db.execute(delete(Lease).where(Lease.name == name, Lease.holder == holder))
+        db.commit()
@@ -1,19 +1,36 @@
 """Logs."""
+import asyncio
 import datetime
+import json
+import time
 from typing import Literal
 
-from fastapi import APIRouter
-from sqlalchemy import and_, func, or_
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import exists, func, select
 from sqlalchemy.orm import aliased
 
-from filetransferautomation.database import SessionLocal
+from filetransferautomation import progress, retention, settings, tracing
+from filetransferautomation.database import SessionLocal, serialized_write
 from filetransferautomation.human_bytes import HumanBytes
-from filetransferautomation.models import FileLog, Host, Step, StepLog, Task, TaskLog
+from filetransferautomation.models import (
+    FileLog,
+    Host,
+    Step,
+    StepLog,
+    Task,
+    TaskLog,
+    TaskLogDaily,
+)
 from filetransferautomation.shemas import File
+from filetransferautomation.status_counts import count_status_change
 
 router = APIRouter()
 
+TRANSFERRED_FILE_STATUSES = ("downloaded", "uploaded", "mailed")
 
+
+@serialized_write
 def add_file_log_entry(
     task_run_id: str,
     task_id: int,
@@ -46,6 +63,7 @@ def add_file_log_entry(
         db.commit()
 
 
+@serialized_write
 def add_task_log_entry(
     task_run_id: str,
     task_id: int,
@@ -59,6 +77,13 @@ def add_task_log_entry(
             db.query(TaskLog).filter(TaskLog.task_run_id == task_run_id).one_or_none()
         )
         if db_task_log:
+            count_status_change(
+                db,
+                task_run_id,
+                db_task_log.start_time.date(),
+                db_task_log.status,
+                status,
+            )
             db_task_log.end_time = timestamp
             db_task_log.status = status
             db_task_log.duration_sec = (
@@ -73,9 +98,11 @@ def add_task_log_entry(
             start_time=timestamp,
         )
         db.add(db_task_log)
+        count_status_change(db, task_run_id, timestamp.date(), None, status)
         db.commit()
 
 
+@serialized_write
 def add_step_log_entry(
     task_run_id: str,
     task_id: int,
@@ -110,38 +137,119 @@ def add_step_log_entry(
         db.commit()
 
 
-@router.get("/files")
-@router.get("/files/{task_run_id}")
-def get_files_log(limit: int = 30, task_run_id: str = ""):
-    """Get all file log entrys."""
+@serialized_write
+def abort_run_log(task_run_id: str, task_id: int):
+    """Set a task run and its running steps to error, after its worker died."""
+    add_task_log_entry(task_run_id, task_id, "error")
+    timestamp = datetime.datetime.now()
+    with SessionLocal() as db:
+        for db_step_log in db.scalars(
+            select(StepLog).where(
+                StepLog.task_run_id == task_run_id, StepLog.status == "running"
+            )
+        ):
+            db_step_log.end_time = timestamp
+            db_step_log.status = "error"
+            db_step_log.duration_sec = (
+                timestamp - db_step_log.start_time
+            ).total_seconds()
+        db.commit()
+
+
+def get_completed_steps(task_run_id: str) -> set[int]:
+    """Get the ids of the steps of a task run that succeeded."""
     with SessionLocal() as db:
-        tmp = (
-            db.query(func.max(FileLog.filelog_id))
-            .group_by(
-                FileLog.task_run_id,
-                FileLog.task_id,
-                FileLog.step_id,
-                FileLog.file_name,
+        return set(
+            db.scalars(
+                select(StepLog.step_id).where(
+                    StepLog.task_run_id == task_run_id, StepLog.status == "success"
+                )
             )
-            .order_by(FileLog.filelog_id.desc())
-            .limit(limit=limit)
-            .all()
         )
-        latest_file_ids = []
-        for row in tmp:
-            latest_file_ids.append(row[0])
-        db_file_log = (
-            db.query(FileLog, Task.name)
+
+
+def get_completed_files(task_run_id: str, step_id: int) -> set[str]:
+    """Get the files a step of a task run transferred, by their latest log entry."""
+    with SessionLocal() as db:
+        statuses = dict(
+            db.execute(
+                select(FileLog.file_name, FileLog.status)
+                .where(FileLog.task_run_id == task_run_id, FileLog.step_id == step_id)
+                .order_by(FileLog.filelog_id)
+            ).all()
+        )
+    return {
+        file_name
+        for file_name, status in statuses.items()
+        if status in TRANSFERRED_FILE_STATUSES
+    }
+
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+STREAM_KEEPALIVE_SEC = 15
+
+
+def set_next_cursor(response: Response, rows: list, limit: int, cursor_key):
+    """Drop the extra row fetched past limit and set the next page cursor header."""
+    if len(rows) > limit:
+        del rows[limit:]
+        response.headers[NEXT_CURSOR_HEADER] = str(cursor_key(rows[-1]))
+
+
+@router.get("/files")
+@router.get("/files/{task_run_id}")
+def get_files_log(
+    response: Response,
+    limit: int = Query(30, ge=1),
+    task_run_id: str = "",
+    cursor: int | None = None,
+    task_id: int | None = None,
+    host_id: int | None = None,
+    status: str = "",
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+):
+    """Get latest file log entry per file, paged with the X-Next-Cursor header."""
+    with SessionLocal() as db:
+        newer = aliased(FileLog)
+        query = (
+            select(FileLog, Task.name)
             .join(Task, Task.task_id == FileLog.task_id)
-            .where(FileLog.filelog_id.in_(latest_file_ids))
+            .where(
+                ~exists().where(
+                    newer.task_run_id == FileLog.task_run_id,
+                    newer.step_id == FileLog.step_id,
+                    newer.file_name == FileLog.file_name,
+                    newer.filelog_id > FileLog.filelog_id,
+                )
+            )
         )
         if task_run_id:
-            db_file_log = db_file_log.where(
-                FileLog.task_run_id == task_run_id
-            ).order_by(FileLog.filelog_id.asc())
+            query = query.where(FileLog.task_run_id == task_run_id).order_by(
+                FileLog.filelog_id.asc()
+            )
+            if cursor:
+                query = query.where(FileLog.filelog_id > cursor)
         else:
-            db_file_log = db_file_log.order_by(FileLog.filelog_id.desc())
-        db_file_log = db_file_log.all()
+            query = query.order_by(FileLog.filelog_id.desc())
+            if cursor:
+                query = query.where(FileLog.filelog_id < cursor)
+        if task_id:
+            query = query.where(FileLog.task_id == task_id)
+        if host_id:
+            query = query.where(
+                FileLog.step_id.in_(select(Step.step_id).where(Step.host_id == host_id))
+            )
+        if status:
+            query = query.where(FileLog.status == status)
+        if start:
+            query = query.where(FileLog.timestamp >= start)
+        if end:
+            query = query.where(FileLog.timestamp < end)
+        db_file_log = db.execute(query.limit(limit + 1)).all()
+        set_next_cursor(
+            response, db_file_log, limit, lambda row: row.FileLog.filelog_id
+        )
         return_data = []
         for row in db_file_log:
             tmp = dict(row._mapping.items())
@@ -208,55 +316,182 @@ def get_steps_log(limit: int = 30, task_run_id: str = ""):
 
 
 @router.get("/tasks")
-def get_tasks_log(limit: int = 30, status: str = ""):
-    """Get all tasks log entrys."""
+def get_tasks_log(
+    response: Response,
+    limit: int = Query(30, ge=1),
+    status: str = "",
+    cursor: int | None = None,
+    task_id: int | None = None,
+    host_id: int | None = None,
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+):
+    """Get task runs with transferred files, paged with the X-Next-Cursor header."""
     with SessionLocal() as db:
-        filelog1 = aliased(FileLog)
-        filelog2 = aliased(FileLog)
-        db_task_log = (
-            db.query(
+        downloaded_files = (
+            select(func.count(FileLog.filelog_id))
+            .where(
+                FileLog.task_run_id == TaskLog.task_run_id,
+                FileLog.status == "downloaded",
+            )
+            .scalar_subquery()
+        )
+        uploaded_files = (
+            select(func.count(FileLog.filelog_id))
+            .where(
+                FileLog.task_run_id == TaskLog.task_run_id,
+                FileLog.status.in_(("uploaded", "mailed")),
+            )
+            .scalar_subquery()
+        )
+        query = (
+            select(
+                TaskLog.joblog_id,
                 TaskLog.task_run_id,
                 TaskLog.duration_sec,
                 TaskLog.start_time,
                 TaskLog.end_time,
                 TaskLog.status,
                 Task.name,
-                func.count(filelog1.filelog_id.distinct()).label("downloaded_files"),
-                func.count(filelog2.filelog_id.distinct()).label("uploaded_files"),
+                downloaded_files.label("downloaded_files"),
+                uploaded_files.label("uploaded_files"),
             )
             .join(Task, Task.task_id == TaskLog.task_id, isouter=True)
-            .join(
-                filelog1,
-                and_(
-                    filelog1.task_run_id == TaskLog.task_run_id,
-                    filelog1.status == "downloaded",
-                ),
-                isouter=True,
-            )
-            .join(
-                filelog2,
-                and_(
-                    filelog2.task_run_id == TaskLog.task_run_id,
-                    or_(
-                        filelog2.status == "uploaded",
-                        filelog2.status == "mailed",
-                    ),
-                ),
-                isouter=True,
-            )
             .where(
-                or_(filelog1.task_run_id.isnot(None), filelog2.task_run_id.isnot(None))
+                exists().where(
+                    FileLog.task_run_id == TaskLog.task_run_id,
+                    FileLog.status.in_(("downloaded", "uploaded", "mailed")),
+                )
             )
             .order_by(TaskLog.joblog_id.desc())
-            .group_by(TaskLog.task_run_id)
         )
+        if cursor:
+            query = query.where(TaskLog.joblog_id < cursor)
         if status:
-            db_task_log = db_task_log.where(TaskLog.status == status)
-        db_task_log = db_task_log.limit(limit=limit).all()
+            query = query.where(TaskLog.status == status)
+        if task_id:
+            query = query.where(TaskLog.task_id == task_id)
+        if host_id:
+            query = query.where(
+                TaskLog.task_id.in_(select(Step.task_id).where(Step.host_id == host_id))
+            )
+        if start:
+            query = query.where(TaskLog.start_time >= start)
+        if end:
+            query = query.where(TaskLog.start_time < end)
+        db_task_log = db.execute(query.limit(limit + 1)).all()
+        set_next_cursor(response, db_task_log, limit, lambda row: row.joblog_id)
         return_data = []
         for row in db_task_log:
             tmp = dict(row._mapping.items())
-            tmp["duration"] = human_seconds(tmp["duration_sec"])
+            tmp["duration"] = ""
+            if tmp["duration_sec"]:
+                tmp["duration"] = human_seconds(tmp["duration_sec"])
             del tmp["duration_sec"]
+            del tmp["joblog_id"]
             return_data.append(tmp)
         return return_data
+
+
+@router.get("/daily")
+def get_daily_log(
+    task_id: int | None = None,
+    start: datetime.date | None = None,
+    end: datetime.date | None = None,
+):
+    """Get task runs rolled up per day and task by log retention."""
+    with SessionLocal() as db:
+        query = select(TaskLogDaily).order_by(
+            TaskLogDaily.day.desc(), TaskLogDaily.task_id
+        )
+        if task_id:
+            query = query.where(TaskLogDaily.task_id == task_id)
+        if start:
+            query = query.where(TaskLogDaily.day >= start)
+        if end:
+            query = query.where(TaskLogDaily.day < end)
+        return db.execute(query).scalars().all()
+
+
+@router.get("/archive")
+def get_archives():
+    """List archived log files."""
+    return retention.list_archives()
+
+
+@router.get("/archive/{table}/{day}")
+def get_archive(
+    response: Response,
+    table: str,
+    day: datetime.date,
+    limit: int = Query(1000, ge=1),
+    cursor: int = Query(0, ge=0),
+    task_run_id: str = "",
+    task_id: int | None = None,
+    status: str = "",
+):
+    """Get archived log rows, paged with the X-Next-Cursor header."""
+    if table not in retention.ARCHIVE_TABLES:
+        raise HTTPException(status_code=404, detail="archive table not found")
+    if not retention.archive_files(table, day):
+        raise HTTPException(status_code=404, detail="archive not found")
+
+    rows = []
+    for line_number, row in enumerate(retention.read_archive(table, day), start=1):
+        if line_number <= cursor:
+            continue
+        if task_run_id and row["task_run_id"] != task_run_id:
+            continue
+        if task_id and row["task_id"] != task_id:
+            continue
+        if status and row["status"] != status:
+            continue
+        if len(rows) == limit:
+            response.headers[NEXT_CURSOR_HEADER] = str(line_number - 1)
+            break
+        rows.append(row)
+    return rows
+
+
+@router.get("/traces")
+def get_traces():
+    """List task runs with a trace, oldest first."""
+    return tracing.tracer.traced_runs()
+
+
+@router.get("/traces/{task_run_id}")
+def get_trace(task_run_id: str):
+    """Get the timeline of a traced task run in Chrome Trace Event format."""
+    trace = tracing.tracer.chrome_trace(task_run_id)
+    if not trace:
+        raise HTTPException(status_code=404, detail="trace not found")
+    return JSONResponse(
+        trace,
+        headers={
+            "Content-Disposition": f'attachment; filename="{task_run_id}.trace.json"'
+        },
+    )
+
+
+@router.get("/stream")
+async def stream_progress(request: Request, task_run_id: list[str] = Query([])):
+    """Stream live transfer progress of running tasks as server-sent events."""
+
+    async def events():
+        version = 0
+        last_sent = time.monotonic()
+        while not await request.is_disconnected():
+            version, changes = progress.reporter.changes(version, task_run_id)
+            for change in changes:
+                yield f"event: progress\ndata: {json.dumps(change)}\n\n"
+                last_sent = time.monotonic()
+            if time.monotonic() - last_sent > STREAM_KEEPALIVE_SEC:
+                yield ": keepalive\n\n"
+                last_sent = time.monotonic()
+            await asyncio.sleep(settings.PROGRESS_STREAM_INTERVAL_SEC)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
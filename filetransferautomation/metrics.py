@@ -0,0 +1,333 @@
+"""In-process metrics, exposed in Prometheus text format."""
+from __future__ import annotations
+
+from collections.abc import Callable
+import math
+import threading
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+router = APIRouter()
+
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+SIZE_BUCKETS = tuple(float(10**exponent) for exponent in range(3, 11))
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+
+REGISTRY: list[Metric] = []
+
+
+def escape_label(value) -> str:
+    """Escape a label value."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: dict) -> str:
+    """Format labels as {name="value",...}."""
+    if not labels:
+        return ""
+    return (
+        "{"
+        + ",".join(f'{name}="{escape_label(value)}"' for name, value in labels.items())
+        + "}"
+    )
+
+
+def format_value(value: float) -> str:
+    """Format a sample value."""
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value))
+
+
+class Metric:
+    """Base metric with labels."""
+
+    type = ""
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = ()):
+        """Init and register metric."""
+        self.name = name
+        self.description = description
+        self.label_names = labels
+        self._lock = threading.Lock()
+        self._values: dict[tuple, object] = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        """Get label values in declared order."""
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def _labels(self, key: tuple) -> dict:
+        """Get labels from label values."""
+        return dict(zip(self.label_names, key))
+
+    def samples(self) -> list[tuple[str, dict, float]]:
+        """Get samples as (name, labels, value)."""
+        with self._lock:
+            return [
+                (self.name, self._labels(key), float(value))  # type: ignore
+                for key, value in self._values.items()
+            ]
+
+    def render(self) -> str:
+        """Render metric in Prometheus text format."""
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Counter that only goes up."""
+
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        """Increase counter."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount  # type: ignore
+
+    def value(self, **labels) -> float:
+        """Get current value."""
+        with self._lock:
+            return self._values.get(self._key(labels), 0)  # type: ignore
+
+
+class Gauge(Metric):
+    """Gauge that can go up and down, or be read from a function."""
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: tuple[str, ...] = (),
+        function: Callable[[], float] | None = None,
+    ):
+        """Init gauge."""
+        super().__init__(name, description, labels)
+        self.function = function
+
+    def set(self, value: float, **labels):
+        """Set gauge value."""
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        """Increase gauge."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount  # type: ignore
+
+    def dec(self, amount: float = 1, **labels):
+        """Decrease gauge."""
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        """Get current value."""
+        with self._lock:
+            return self._values.get(self._key(labels), 0)  # type: ignore
+
+    def samples(self) -> list[tuple[str, dict, float]]:
+        """Get samples, calling the gauge function if set."""
+        if self.function:
+            return [(self.name, {}, float(self.function()))]
+        return super().samples()
+
+
+class Histogram(Metric):
+    """Histogram with cumulative buckets."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DURATION_BUCKETS,
+    ):
+        """Init histogram."""
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        """Add an observation."""
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(  # type: ignore
+                key, ([0] * len(self.buckets), 0.0)
+            )
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self) -> list[tuple[str, dict, float]]:
+        """Get bucket, sum and count samples."""
+        samples = []
+        with self._lock:
+            values = [
+                (key, list(counts), total)
+                for key, (counts, total) in self._values.items()  # type: ignore
+            ]
+        for key, counts, total in values:
+            labels = self._labels(key)
+            for bound, count in zip(self.buckets, counts):
+                samples.append(
+                    (
+                        f"{self.name}_bucket",
+                        {**labels, "le": format_value(bound)},
+                        count,
+                    )
+                )
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, counts[-1]))
+        return samples
+
+
+def render() -> str:
+    """Render all registered metrics."""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+TRANSFER_DURATION = Histogram(
+    "fta_transfer_duration_seconds",
+    "Time to transfer a file.",
+    ("plugin", "host"),
+)
+TRANSFER_SIZE = Histogram(
+    "fta_transfer_size_bytes",
+    "Size of transferred files.",
+    ("plugin", "host"),
+    SIZE_BUCKETS,
+)
+TRANSFERRED_BYTES = Counter(
+    "fta_transferred_bytes_total",
+    "Bytes transferred.",
+    ("plugin", "host"),
+)
+TRANSFERRED_FILES = Counter(
+    "fta_transferred_files_total",
+    "Files handled by plugins per final status.",
+    ("plugin", "host", "status"),
+)
+STEP_DURATION = Histogram(
+    "fta_step_duration_seconds",
+    "Time to run a task step.",
+    ("script", "status"),
+)
+TASK_RUNS = Counter(
+    "fta_task_runs_total",
+    "Finished task runs.",
+    ("status",),
+)
+TASK_RUNS_IN_PROGRESS = Gauge(
+    "fta_task_runs_in_progress",
+    "Task runs dispatched and not finished.",
+)
+
+
+def queued_runs() -> float:
+    """Count task runs waiting in the run queue, NaN when the database fails."""
+    # Imported here, as the database module records metrics itself.
+    from filetransferautomation import run_queue
+
+    try:
+        return run_queue.count_queued()
+    except Exception:
+        return math.nan
+
+
+TASK_QUEUE_DEPTH = Gauge(
+    "fta_task_queue_depth",
+    "Task runs queued in the database and not claimed by a worker yet.",
+    function=queued_runs,
+)
+ACTIVE_THREADS = Gauge(
+    "fta_active_threads",
+    "Threads alive in the process.",
+    function=threading.active_count,
+)
+DB_SESSION_WAIT = Histogram(
+    "fta_db_connection_wait_seconds",
+    "Time waiting for a database connection from the pool.",
+    buckets=WAIT_BUCKETS,
+)
+SCHEDULER_LAG = Histogram(
+    "fta_scheduler_lag_seconds",
+    "Actual minus planned fire time of scheduled jobs.",
+    buckets=WAIT_BUCKETS,
+)
+HOST_SLOT_WAIT = Histogram(
+    "fta_host_slot_wait_seconds",
+    "Time waiting for a session or transfer slot of a host.",
+    ("host", "kind"),
+    WAIT_BUCKETS,
+)
+HOST_SLOT_WAITERS = Gauge(
+    "fta_host_slot_waiters",
+    "Task runs waiting for a session or transfer slot of a host.",
+    ("host", "kind"),
+)
+SHAPED_BYTES = Counter(
+    "fta_shaped_bytes_total",
+    "Bytes passed through bandwidth shaping, as they are transferred.",
+    ("host", "task", "priority"),
+)
+BANDWIDTH_WAIT = Counter(
+    "fta_bandwidth_wait_seconds_total",
+    "Time transfers were held back by bandwidth limits.",
+    ("host", "task", "priority"),
+)
+HOST_TRANSFER_CONCURRENCY = Gauge(
+    "fta_host_transfer_concurrency",
+    "Parallel transfers of a host learned by auto tuning.",
+    ("host",),
+)
+HOST_CIRCUIT_STATE = Gauge(
+    "fta_host_circuit_state",
+    "Circuit breaker state of a host, 0 closed, 1 half open, 2 open.",
+    ("host",),
+)
+CIRCUIT_REJECTIONS = Counter(
+    "fta_circuit_rejections_total",
+    "Connections to a host failed fast because its circuit was open.",
+    ("host",),
+)
+
+FINAL_FILE_STATUSES = ("downloaded", "uploaded", "mailed", "error")
+
+
+def record_file(
+    plugin: str,
+    host: str,
+    status: str,
+    size: int | None = None,
+    duration_sec: float | None = None,
+):
+    """Record metrics for a file log entry."""
+    if status not in FINAL_FILE_STATUSES:
+        return None
+    TRANSFERRED_FILES.inc(plugin=plugin, host=host, status=status)
+    if status == "error":
+        return None
+    if size is not None:
+        TRANSFER_SIZE.observe(size, plugin=plugin, host=host)
+        TRANSFERRED_BYTES.inc(size, plugin=plugin, host=host)
+    if duration_sec is not None:
+        TRANSFER_DURATION.observe(duration_sec, plugin=plugin, host=host)
+
+
+@router.get("", response_class=PlainTextResponse)
+def get_metrics():
+    """Get metrics in Prometheus text format."""
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,130 @@
+"""Versioned database schema migrations."""
+from __future__ import annotations
+
+from collections.abc import Callable
+import datetime
+import logging
+
+from sqlalchemy import Connection, Engine, func, inspect, select
+
+from filetransferautomation import models
+from filetransferautomation.models import SchemaVersion
+from filetransferautomation.status_counts import rebuild_status_counts
+
+MIGRATIONS: list[tuple[int, str, Callable[[Connection], None]]] = []
+
+
+def migration(version: int, description: str):
+    """Register a migration, versions must be applied in ascending order."""
+
+    def decorator(function: Callable[[Connection], None]):
+        MIGRATIONS.append((version, description, function))
+        MIGRATIONS.sort(key=lambda item: item[0])
+        return function
+
+    return decorator
+
+
+def create_index(connection: Connection, model: type[models.Base], name: str):
+    """Create an index declared on a model if it doesn't exist."""
+    table = model.__table__
+    for index in table.indexes:  # type: ignore
+        if index.name == name:
+            index.create(connection, checkfirst=True)
+            return None
+    raise ValueError(f"Index '{name}' is not declared on table '{table.name}'.")
+
+
+def add_column(connection: Connection, model: type[models.Base], name: str):
+    """Add a column declared on a model if it doesn't exist."""
+    table = model.__table__
+    existing = [column["name"] for column in inspect(connection).get_columns(table.name)]
+    if name in existing:
+        return None
+    column = table.columns[name]  # type: ignore
+    column_type = column.type.compile(dialect=connection.dialect)
+    connection.exec_driver_sql(
+        f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+    )
+
+
+def get_schema_version(connection: Connection) -> int:
+    """Get the latest applied schema version."""
+    return connection.scalar(select(func.max(SchemaVersion.version))) or 0
+
+
+def upgrade(engine: Engine):
+    """Create missing tables and apply all pending migrations."""
+    models.Base.metadata.create_all(bind=engine)
+
+    with engine.connect() as connection:
+        current_version = get_schema_version(connection)
+
+    for version, description, function in MIGRATIONS:
+        if version <= current_version:
+            continue
+        logging.info(f"Applying database migration {version}, '{description}'.")
+        with engine.begin() as connection:
+            function(connection)
+            connection.execute(
+                SchemaVersion.__table__.insert().values(  # type: ignore
+                    version=version,
+                    description=description,
+                    applied_at=datetime.datetime.now(),
+                )
+            )
+        current_version = version
+    logging.info(f"Database schema is at version {current_version}.")
+
+
+@migration(1, "Add indexes on log table lookup and join columns.")
+def add_log_indexes(connection: Connection):
+    """Add indexes used by status updates and log queries."""
+    create_index(connection, models.FileLog, "ix_file_log_task_run_id_status")
+    create_index(connection, models.TaskLog, "ix_task_log_task_run_id")
+    create_index(connection, models.TaskLog, "ix_task_log_status")
+    create_index(connection, models.StepLog, "ix_step_log_task_run_id_step_id")
+
+
+@migration(2, "Materialize task run status counters.")
+def add_status_counts(connection: Connection):
+    """Fill the status counters from existing task runs."""
+    rebuild_status_counts(connection)
+
+
+@migration(3, "Add indexes for log paging and filters.")
+def add_log_paging_indexes(connection: Connection):
+    """Add indexes used to find the latest entry per file and filter on time."""
+    create_index(
+        connection, models.FileLog, "ix_file_log_task_run_id_step_id_file_name"
+    )
+    create_index(connection, models.FileLog, "ix_file_log_timestamp")
+    create_index(connection, models.TaskLog, "ix_task_log_start_time")
+
+
+@migration(4, "Add folder size quota.")
+def add_folder_max_size(connection: Connection):
+    """Add max_size, the quota in bytes of a folder."""
+    add_column(connection, models.Folder, "max_size")
+
+
+@migration(5, "Add leases and heartbeats of queued task runs.")
+def add_run_queue_leases(connection: Connection):
+    """Add the columns used to find and resume runs of workers that died."""
+    for name in ("task_run_id", "attempts", "heartbeat_at", "lease_expires_at"):
+        add_column(connection, models.RunQueue, name)
+
+
+@migration(6, "Add host session and transfer limits.")
+def add_host_limits(connection: Connection):
+    """Add max_sessions and max_parallel_transfers of a host."""
+    add_column(connection, models.Host, "max_sessions")
+    add_column(connection, models.Host, "max_parallel_transfers")
+
+
+@migration(7, "Add bandwidth limits and task priority.")
+def add_bandwidth_limits(connection: Connection):
+    """Add max_bytes_per_sec of hosts and tasks, and the priority of tasks."""
+    add_column(connection, models.Host, "max_bytes_per_sec")
+    add_column(connection, models.Task, "max_bytes_per_sec")
+    add_column(connection, models.Task, "priority")
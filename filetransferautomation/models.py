@@ -4,7 +4,7 @@ from __future__ import annotations
 import datetime
 from typing import Literal
 
-from sqlalchemy import BigInteger, DateTime, Float, Integer, String, Text
+from sqlalchemy import BigInteger, Date, DateTime, Float, Index, Integer, String, Text
 from sqlalchemy.orm import Mapped, mapped_column
 
 from .database import Base
@@ -14,6 +14,16 @@ class FileLog(Base):
     """Table file log model."""
 
     __tablename__ = "file_log"
+    __table_args__ = (
+        Index("ix_file_log_task_run_id_status", "task_run_id", "status"),
+        Index(
+            "ix_file_log_task_run_id_step_id_file_name",
+            "task_run_id",
+            "step_id",
+            "file_name",
+        ),
+        Index("ix_file_log_timestamp", "timestamp"),
+    )
 
     filelog_id: Mapped[int] = mapped_column(
         Integer, primary_key=True, index=True, unique=True, autoincrement=True
@@ -35,6 +45,11 @@ class TaskLog(Base):
     """Table task log model."""
 
     __tablename__ = "task_log"
+    __table_args__ = (
+        Index("ix_task_log_task_run_id", "task_run_id"),
+        Index("ix_task_log_status", "status"),
+        Index("ix_task_log_start_time", "start_time"),
+    )
 
     joblog_id: Mapped[int] = mapped_column(
         Integer, primary_key=True, index=True, unique=True, autoincrement=True
@@ -55,6 +70,9 @@ class StepLog(Base):
     """Table task log model."""
 
     __tablename__ = "step_log"
+    __table_args__ = (
+        Index("ix_step_log_task_run_id_step_id", "task_run_id", "step_id"),
+    )
 
     steplog_id: Mapped[int] = mapped_column(
         Integer, primary_key=True, index=True, unique=True, autoincrement=True
@@ -72,6 +90,31 @@ class StepLog(Base):
     duration_sec: Mapped[float | None] = mapped_column(Float, default=None)
 
 
+class TaskStatusCount(Base):
+    """Table task run status counters per day model."""
+
+    __tablename__ = "task_status_count"
+
+    day: Mapped[datetime.date] = mapped_column(Date, primary_key=True)
+    status: Mapped[str] = mapped_column(String(30), primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class TaskLogDaily(Base):
+    """Table task runs rolled up per day and task model."""
+
+    __tablename__ = "task_log_daily"
+
+    day: Mapped[datetime.date] = mapped_column(Date, primary_key=True)
+    task_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    runs: Mapped[int] = mapped_column(Integer, default=0)
+    success_runs: Mapped[int] = mapped_column(Integer, default=0)
+    error_runs: Mapped[int] = mapped_column(Integer, default=0)
+    duration_sec: Mapped[float] = mapped_column(Float, default=0)
+    files: Mapped[int] = mapped_column(Integer, default=0)
+    size: Mapped[int] = mapped_column(BigInteger, default=0)
+
+
 class Schedule(Base):
     """Table schedule model."""
 
@@ -97,6 +140,10 @@ class Task(Base):
     name: Mapped[str] = mapped_column(String(100))
     description: Mapped[str] = mapped_column(String(255))
     active: Mapped[int] = mapped_column(Integer)
+    priority: Mapped[
+        Literal["high"] | Literal["normal"] | Literal["low"] | None
+    ] = mapped_column(String(10), default=None)
+    max_bytes_per_sec: Mapped[int | None] = mapped_column(Integer, default=None)
 
 
 class Step(Base):
@@ -147,6 +194,9 @@ class Host(Base):
     username: Mapped[str | None] = mapped_column(String(100), default=None)
     password: Mapped[str | None] = mapped_column(String(100), default=None)
     description: Mapped[str | None] = mapped_column(String(255), default=None)
+    max_sessions: Mapped[int | None] = mapped_column(Integer, default=None)
+    max_parallel_transfers: Mapped[int | None] = mapped_column(Integer, default=None)
+    max_bytes_per_sec: Mapped[int | None] = mapped_column(Integer, default=None)
 
 
 class Folder(Base):
@@ -159,3 +209,82 @@ class Folder(Base):
     )
     name: Mapped[str] = mapped_column(String(100))
     description: Mapped[str | None] = mapped_column(String(255), default=None)
+    max_size: Mapped[int | None] = mapped_column(BigInteger, default=None)
+
+
+class RunQueue(Base):
+    """Table queued task runs model."""
+
+    __tablename__ = "run_queue"
+    __table_args__ = (Index("ix_run_queue_status_run_id", "status", "run_id"),)
+
+    run_id: Mapped[int] = mapped_column(
+        Integer, primary_key=True, index=True, unique=True, autoincrement=True
+    )
+    task_id: Mapped[int] = mapped_column(Integer)
+    status: Mapped[
+        Literal["queued"]
+        | Literal["running"]
+        | Literal["recovering"]
+        | Literal["error"]
+        | Literal["success"]
+        | Literal["skipped"]
+    ] = mapped_column(String(30))
+    enqueued_at: Mapped[datetime.datetime] = mapped_column(DateTime)
+    claimed_by: Mapped[str | None] = mapped_column(String(100), default=None)
+    claimed_at: Mapped[datetime.datetime | None] = mapped_column(DateTime, default=None)
+    finished_at: Mapped[datetime.datetime | None] = mapped_column(
+        DateTime, default=None
+    )
+    task_run_id: Mapped[str | None] = mapped_column(String(50), default=None)
+    attempts: Mapped[int | None] = mapped_column(Integer, default=0)
+    heartbeat_at: Mapped[datetime.datetime | None] = mapped_column(
+        DateTime, default=None
+    )
+    lease_expires_at: Mapped[datetime.datetime | None] = mapped_column(
+        DateTime, default=None
+    )
+
+
+class Lease(Base):
+    """Table leases model, held by one process at a time until they expire."""
+
+    __tablename__ = "leases"
+
+    name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    holder: Mapped[str] = mapped_column(String(100))
+    expires_at: Mapped[datetime.datetime] = mapped_column(DateTime)
+
+
+class HostTuning(Base):
+    """Table parallel transfers per host learned by the auto tuner model."""
+
+    __tablename__ = "host_tuning"
+
+    host_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    concurrency: Mapped[int] = mapped_column(Integer)
+    bytes_per_sec: Mapped[float | None] = mapped_column(Float, default=None)
+    updated_at: Mapped[datetime.datetime] = mapped_column(DateTime)
+
+
+class HostCircuit(Base):
+    """Table circuit breaker state per host model."""
+
+    __tablename__ = "host_circuit"
+
+    host_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    state: Mapped[str] = mapped_column(String(30))
+    failures: Mapped[int] = mapped_column(Integer, default=0)
+    last_error: Mapped[str] = mapped_column(Text, default="")
+    opened_at: Mapped[datetime.datetime | None] = mapped_column(DateTime, default=None)
+    updated_at: Mapped[datetime.datetime] = mapped_column(DateTime)
+
+
+class SchemaVersion(Base):
+    """Table schema version model."""
+
+    __tablename__ = "schema_version"
+
+    version: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    description: Mapped[str] = mapped_column(String(255))
+    applied_at: Mapped[datetime.datetime] = mapped_column(DateTime)
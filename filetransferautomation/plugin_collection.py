@@ -1,14 +1,46 @@
 """Plugin loading."""
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+import importlib
 import inspect
 import json
+import logging
 import os
 import pkgutil
+import threading
 from typing import Any
 
 import jinja2
 from pydantic import BaseModel
 
+from filetransferautomation import (
+    bandwidth,
+    circuit_breaker,
+    host_limits,
+    host_tuning,
+    metrics,
+    progress,
+    tracing,
+)
 from filetransferautomation.common import split_uppercase
+from filetransferautomation.logs import add_file_log_entry
+
+PLUGIN_PACKAGE = "filetransferautomation.step_plugins"
+MANIFEST_PATH = os.path.join(os.path.dirname(__file__), "step_plugins", "manifest.json")
+
+_loaded_plugins: dict[str, type] = {}
+_load_lock = threading.Lock()
+_manifest: dict[str, dict] | None = None
+# Set once all plugin modules were walked, scripts not found then don't exist.
+_package_walked = False
+
+
+class RunCancelledError(BaseException):
+    """Raised in a task run that was cancelled, as its worker lost the lease.
+
+    Like asyncio.CancelledError it is no Exception, so per file error handling of
+    plugins doesn't log it as a failed file and carry on.
+    """
 
 
 class Input(BaseModel):
@@ -23,12 +55,24 @@ class Output(BaseModel):
     ...
 
 
+def plugin_name(plugin: type) -> str:
+    """Get script name of a plugin class, module_class_name."""
+    return (
+        str(plugin.__module__).split(".")[-1].lower()
+        + "_"
+        + split_uppercase(str(plugin.__name__)).lower()
+    )
+
+
 class Plugin:
     """Basemodel for plugins."""
 
     input_model = Input
     output_model = Output
     arguments = input_model
+    name = ""
+    # Files are transferred in parallel threads when auto tuning of the host allows.
+    parallel_files = False
 
     def __init__(self, arguments: str, variables):
         """Init."""
@@ -70,6 +114,118 @@ class Plugin:
             return self.variables[name]
         return None
 
+    def split_completed_files(self, files: list[str]) -> tuple[list[str], list[str]]:
+        """Split files in those left to transfer and those a resumed run already did."""
+        completed = self.get_variable("completed_files") or set()
+        return (
+            [file for file in files if file not in completed],
+            [file for file in files if file in completed],
+        )
+
+    def transfer_files(self, files: list[str], transfer: Callable[[str], Any]):
+        """Call transfer for each file, in parallel when the plugin and host allow."""
+        workers = 1
+        if self.parallel_files:
+            workers = min(
+                host_tuning.get_concurrency(self.get_variable("host")), len(files)
+            )
+        if workers <= 1:
+            for file in files:
+                transfer(file)
+            return None
+        with ThreadPoolExecutor(
+            workers, thread_name_prefix=f"{threading.current_thread().name}-file"
+        ) as executor:
+            list(executor.map(transfer, files))
+
+    def host_breaker(self):
+        """Connect to the host of the step, failing fast while its circuit is open."""
+        return circuit_breaker.guard(self.get_variable("host"))
+
+    def host_session(self):
+        """Hold a session slot of the host of the step, while connected."""
+        return host_limits.session(
+            self.get_variable("host"), self.get_variable("task_id")
+        )
+
+    def check_cancelled(self):
+        """Raise RunCancelledError if the task run was cancelled."""
+        cancelled = self.get_variable("cancelled")
+        if cancelled and cancelled.is_set():
+            raise RunCancelledError(
+                f"task_run_id: {self.get_variable('workspace_id')} was cancelled"
+            )
+
+    def host_transfer(self):
+        """Hold a transfer slot of the host of the step, while transferring a file.
+
+        Checks the task run wasn't cancelled first, before a file is written.
+        """
+        self.check_cancelled()
+        return host_limits.transfer(
+            self.get_variable("host"), self.get_variable("task_id")
+        )
+
+    def span(self, name: str, **args):
+        """Trace a phase of the plugin, like connect, list, transfer or delete."""
+        return tracing.tracer.span(
+            self.get_variable("workspace_id"),
+            name,
+            self.name or plugin_name(type(self)),
+            **args,
+        )
+
+    def track_transfer(
+        self, filename: str, total: int | None = None
+    ) -> progress.FileTransfer:
+        """Start reporting live progress of a file transfer, shaping its bandwidth."""
+        return progress.reporter.start(
+            self.get_variable("workspace_id"),
+            self.get_variable("step_id"),
+            filename,
+            total,
+            bandwidth.Throttle(self.get_variable("host"), self.get_variable("task")),
+        )
+
+    def log_file(
+        self,
+        filename: str,
+        status: str,
+        filesize: int | None = None,
+        duration_sec: float | None = None,
+        bytes_per_sec: float | None = None,
+    ):
+        """Add file log entry for this step and record transfer metrics."""
+        with tracing.tracer.span(
+            self.get_variable("workspace_id"), "log", "log", status=status
+        ):
+            add_file_log_entry(
+                task_run_id=self.get_variable("workspace_id"),
+                task_id=self.get_variable("task_id"),
+                step_id=self.get_variable("step_id"),
+                filename=filename,
+                status=status,
+                filesize=filesize,
+                duration_sec=duration_sec,
+                bytes_per_sec=bytes_per_sec,
+            )
+        if status in metrics.FINAL_FILE_STATUSES:
+            progress.reporter.finish(
+                self.get_variable("workspace_id"),
+                self.get_variable("step_id"),
+                filename,
+                status,
+            )
+        host = self.get_variable("host")
+        metrics.record_file(
+            self.name or plugin_name(type(self)),
+            host.name if host and host.name else "",
+            status,
+            filesize,
+            duration_sec,
+        )
+        host_tuning.record(host, status, filesize, duration_sec)
+
 
 class PluginCollection:
     """Loads plugins."""
@@ -98,11 +254,7 @@ class PluginCollection:
                 for _, clsmember in clsmembers:
                     # Only add classes that are a sub class of Plugin, but NOT Plugin itself
                     if issubclass(clsmember, Plugin) & (clsmember is not Plugin):
-                        clsmember.name = (  # type: ignore
-                            str(clsmember.__module__).split(".")[-1].lower()
-                            + "_"
-                            + split_uppercase(str(clsmember.__name__)).lower()
-                        )
+                        clsmember.name = plugin_name(clsmember)  # type: ignore
                         self.plugins.append(clsmember)
 
         # Now that we have looked at all the modules in the current package, start looking
@@ -127,3 +279,111 @@ class PluginCollection:
                 # For each sub directory, apply the walk_package method recursively
                 for child_pkg in child_pkgs:
                     self.walk_package(package + "." + child_pkg)
+
+
+def load_manifest() -> dict[str, dict]:
+    """Get the module, class, description and models of each plugin script."""
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(MANIFEST_PATH) as manifest:
+                _manifest = json.load(manifest)
+        except FileNotFoundError:
+            _manifest = {}
+    return _manifest  # type: ignore
+
+
+def write_manifest(plugins: list[type]):
+    """Write the manifest of plugin classes."""
+    manifest = {
+        plugin.name: {  # type: ignore
+            "module": plugin.__module__,
+            "class": plugin.__name__,
+            "description": plugin.__doc__,
+            "input_model": plugin.input_model.schema(),  # type: ignore
+            "output_model": plugin.output_model.schema(),  # type: ignore
+        }
+        for plugin in sorted(plugins, key=lambda plugin: plugin.name)  # type: ignore
+    }
+    with open(MANIFEST_PATH, "w") as file:
+        json.dump(manifest, file, indent=2)
+        file.write("\n")
+
+
+def register_plugin(plugin: type):
+    """Make a plugin class available by its script name."""
+    if not plugin.name:  # type: ignore
+        plugin.name = plugin_name(plugin)  # type: ignore
+    with _load_lock:
+        _loaded_plugins[plugin.name.lower()] = plugin  # type: ignore
+
+
+def get_plugin(script: str) -> type | None:
+    """Get the plugin class of a script, importing only its module.
+
+    Scripts missing from the manifest are looked up by walking all plugin modules,
+    once per process.
+    """
+    global _package_walked
+    script = script.lower()
+    with _load_lock:
+        if script in _loaded_plugins:
+            return _loaded_plugins[script]
+        if _package_walked:
+            return None
+        entry = load_manifest().get(script)
+        if entry:
+            try:
+                plugin = getattr(
+                    importlib.import_module(entry["module"]), entry["class"]
+                )
+            except (ImportError, AttributeError) as exc:
+                logging.warning(
+                    f"Plugin script '{script}' in manifest failed to load, "
+                    f"message: '{exc}'."
+                )
+            else:
+                plugin.name = plugin_name(plugin)
+                _loaded_plugins[script] = plugin
+                return plugin
+
+    plugins = PluginCollection(PLUGIN_PACKAGE).plugins
+    with _load_lock:
+        for plugin in plugins:
+            _loaded_plugins.setdefault(plugin.name.lower(), plugin)
+        _package_walked = True
+        return _loaded_plugins.get(script)
+
+
+def list_plugins() -> list[dict]:
+    """Get name, description and models of all plugins, without importing them."""
+    plugins = {
+        name: {
+            "name": name,
+            "description": entry["description"],
+            "input_model": entry["input_model"],
+            "output_model": entry["output_model"],
+        }
+        for name, entry in load_manifest().items()
+    }
+    with _load_lock:
+        registered = [
+            plugin for name, plugin in _loaded_plugins.items() if name not in plugins
+        ]
+    for plugin in registered:
+        plugins[plugin.name] = {  # type: ignore
+            "name": plugin.name,  # type: ignore
+            "description": plugin.__doc__,
+            "input_model": plugin.input_model.schema(),  # type: ignore
+            "output_model": plugin.output_model.schema(),  # type: ignore
+        }
+    return list(plugins.values())
+
+
+if __name__ == "__main__":
+    # Import by name, so plugins subclass the same Plugin class as they are compared to.
+    from filetransferautomation import plugin_collection
+
+    plugin_collection.write_manifest(
+        plugin_collection.PluginCollection(PLUGIN_PACKAGE).plugins
+    )
@@ -0,0 +1,179 @@
+"""Live byte level progress of file transfers."""
+from __future__ import annotations
+
+from collections import deque
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, field
+import threading
+import time
+
+FINISHED_RETAIN_SEC = 30
+
+
+@dataclass
+class FileProgress:
+    """Progress of one file in a task run step."""
+
+    task_run_id: str
+    step_id: int
+    file_name: str
+    bytes_done: int = 0
+    bytes_total: int | None = None
+    status: str = "transferring"
+    started: float = field(default_factory=time.time)
+    updated: float = field(default_factory=time.time)
+    version: int = 0
+
+
+class ProgressReporter:
+    """Keeps progress of running transfers in memory, never in the database."""
+
+    def __init__(self):
+        """Init."""
+        self._lock = threading.Lock()
+        self._files: dict[tuple[str, int, str], FileProgress] = {}
+        self._finished: deque[tuple[float, tuple[str, int, str]]] = deque()
+        self._version = 0
+
+    def _next_version(self) -> int:
+        self._version += 1
+        return self._version
+
+    def _set_finished(self, file: FileProgress, status: str):
+        file.status = status
+        file.updated = time.time()
+        file.version = self._next_version()
+        self._finished.append(
+            (file.updated, (file.task_run_id, file.step_id, file.file_name))
+        )
+
+    def _prune(self):
+        now = time.time()
+        while self._finished and now - self._finished[0][0] >= FINISHED_RETAIN_SEC:
+            finished, key = self._finished.popleft()
+            file = self._files.get(key)
+            if file and file.status != "transferring" and file.updated == finished:
+                del self._files[key]
+
+    def prune(self):
+        """Remove files finished more than FINISHED_RETAIN_SEC ago."""
+        with self._lock:
+            self._prune()
+
+    def start(
+        self,
+        task_run_id: str,
+        step_id: int,
+        file_name: str,
+        total: int | None,
+        throttle: Callable[[int], None] | None = None,
+    ) -> FileTransfer:
+        """Start tracking a file transfer, passing each chunk through throttle."""
+        key = (task_run_id, step_id, file_name)
+        with self._lock:
+            self._prune()
+            self._files[key] = FileProgress(
+                task_run_id,
+                step_id,
+                file_name,
+                bytes_total=total,
+                version=self._next_version(),
+            )
+        return FileTransfer(self, key, throttle)
+
+    def update(self, key: tuple[str, int, str], bytes_done: int, total=None):
+        """Set bytes done of a file transfer."""
+        with self._lock:
+            file = self._files.get(key)
+            if not file:
+                return None
+            file.bytes_done = bytes_done
+            if total:
+                file.bytes_total = total
+            file.updated = time.time()
+            file.version = self._next_version()
+
+    def add(self, key: tuple[str, int, str], count: int):
+        """Add bytes done to a file transfer."""
+        with self._lock:
+            file = self._files.get(key)
+            if not file:
+                return None
+            file.bytes_done += count
+            file.updated = time.time()
+            file.version = self._next_version()
+
+    def finish(self, task_run_id: str, step_id: int, file_name: str, status: str):
+        """Mark a file transfer as finished, kept for FINISHED_RETAIN_SEC."""
+        with self._lock:
+            self._prune()
+            file = self._files.get((task_run_id, step_id, file_name))
+            if not file:
+                return None
+            if status != "error" and file.bytes_total:
+                file.bytes_done = file.bytes_total
+            self._set_finished(file, status)
+
+    def finish_run(self, task_run_id: str):
+        """Mark transfers of a run that never finished as aborted.
+
+        The files of the run are removed FINISHED_RETAIN_SEC later, also when no
+        other transfer starts or finishes by then.
+        """
+        with self._lock:
+            self._prune()
+            for file in self._files.values():
+                if file.task_run_id == task_run_id and file.status == "transferring":
+                    self._set_finished(file, "aborted")
+        timer = threading.Timer(FINISHED_RETAIN_SEC, self.prune)
+        timer.daemon = True
+        timer.start()
+
+    def changes(
+        self, since_version: int = 0, task_run_ids: list[str] | None = None
+    ) -> tuple[int, list[dict]]:
+        """Get progress changed after a version, and the latest version."""
+        with self._lock:
+            changed = [
+                asdict(file)
+                for file in self._files.values()
+                if file.version > since_version
+                and (not task_run_ids or file.task_run_id in task_run_ids)
+            ]
+            return self._version, sorted(changed, key=lambda file: file["version"])
+
+
+class FileTransfer:
+    """Handle passed to transfer loops to report progress of one file."""
+
+    def __init__(
+        self,
+        progress_reporter: ProgressReporter,
+        key: tuple[str, int, str],
+        throttle: Callable[[int], None] | None = None,
+    ):
+        """Init."""
+        self.reporter = progress_reporter
+        self.key = key
+        self.throttle = throttle
+        self.bytes_done = 0
+
+    def add(self, count: int | bytes):
+        """Report a chunk, as length or the chunk itself (ftplib callbacks)."""
+        if isinstance(count, bytes):
+            count = len(count)
+        self.reporter.add(self.key, count)
+        self.bytes_done += count
+        if self.throttle:
+            self.throttle(count)
+
+    def set(self, bytes_done: int, total: int | None = None):
+        """Report bytes done so far (paramiko callbacks)."""
+        self.reporter.update(self.key, bytes_done, total)
+        count = bytes_done - self.bytes_done
+        self.bytes_done = bytes_done
+        if self.throttle and count > 0:
+            self.throttle(count)
+
+
+reporter = ProgressReporter()
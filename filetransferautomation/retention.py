@@ -0,0 +1,239 @@
+"""Log retention, rollup and archival."""
+from __future__ import annotations
+
+import datetime
+import glob
+import gzip
+import json
+import logging
+import os
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from filetransferautomation import settings
+from filetransferautomation.database import SessionLocal, serialized_write, upsert_add
+from filetransferautomation.models import FileLog, StepLog, TaskLog, TaskLogDaily
+
+ARCHIVE_TABLES = ("task_log", "step_log", "file_log")
+TRANSFERRED_STATUSES = ("downloaded", "uploaded", "mailed")
+PENDING_SUFFIX = ".pending"
+
+
+def archive_path(table: str, day: datetime.date, batch_id: int) -> str:
+    """Get path to the archive file of a table, day and batch."""
+    return os.path.join(
+        settings.ARCHIVE_DIR, table, f"{day.isoformat()}.{batch_id:010d}.jsonl.gz"
+    )
+
+
+def archive_files(table: str, day: datetime.date) -> list[str]:
+    """Get paths to the archive files of a table and day, in batch order."""
+    return sorted(
+        glob.glob(
+            os.path.join(settings.ARCHIVE_DIR, table, f"{day.isoformat()}.*jsonl.gz")
+        )
+    )
+
+
+def row_to_dict(row) -> dict:
+    """Get all columns of a log row."""
+    return {column.name: getattr(row, column.name) for column in row.__table__.columns}
+
+
+def write_archive(
+    table: str, batch_id: int, rows_per_day: dict[datetime.date, list]
+) -> list[str]:
+    """Write rows to pending compressed jsonl archive files, one per day.
+
+    Gets the paths of the pending files, published by publish_archives once the
+    rows are deleted from the database.
+    """
+    paths = []
+    for day, rows in rows_per_day.items():
+        path = archive_path(table, day, batch_id) + PENDING_SUFFIX
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with gzip.open(path, "wt", encoding="utf-8") as archive:
+            for row in rows:
+                archive.write(json.dumps(row_to_dict(row), default=str) + "\n")
+        paths.append(path)
+    return paths
+
+
+def publish_archives(paths: list[str]):
+    """Rename pending archive files to their archive paths."""
+    for path in paths:
+        os.replace(path, path.removesuffix(PENDING_SUFFIX))
+
+
+def remove_archives(paths: list[str]):
+    """Remove pending archive files."""
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def recover_archives():
+    """Publish or remove pending archive files left by an interrupted batch.
+
+    A batch is named after its first task run, if that run is gone the batch
+    was committed and its files are published, otherwise they are removed.
+    """
+    pending = glob.glob(os.path.join(settings.ARCHIVE_DIR, "*", "*" + PENDING_SUFFIX))
+    if not pending:
+        return None
+    with SessionLocal() as db:
+        for path in pending:
+            batch_id = int(os.path.basename(path).split(".")[1])
+            if db.get(TaskLog, batch_id):
+                remove_archives([path])
+            else:
+                publish_archives([path])
+
+
+def read_archive(table: str, day: datetime.date):
+    """Yield rows from the archive files of a table and day."""
+    for path in archive_files(table, day):
+        with gzip.open(path, "rt", encoding="utf-8") as archive:
+            for line in archive:
+                yield json.loads(line)
+
+
+def list_archives() -> list[dict]:
+    """List archived days per table, with the size of their files."""
+    archives = []
+    for table in ARCHIVE_TABLES:
+        directory = os.path.join(settings.ARCHIVE_DIR, table)
+        if not os.path.isdir(directory):
+            continue
+        sizes: dict[str, int] = {}
+        for entry in os.scandir(directory):
+            if entry.name.endswith(".jsonl.gz"):
+                day = entry.name.split(".")[0]
+                sizes[day] = sizes.get(day, 0) + entry.stat().st_size
+        for day, size in sorted(sizes.items()):
+            archives.append({"table": table, "day": day, "size": size})
+    return archives
+
+
+def rollup_runs(db: Session, runs: list[TaskLog], files: list[FileLog]):
+    """Add task runs to the per day and task aggregates."""
+    transferred: dict[str, list[FileLog]] = {}
+    for file in files:
+        if file.status in TRANSFERRED_STATUSES:
+            transferred.setdefault(file.task_run_id, []).append(file)
+
+    for run in runs:
+        run_files = transferred.get(run.task_run_id, [])
+        upsert_add(
+            db,
+            TaskLogDaily,
+            {"day": run.start_time.date(), "task_id": run.task_id},
+            {
+                "runs": 1,
+                "success_runs": 1 if run.status == "success" else 0,
+                "error_runs": 1 if run.status == "error" else 0,
+                "duration_sec": run.duration_sec or 0,
+                "files": len(run_files),
+                "size": sum(file.size or 0 for file in run_files),
+            },
+        )
+
+
+def read_batch(
+    db: Session, cutoff: datetime.datetime, batch_size: int
+) -> tuple[list[TaskLog], list[StepLog], list[FileLog]]:
+    """Get the oldest finished task runs before cutoff, with their steps and files."""
+    runs = (
+        db.execute(
+            select(TaskLog)
+            .where(TaskLog.start_time < cutoff, TaskLog.status != "running")
+            .order_by(TaskLog.joblog_id)
+            .limit(batch_size)
+        )
+        .scalars()
+        .all()
+    )
+    if not runs:
+        return [], [], []
+    task_run_ids = [run.task_run_id for run in runs]
+    steps = (
+        db.execute(select(StepLog).where(StepLog.task_run_id.in_(task_run_ids)))
+        .scalars()
+        .all()
+    )
+    files = (
+        db.execute(select(FileLog).where(FileLog.task_run_id.in_(task_run_ids)))
+        .scalars()
+        .all()
+    )
+    return list(runs), list(steps), list(files)
+
+
+@serialized_write
+def delete_batch(runs: list[TaskLog], files: list[FileLog]):
+    """Roll up and delete archived task runs in one transaction."""
+    task_run_ids = [run.task_run_id for run in runs]
+    with SessionLocal() as db:
+        rollup_runs(db, runs, files)
+        db.execute(delete(FileLog).where(FileLog.task_run_id.in_(task_run_ids)))
+        db.execute(delete(StepLog).where(StepLog.task_run_id.in_(task_run_ids)))
+        db.execute(
+            delete(TaskLog).where(
+                TaskLog.joblog_id.in_([run.joblog_id for run in runs])
+            )
+        )
+        db.commit()
+
+
+def archive_batch(cutoff: datetime.datetime, batch_size: int) -> int:
+    """Archive, roll up and delete the oldest finished task runs before cutoff.
+
+    The archive files of the batch are written as pending files first, and only
+    published after the delete is committed, so a failed batch archives nothing.
+    Only the delete runs on the database writer thread.
+    """
+    with SessionLocal() as db:
+        runs, steps, files = read_batch(db, cutoff, batch_size)
+    if not runs:
+        return 0
+
+    run_days = {run.task_run_id: run.start_time.date() for run in runs}
+    batch_id = runs[0].joblog_id
+    pending = []
+    try:
+        for table, rows in (
+            ("task_log", runs),
+            ("step_log", steps),
+            ("file_log", files),
+        ):
+            rows_per_day: dict[datetime.date, list] = {}
+            for row in rows:
+                rows_per_day.setdefault(run_days[row.task_run_id], []).append(row)
+            pending += write_archive(table, batch_id, rows_per_day)
+        delete_batch(runs, files)
+    except BaseException:
+        remove_archives(pending)
+        raise
+    publish_archives(pending)
+    return len(runs)
+
+
+def apply_retention(now: datetime.datetime | None = None) -> int:
+    """Archive all task runs older than the retention period, one batch at a time."""
+    if not settings.LOG_RETENTION_DAYS:
+        return 0
+    if not now:
+        now = datetime.datetime.now()
+    cutoff = now - datetime.timedelta(days=settings.LOG_RETENTION_DAYS)
+
+    recover_archives()
+    archived = 0
+    while True:
+        count = archive_batch(cutoff, settings.LOG_RETENTION_BATCH_SIZE)
+        if not count:
+            break
+        archived += count
+    if archived:
+        logging.info(f"Archived {archived} task runs started before {cutoff}.")
+    return archived
@@ -0,0 +1,229 @@
+"""Queue of task runs in the database, claimed by workers."""
+from __future__ import annotations
+
+from dataclasses import dataclass
+import datetime
+import logging
+import threading
+import uuid
+
+from sqlalchemy import and_, func, or_, select, update
+
+from filetransferautomation.database import SessionLocal, serialized_write
+from filetransferautomation.logs import abort_run_log
+from filetransferautomation.models import RunQueue
+
+# Set when a run is queued or a worker slot frees up, to poll without waiting.
+wakeup = threading.Event()
+
+
+@dataclass
+class ClaimedRun:
+    """Task run claimed by a worker, attempts counts this claim."""
+
+    run_id: int
+    task_id: int
+    task_run_id: str
+    attempts: int
+
+
+@serialized_write
+def enqueue_many(task_ids: list[int]) -> list[int]:
+    """Queue runs of tasks in one transaction, getting their run ids."""
+    if not task_ids:
+        return []
+    now = datetime.datetime.now()
+    with SessionLocal() as db:
+        runs = [
+            RunQueue(task_id=task_id, status="queued", enqueued_at=now)
+            for task_id in task_ids
+        ]
+        db.add_all(runs)
+        db.flush()
+        run_ids = [run.run_id for run in runs]
+        db.commit()
+    wakeup.set()
+    return run_ids
+
+
+def enqueue(task_id: int) -> int:
+    """Queue a run of a task, getting its run id."""
+    return enqueue_many([task_id])[0]
+
+
+@serialized_write
+def count_queued() -> int:
+    """Count runs waiting for a worker."""
+    with SessionLocal() as db:
+        return db.scalar(
+            select(func.count())
+            .select_from(RunQueue)
+            .where(RunQueue.status == "queued")
+        )
+
+
+def claim(worker_id: str, limit: int, lease_sec: float) -> list[ClaimedRun]:
+    """Claim the oldest queued runs, leased to the worker for lease_sec.
+
+    Rows are locked with SKIP LOCKED, so concurrent workers claim different runs
+    without waiting on each other. On SQLite, which has no row locks, the status
+    check of the update makes sure a run is only claimed once. A run keeps its
+    task_run_id when claimed again after its worker died, to resume its workspace.
+    """
+    if limit <= 0:
+        return []
+    now = datetime.datetime.now()
+    claimed = []
+    with SessionLocal() as db:
+        rows = db.execute(
+            select(
+                RunQueue.run_id,
+                RunQueue.task_id,
+                RunQueue.task_run_id,
+                RunQueue.attempts,
+            )
+            .where(RunQueue.status == "queued")
+            .order_by(RunQueue.run_id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        ).all()
+        for run_id, task_id, task_run_id, attempts in rows:
+            run = ClaimedRun(
+                run_id, task_id, task_run_id or str(uuid.uuid4()), (attempts or 0) + 1
+            )
+            result = db.execute(
+                update(RunQueue)
+                .where(RunQueue.run_id == run_id, RunQueue.status == "queued")
+                .values(
+                    status="running",
+                    claimed_by=worker_id,
+                    claimed_at=now,
+                    task_run_id=run.task_run_id,
+                    attempts=run.attempts,
+                    heartbeat_at=now,
+                    lease_expires_at=now + datetime.timedelta(seconds=lease_sec),
+                )
+            )
+            if result.rowcount:  # type: ignore
+                claimed.append(run)
+        db.commit()
+    return claimed
+
+
+@serialized_write
+def heartbeat(worker_id: str, run_ids: list[int], lease_sec: float) -> list[int]:
+    """Renew the leases of running runs of a worker, getting the run ids it lost."""
+    if not run_ids:
+        return []
+    now = datetime.datetime.now()
+    with SessionLocal() as db:
+        db.execute(
+            update(RunQueue)
+            .where(
+                RunQueue.run_id.in_(run_ids),
+                RunQueue.claimed_by == worker_id,
+                RunQueue.status == "running",
+            )
+            .values(
+                heartbeat_at=now,
+                lease_expires_at=now + datetime.timedelta(seconds=lease_sec),
+            )
+        )
+        held = set(
+            db.scalars(
+                select(RunQueue.run_id).where(
+                    RunQueue.run_id.in_(run_ids),
+                    RunQueue.claimed_by == worker_id,
+                    RunQueue.status == "running",
+                )
+            )
+        )
+        db.commit()
+    return [run_id for run_id in run_ids if run_id not in held]
+
+
+@serialized_write
+def recover_expired(worker_id: str, max_attempts: int, lease_sec: float) -> list[int]:
+    """Queue again the runs whose worker stopped renewing the lease, getting their ids.
+
+    An expired run is first taken over as recovering, leased to this worker, so
+    its task log is only set to error when no other worker renewed or recovered
+    it in between. A run that used up max_attempts is set to error instead of
+    queued. Runs claimed before leases existed have no lease and count as expired.
+    """
+    now = datetime.datetime.now()
+    expired = and_(
+        RunQueue.status.in_(("running", "recovering")),
+        or_(RunQueue.lease_expires_at.is_(None), RunQueue.lease_expires_at < now),
+    )
+    requeued = []
+    with SessionLocal() as db:
+        rows = db.execute(
+            select(
+                RunQueue.run_id,
+                RunQueue.task_id,
+                RunQueue.task_run_id,
+                RunQueue.attempts,
+                RunQueue.claimed_by,
+            ).where(expired)
+        ).all()
+    for run_id, task_id, task_run_id, attempts, claimed_by in rows:
+        with SessionLocal() as db:
+            result = db.execute(
+                update(RunQueue)
+                .where(RunQueue.run_id == run_id, expired)
+                .values(
+                    status="recovering",
+                    claimed_by=worker_id,
+                    lease_expires_at=now + datetime.timedelta(seconds=lease_sec),
+                )
+            )
+            db.commit()
+        if not result.rowcount:  # type: ignore
+            continue
+        # Abort the task log before queueing, a run queued again may resume at once.
+        if task_run_id:
+            abort_run_log(task_run_id, task_id)
+        retry = (attempts or 0) < max_attempts
+        values = (
+            {"status": "queued", "claimed_by": None, "lease_expires_at": None}
+            if retry
+            else {"status": "error", "finished_at": now}
+        )
+        with SessionLocal() as db:
+            db.execute(
+                update(RunQueue)
+                .where(
+                    RunQueue.run_id == run_id,
+                    RunQueue.status == "recovering",
+                    RunQueue.claimed_by == worker_id,
+                )
+                .values(**values)
+            )
+            db.commit()
+        logging.warning(
+            f"Lease of run {run_id} of task id: {task_id}, task_run_id: "
+            f"{task_run_id}, claimed by '{claimed_by}' expired, "
+            + ("queued again." if retry else f"giving up after {attempts} attempts.")
+        )
+        if retry:
+            requeued.append(run_id)
+    if requeued:
+        wakeup.set()
+    return requeued
+
+
+@serialized_write
+def finish(run_id: int, worker_id: str, status: str):
+    """Set the final status of a run, unless the worker lost its lease."""
+    with SessionLocal() as db:
+        db.execute(
+            update(RunQueue)
+            .where(
+                RunQueue.run_id == run_id,
+                RunQueue.claimed_by == worker_id,
+                RunQueue.status == "running",
+            )
+            .values(status=status, finished_at=datetime.datetime.now())
+        )
+        db.commit()
@@ -31,7 +31,7 @@ def get_schedules():
 
 
 @router.delete("/{schedule_id}", status_code=204)
-async def delete_schedule(schedule_id: int):
+def delete_schedule(schedule_id: int):
     """Delete a schedule."""
     with SessionLocal() as db:
         db_schedule = db.query(models.Schedule).filter(
@@ -46,7 +46,7 @@ async def delete_schedule(schedule_id: int):
 
 
 @router.post("", status_code=201)
-async def add_schedule(schedule: shemas.AddSchedule):
+def add_schedule(schedule: shemas.AddSchedule):
     """Add a schedule."""
     with SessionLocal() as db:
         db_task = models.Schedule(**schedule.dict())
@@ -57,7 +57,7 @@ async def add_schedule(schedule: shemas.AddSchedule):
 
 
 @router.put("/{schedule_id}")
-async def update_schedule(schedule_id: int, schedule: shemas.AddSchedule):
+def update_schedule(schedule_id: int, schedule: shemas.AddSchedule):
     """Update a schedule."""
     with SessionLocal() as db:
         db_schedule = (
@@ -79,7 +79,7 @@ async def update_schedule(schedule_id: int, schedule: shemas.AddSchedule):
         return None
 
 
-async def update_schedule_job_id(schedule_id: int, scheduler_job_id: int):
+def update_schedule_job_id(schedule_id: int, scheduler_job_id: int):
     """Update a schedule and set scheduler_job_id."""
     with SessionLocal() as db:
         db_schedule = (
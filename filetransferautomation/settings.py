@@ -14,6 +14,7 @@ if DEV_MODE:
 DATA_DIR = "/data"
 FOLDERS_DIR = DIR_ADDON + os.path.join(DATA_DIR, "folders")
 WORK_DIR = DIR_ADDON + os.path.join(DATA_DIR, "work")
+ARCHIVE_DIR = DIR_ADDON + os.path.join(DATA_DIR, "archive")
 # SCRIPTS_DIR = DIR_ADDON + os.path.join(DATA_DIR, "scripts")
 
 DATABASE_URL = f"sqlite:///{DATA_DIR}/file-transfer-automation.db"
@@ -23,10 +24,64 @@ if DEV_MODE:
 
 DATABASE_URL = str(os.getenv("DATABASE_URL", DATABASE_URL))
 
+SQLITE_BUSY_TIMEOUT_SEC: float = float(os.getenv("SQLITE_BUSY_TIMEOUT_SEC", 30))
+SQLITE_CACHE_SIZE_KB: int = int(os.getenv("SQLITE_CACHE_SIZE_KB", 65536))
+SQLITE_DISABLE_WRITER_THREAD: bool = bool(
+    os.getenv("SQLITE_DISABLE_WRITER_THREAD", False)
+)
+
 DISABLE_JOBS: bool = bool(os.getenv("DISABLE_JOBS", False))
 
+# Comma separated roles of this process: api, scheduler and worker.
+ROLES: set[str] = {
+    role.strip()
+    for role in str(os.getenv("ROLES", "api,scheduler,worker")).split(",")
+    if role.strip()
+}
+SCHEDULER_LEASE_SEC: float = float(os.getenv("SCHEDULER_LEASE_SEC", 30))
+WORKER_CONCURRENCY: int = int(os.getenv("WORKER_CONCURRENCY", 10))
+WORKER_POLL_SEC: float = float(os.getenv("WORKER_POLL_SEC", 1))
+RUN_LEASE_SEC: float = float(os.getenv("RUN_LEASE_SEC", 60))
+RUN_HEARTBEAT_SEC: float = float(os.getenv("RUN_HEARTBEAT_SEC", 15))
+RUN_MAX_ATTEMPTS: int = int(os.getenv("RUN_MAX_ATTEMPTS", 3))
+
+API_THREADPOOL_SIZE: int = int(os.getenv("API_THREADPOOL_SIZE", 40))
+PROGRESS_STREAM_INTERVAL_SEC: float = float(
+    os.getenv("PROGRESS_STREAM_INTERVAL_SEC", 1)
+)
+
+TRACE_SAMPLE_RATE: float = float(os.getenv("TRACE_SAMPLE_RATE", 0))  # 0 to 1
+TRACE_RETAIN_RUNS: int = int(os.getenv("TRACE_RETAIN_RUNS", 100))
+
+BANDWIDTH_LIMIT: int = int(os.getenv("BANDWIDTH_LIMIT", 0))  # bytes/s, 0 no limit
+BANDWIDTH_BURST: int = int(os.getenv("BANDWIDTH_BURST", 1024 * 1024))
+
+AUTOTUNE_TRANSFERS: bool = bool(os.getenv("AUTOTUNE_TRANSFERS", False))
+AUTOTUNE_MAX_TRANSFERS: int = int(os.getenv("AUTOTUNE_MAX_TRANSFERS", 8))
+AUTOTUNE_WINDOW_FILES: int = int(os.getenv("AUTOTUNE_WINDOW_FILES", 10))
+AUTOTUNE_MAX_ERROR_RATE: float = float(os.getenv("AUTOTUNE_MAX_ERROR_RATE", 0.1))
+
+CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 3))
+CIRCUIT_OPEN_SEC: float = float(os.getenv("CIRCUIT_OPEN_SEC", 60))
+
+UPLOAD_PARALLEL_FILES: int = int(os.getenv("UPLOAD_PARALLEL_FILES", 4))
+FOLDER_INDEX_MIN_FILES: int = int(os.getenv("FOLDER_INDEX_MIN_FILES", 1000))
+FOLDER_INDEX_TTL_SEC: float = float(os.getenv("FOLDER_INDEX_TTL_SEC", 60))
+
+ENABLE_DIAGNOSTICS: bool = bool(os.getenv("ENABLE_DIAGNOSTICS", False))
+TRACEMALLOC_FRAMES: int = int(os.getenv("TRACEMALLOC_FRAMES", 25))
+
+LOG_RETENTION_DAYS: int = int(os.getenv("LOG_RETENTION_DAYS", 0))  # 0 keeps logs
+LOG_RETENTION_BATCH_SIZE: int = int(os.getenv("LOG_RETENTION_BATCH_SIZE", 500))
+LOG_RETENTION_INTERVAL_SEC: int = int(os.getenv("LOG_RETENTION_INTERVAL_SEC", 3600))
+
 SMTP_HOSTNAME = str(os.getenv("SMTP_HOSTNAME", "localhost"))
 SMTP_USERNAME = str(os.getenv("SMTP_USERNAME", ""))
 SMTP_PASSWORD = str(os.getenv("SMTP_PASSWORD", ""))
 SMTP_PORT: int = int(os.getenv("SMTP_PORT", 25))
 SMTP_TLS: bool = bool(os.getenv("SMTP_TLS", False))
+SMTP_MAX_MESSAGE_SIZE: int = int(os.getenv("SMTP_MAX_MESSAGE_SIZE", 25 * 1024 * 1024))
+SMTP_TIMEOUT: float = float(os.getenv("SMTP_TIMEOUT", 60))
+SMTP_POOL_SIZE: int = int(os.getenv("SMTP_POOL_SIZE", 2))
+SMTP_POOL_IDLE_SEC: float = float(os.getenv("SMTP_POOL_IDLE_SEC", 120))
+SMTP_POOL_NOOP_AFTER_SEC: float = float(os.getenv("SMTP_POOL_NOOP_AFTER_SEC", 10))
@@ -5,7 +5,7 @@ from dataclasses import dataclass
 import datetime
 from typing import Literal
 
-from pydantic import BaseModel
+from pydantic import BaseModel, PositiveInt
 
 
 @dataclass
@@ -15,6 +15,7 @@ class Folder:
     folder_id: int
     name: str
     description: str
+    max_size: int | None = None
 
 
 @dataclass
@@ -34,6 +35,8 @@ class AddTask(BaseModel):
     name: str
     description: str | None = ""
     active: int = 1
+    priority: Literal["high"] | Literal["normal"] | Literal["low"] | None = None
+    max_bytes_per_sec: PositiveInt | None = None
 
 
 class AddHost(BaseModel):
@@ -46,6 +49,9 @@ class AddHost(BaseModel):
     username: str | None = None
     password: str | None = None
     description: str | None = None
+    max_sessions: PositiveInt | None = None
+    max_parallel_transfers: PositiveInt | None = None
+    max_bytes_per_sec: PositiveInt | None = None
 
 
 class AddStep(BaseModel):
@@ -0,0 +1,202 @@
+"""SMTP connection pool, shared by task runs."""
+from __future__ import annotations
+
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from email.message import Message
+import logging
+import smtplib
+import threading
+import time
+from typing import BinaryIO
+
+from filetransferautomation import settings
+
+RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+SEND_BUFFER_SIZE = 64 * 1024
+
+
+@dataclass
+class SpooledMail:
+    """Mail already rendered with CRLF line endings to a file, sent as it is read."""
+
+    send_from: str
+    send_to: list[str]
+    data: BinaryIO
+    # Shapes the bandwidth of the DATA, called with the size of each chunk sent.
+    throttle: Callable[[int], None] | None = None
+
+
+def send_data(smtp: smtplib.SMTP, mail: SpooledMail) -> dict:
+    """Send a spooled mail, streaming the DATA with dot stuffing.
+
+    Gets the refused recipients like SMTP.sendmail, the mail was sent to the others.
+    """
+    smtp.ehlo_or_helo_if_needed()
+    code, response = smtp.mail(mail.send_from)
+    if code != 250:
+        raise smtplib.SMTPSenderRefused(code, response, mail.send_from)
+    refused = {}
+    for address in mail.send_to:
+        code, response = smtp.rcpt(address)
+        if code not in (250, 251):
+            refused[address] = (code, response)
+    if len(refused) == len(mail.send_to):
+        raise smtplib.SMTPRecipientsRefused(refused)
+    code, response = smtp.docmd("data")
+    if code != 354:
+        raise smtplib.SMTPDataError(code, response)
+
+    def send(chunk: bytes):
+        if mail.throttle:
+            mail.throttle(len(chunk))
+        smtp.send(chunk)
+
+    mail.data.seek(0)
+    buffer = bytearray()
+    line = b"\r\n"
+    for line in mail.data:
+        if line.startswith(b"."):
+            buffer += b"."
+        buffer += line
+        if len(buffer) >= SEND_BUFFER_SIZE:
+            send(bytes(buffer))
+            buffer.clear()
+    if not line.endswith(b"\r\n"):
+        buffer += b"\r\n"
+    send(bytes(buffer + b".\r\n"))
+    code, response = smtp.getreply()
+    if code != 250:
+        raise smtplib.SMTPDataError(code, response)
+    return refused
+
+
+def log_refused(refused: dict):
+    """Log recipients the server refused, while it accepted the mail for others."""
+    recipients = ", ".join(
+        f"'{address}' ({code} {response.decode(errors='replace')})"
+        for address, (code, response) in refused.items()
+    )
+    logging.warning(f"Mail not sent to refused recipients {recipients}.")
+
+
+class SMTPPool:
+    """Keeps logged in SMTP sessions open for reuse, checked with NOOP when idle."""
+
+    def __init__(self):
+        """Init."""
+        self._lock = threading.Lock()
+        self._idle: deque[tuple[smtplib.SMTP, float]] = deque()
+        self._slots = threading.BoundedSemaphore(settings.SMTP_POOL_SIZE)
+        self._executor: ThreadPoolExecutor | None = None
+
+    def connect(self) -> smtplib.SMTP:
+        """Open a new SMTP session."""
+        smtp = smtplib.SMTP(
+            settings.SMTP_HOSTNAME, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT
+        )
+        if settings.SMTP_TLS:
+            smtp.starttls()
+        if settings.SMTP_USERNAME:
+            smtp.login(settings.SMTP_USERNAME, settings.SMTP_PASSWORD)
+        return smtp
+
+    @staticmethod
+    def close(smtp: smtplib.SMTP):
+        """Quit a session, ignoring errors of a dead connection."""
+        try:
+            smtp.quit()
+        except Exception:
+            smtp.close()
+
+    def is_alive(self, smtp: smtplib.SMTP, idle_since: float) -> bool:
+        """Check an idle session, with NOOP when it has been idle for a while."""
+        idle = time.monotonic() - idle_since
+        if idle > settings.SMTP_POOL_IDLE_SEC:
+            return False
+        if idle < settings.SMTP_POOL_NOOP_AFTER_SEC:
+            return True
+        try:
+            return smtp.noop()[0] == 250
+        except Exception:
+            return False
+
+    def get(self) -> smtplib.SMTP:
+        """Get a live idle session, or open a new one."""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                smtp, idle_since = self._idle.pop()
+            if self.is_alive(smtp, idle_since):
+                return smtp
+            self.close(smtp)
+        return self.connect()
+
+    def put(self, smtp: smtplib.SMTP):
+        """Return a session to the pool."""
+        with self._lock:
+            self._idle.append((smtp, time.monotonic()))
+
+    @staticmethod
+    def send(smtp: smtplib.SMTP, message: Message | SpooledMail) -> Exception | None:
+        """Send a message, getting the error if the server refused it."""
+        try:
+            if isinstance(message, SpooledMail):
+                refused = send_data(smtp, message)
+            else:
+                refused = smtp.send_message(message)
+        except (
+            smtplib.SMTPRecipientsRefused,
+            smtplib.SMTPSenderRefused,
+            smtplib.SMTPDataError,
+        ) as exc:
+            smtp.rset()
+            return exc
+        if refused:
+            log_refused(refused)
+        return None
+
+    def send_messages(
+        self, messages: list[Message | SpooledMail]
+    ) -> list[Exception | None]:
+        """Send messages over one session, getting the error of each, if any."""
+        errors: list[Exception | None] = []
+        with self._slots:
+            smtp = self.get()
+            try:
+                for message in messages:
+                    try:
+                        errors.append(self.send(smtp, message))
+                    except RECONNECT_ERRORS:
+                        self.close(smtp)
+                        smtp = self.connect()
+                        errors.append(self.send(smtp, message))
+            except Exception:
+                self.close(smtp)
+                raise
+            self.put(smtp)
+        return errors
+
+    def submit(self, messages: list[Message | SpooledMail]) -> Future:
+        """Send messages in the background, getting a future of send_messages."""
+        with self._lock:
+            if not self._executor:
+                self._executor = ThreadPoolExecutor(
+                    settings.SMTP_POOL_SIZE, thread_name_prefix="smtp"
+                )
+        return self._executor.submit(self.send_messages, messages)
+
+    def close_all(self):
+        """Close all idle sessions."""
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+        for smtp, _ in idle:
+            self.close(smtp)
+        logging.debug(f"Closed {len(idle)} idle SMTP sessions.")
+
+
+pool = SMTPPool()
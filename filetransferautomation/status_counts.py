@@ -0,0 +1,82 @@
+"""Materialized task run status counters."""
+from __future__ import annotations
+
+import datetime
+
+from sqlalchemy import Connection, and_, case, delete, exists, func, select
+from sqlalchemy.orm import Session
+
+from filetransferautomation.database import upsert_add
+from filetransferautomation.models import FileLog, TaskLog, TaskStatusCount
+
+STATUSES = ("success", "error", "running", "no_files")
+
+
+def counted_status(db: Session, task_run_id: str, status: str) -> str:
+    """Get the counter a task run status belongs to."""
+    if status == "success":
+        has_files = db.scalar(
+            select(exists().where(FileLog.task_run_id == task_run_id))
+        )
+        if not has_files:
+            return "no_files"
+    return status
+
+
+def count_status_change(
+    db: Session,
+    task_run_id: str,
+    day: datetime.date,
+    old_status: str | None,
+    new_status: str,
+):
+    """Move a task run between counters, called in the same session as the log write."""
+    if old_status:
+        old_status = counted_status(db, task_run_id, old_status)
+    new_status = counted_status(db, task_run_id, new_status)
+    if old_status == new_status:
+        return None
+    if old_status:
+        upsert_add(
+            db, TaskStatusCount, {"day": day, "status": old_status}, {"count": -1}
+        )
+    upsert_add(db, TaskStatusCount, {"day": day, "status": new_status}, {"count": 1})
+
+
+def get_status_counts(
+    db: Session, since: datetime.date | None = None
+) -> dict[str, int]:
+    """Get number of task runs per status, optionally from a day and onwards."""
+    query = select(TaskStatusCount.status, func.sum(TaskStatusCount.count)).group_by(
+        TaskStatusCount.status
+    )
+    if since:
+        query = query.where(TaskStatusCount.day >= since)
+    counts = {status: 0 for status in STATUSES}
+    for status, count in db.execute(query):
+        counts[status] = int(count or 0)
+    return counts
+
+
+def rebuild_status_counts(connection: Connection):
+    """Rebuild all counters from the task and file log tables."""
+    has_files = exists().where(FileLog.task_run_id == TaskLog.task_run_id)
+    status = case(
+        (and_(TaskLog.status == "success", ~has_files), "no_files"),
+        else_=TaskLog.status,
+    )
+    day = func.date(TaskLog.start_time)
+    rows = connection.execute(
+        select(day, status, func.count(TaskLog.joblog_id)).group_by(day, status)
+    ).all()
+
+    connection.execute(delete(TaskStatusCount))
+    for row_day, row_status, count in rows:
+        if not isinstance(row_day, datetime.date):
+            row_day = datetime.date.fromisoformat(str(row_day))
+        upsert_add(
+            connection,
+            TaskStatusCount,
+            {"day": row_day, "status": row_status},
+            {"count": count},
+        )
@@ -8,7 +8,6 @@ from pydantic import BaseModel
 from filetransferautomation.common import compare_filter
 from filetransferautomation.ftp_client import FTPClient
 from filetransferautomation.hosts import get_host
-from filetransferautomation.logs import add_file_log_entry
 from filetransferautomation.plugin_collection import Plugin
 
 
@@ -57,64 +56,56 @@ class Download(Plugin):
         downloaded_files = []
 
         if host and host.host and host.username and host.password:
-            ftp = FTPClient(
-                hostname=host.host,
-                username=host.username,
-                password=host.password,
-                port=host.port if host.port else 21,
-            )
+            with self.host_breaker(), self.span("connect", host=host.name):
+                ftp = FTPClient(
+                    hostname=host.host,
+                    username=host.username,
+                    password=host.password,
+                    port=host.port if host.port else 21,
+                )
             if host.directory:
                 ftp.chdir(host.directory)
 
-            files = ftp.list_dir()
+            with self.span("list"):
+                files = ftp.list_dir()
             for file in files:
                 if compare_filter(file, self.arguments.file_filter):
                     files_to_download.append(file)
 
-            for file in files_to_download:
-                add_file_log_entry(
-                    task_run_id=self.get_variable("workspace_id"),
-                    task_id=self.get_variable("task_id"),
-                    step_id=self.get_variable("step_id"),
-                    filename=file,
-                    status="downloading",
-                )
+            files_left, downloaded_files = self.split_completed_files(files_to_download)
+            for file in files_left:
+                self.log_file(file, "downloading")
 
-            for file in files_to_download:
+            for file in files_left:
                 try:
                     start_time = time.time()
+                    transfer = self.track_transfer(file, ftp.size(file))
 
-                    with open(os.path.join(workspace_directory, file), "wb") as to_file:
-                        to_file.write(ftp.get_file(file))
+                    with self.host_transfer(), open(
+                        os.path.join(workspace_directory, file), "wb"
+                    ) as to_file, self.span("transfer", file=file):
+                        ftp.download(file, to_file, transfer.add)
 
                 except Exception:
-                    add_file_log_entry(
-                        task_run_id=self.get_variable("workspace_id"),
-                        task_id=self.get_variable("task_id"),
-                        step_id=self.get_variable("step_id"),
-                        filename=file,
-                        status="error",
-                    )
+                    self.log_file(file, "error")
                     error = True
                 else:
                     downloaded_files.append(file)
                     size = os.path.getsize(os.path.join(workspace_directory, file))
                     duration = time.time() - start_time
 
-                    add_file_log_entry(
-                        task_run_id=self.get_variable("workspace_id"),
-                        task_id=self.get_variable("task_id"),
-                        step_id=self.get_variable("step_id"),
-                        filename=file,
-                        status="downloaded",
+                    self.log_file(
+                        file,
+                        "downloaded",
                         duration_sec=duration,
                         filesize=size,
                         bytes_per_sec=size / duration,
                     )
 
             if self.arguments.delete_files:
-                for file in downloaded_files:
-                    ftp.remove(file)
+                with self.span("delete"):
+                    for file in downloaded_files:
+                        ftp.remove(file)
 
             ftp.close()
 
@@ -158,33 +149,30 @@ class Upload(Plugin):
         uploaded_files = []
 
         if host and host.host and host.username and host.password:
-            ftp = FTPClient(
-                hostname=host.host,
-                username=host.username,
-                password=host.password,
-                port=host.port if host.port else 21,
-            )
+            with self.host_breaker(), self.span("connect", host=host.name):
+                ftp = FTPClient(
+                    hostname=host.host,
+                    username=host.username,
+                    password=host.password,
+                    port=host.port if host.port else 21,
+                )
             if host.directory:
                 ftp.chdir(host.directory)
 
-            files = os.listdir(workspace_directory)
+            with self.span("list"):
+                files = os.listdir(workspace_directory)
             for file in files:
                 if compare_filter(file, self.arguments.file_filter):
                     files_to_upload.append(file)
 
-            for file in files_to_upload:
-                add_file_log_entry(
-                    task_run_id=self.get_variable("workspace_id"),
-                    task_id=self.get_variable("task_id"),
-                    step_id=self.get_variable("step_id"),
-                    filename=file,
-                    status="uploading",
-                )
+            files_left, uploaded_files = self.split_completed_files(files_to_upload)
+            for file in files_left:
+                self.log_file(file, "uploading")
 
-            for file in files_to_upload:
+            for file in files_left:
                 try:
                     start_time = time.time()
-                    with open(
+                    with self.host_transfer(), open(
                         os.path.join(workspace_directory, file), "rb"
                     ) as from_file:
                         if not host.directory:
@@ -196,17 +184,15 @@ class Upload(Plugin):
                         except Exception:
                             pass
 
-                        ftp.send_file(filename, from_file)
+                        transfer = self.track_transfer(
+                            file, os.fstat(from_file.fileno()).st_size
+                        )
+                        with self.span("transfer", file=file):
+                            ftp.send_file(filename, from_file, transfer.add)
 
-                        ftp.rename(filename, filename[:-4])
+                            ftp.rename(filename, filename[:-4])
                 except Exception:
-                    add_file_log_entry(
-                        task_run_id=self.get_variable("workspace_id"),
-                        task_id=self.get_variable("task_id"),
-                        step_id=self.get_variable("step_id"),
-                        filename=file,
-                        status="error",
-                    )
+                    self.log_file(file, "error")
                     error = True
                 else:
                     uploaded_files.append(file)
@@ -214,12 +200,9 @@ class Upload(Plugin):
                     size = os.path.getsize(os.path.join(workspace_directory, file))
                     duration = time.time() - start_time
 
-                    add_file_log_entry(
-                        task_run_id=self.get_variable("workspace_id"),
-                        task_id=self.get_variable("task_id"),
-                        step_id=self.get_variable("step_id"),
-                        filename=file,
-                        status="uploaded",
+                    self.log_file(
+                        file,
+                        "uploaded",
                         duration_sec=duration,
                         filesize=size,
                         bytes_per_sec=size / duration,
@@ -230,8 +213,9 @@ class Upload(Plugin):
         logging.info(f"Uploaded files {uploaded_files} to '{host.name}'.")
 
         if self.arguments.delete_files:
-            for file in uploaded_files:
-                os.remove(os.path.join(workspace_directory, file))
+            with self.span("delete"):
+                for file in uploaded_files:
+                    os.remove(os.path.join(workspace_directory, file))
 
         self.set_variable("found_files", files)
         self.set_variable("matched_files", files_to_upload)
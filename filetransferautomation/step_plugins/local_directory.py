@@ -7,8 +7,8 @@ from pydantic import BaseModel
 
 from filetransferautomation.common import compare_filter
 from filetransferautomation.hosts import get_host
-from filetransferautomation.logs import add_file_log_entry
 from filetransferautomation.plugin_collection import Plugin
+from filetransferautomation.transfer import copy_fileobj
 
 
 class Input(BaseModel):
@@ -45,7 +45,8 @@ class ListFiles(Plugin):
         matched_files = []
         files = []
         if host:
-            files = os.listdir(host.directory)
+            with self.span("list"):
+                files = os.listdir(host.directory)
             for file in files:
                 if compare_filter(file, self.arguments.file_filter):
                     matched_files.append(file)
@@ -59,6 +60,7 @@ class DownloadFiles(Plugin):
     input_model = Input
     output_model = Output
     arguments = input_model
+    parallel_files = True
 
     def process(self):
         """Download files from local directory."""
@@ -85,57 +87,50 @@ class DownloadFiles(Plugin):
         downloaded_files = []
 
         if host:
-            files = os.listdir(remote_directory)
+            with self.span("list"):
+                files = os.listdir(remote_directory)
             for file in files:
                 if compare_filter(file, self.arguments.file_filter):
                     files_to_download.append(file)
 
-        for file in files_to_download:
-            add_file_log_entry(
-                task_run_id=self.get_variable("workspace_id"),
-                task_id=self.get_variable("task_id"),
-                step_id=self.get_variable("step_id"),
-                filename=file,
-                status="downloading",
-            )
+        files_left, downloaded_files = self.split_completed_files(files_to_download)
+        for file in files_left:
+            self.log_file(file, "downloading")
 
-        for file in files_to_download:
+        def download(file):
+            nonlocal error
             try:
                 start_time = time.time()
-                with open(os.path.join(remote_directory, file), "rb") as from_file:
-                    file_data = from_file.read()
-                with open(os.path.join(workspace_directory, file), "wb") as to_file:
-                    to_file.write(file_data)
+                from_path = os.path.join(remote_directory, file)
+                transfer = self.track_transfer(file, os.path.getsize(from_path))
+                with self.host_transfer(), open(from_path, "rb") as from_file, open(
+                    os.path.join(workspace_directory, file), "wb"
+                ) as to_file, self.span("transfer", file=file):
+                    copy_fileobj(from_file, to_file, transfer.add)
             except Exception:
-                add_file_log_entry(
-                    task_run_id=self.get_variable("workspace_id"),
-                    task_id=self.get_variable("task_id"),
-                    step_id=self.get_variable("step_id"),
-                    filename=file,
-                    status="error",
-                )
+                self.log_file(file, "error")
                 error = True
             else:
                 size = os.path.getsize(os.path.join(workspace_directory, file))
                 duration = time.time() - start_time
 
-                add_file_log_entry(
-                    task_run_id=self.get_variable("workspace_id"),
-                    task_id=self.get_variable("task_id"),
-                    step_id=self.get_variable("step_id"),
-                    filename=file,
-                    status="downloaded",
+                self.log_file(
+                    file,
+                    "downloaded",
                     filesize=size,
                     duration_sec=duration,
                     bytes_per_sec=size / duration,
                 )
                 downloaded_files.append(file)
 
+        self.transfer_files(files_left, download)
+
         logging.info(f"Downloaded files {downloaded_files} from '{host.name}'.")
 
         if self.arguments.delete_files:
-            for file in downloaded_files:
-                os.remove(os.path.join(remote_directory, file))
+            with self.span("delete"):
+                for file in downloaded_files:
+                    os.remove(os.path.join(remote_directory, file))
 
         self.set_variable("found_files", files)
         self.set_variable("matched_files", files_to_download)
@@ -151,6 +146,7 @@ class UploadFiles(Plugin):
     input_model = Input
     output_model = Output
     arguments = input_model
+    parallel_files = True
 
     def process(self):
         """Upload files to local directory."""
@@ -177,57 +173,50 @@ class UploadFiles(Plugin):
         uploaded_files = []
 
         if host:
-            files = os.listdir(workspace_directory)
+            with self.span("list"):
+                files = os.listdir(workspace_directory)
             for file in files:
                 if compare_filter(file, self.arguments.file_filter):
                     files_to_upload.append(file)
 
-        for file in files_to_upload:
-            add_file_log_entry(
-                task_run_id=self.get_variable("workspace_id"),
-                task_id=self.get_variable("task_id"),
-                step_id=self.get_variable("step_id"),
-                filename=file,
-                status="uploading",
-            )
+        files_left, uploaded_files = self.split_completed_files(files_to_upload)
+        for file in files_left:
+            self.log_file(file, "uploading")
 
-        for file in files_to_upload:
+        def upload(file):
+            nonlocal error
             try:
                 start_time = time.time()
-                with open(os.path.join(workspace_directory, file), "rb") as from_file:
-                    file_data = from_file.read()
-                with open(os.path.join(remote_directory, file), "wb") as to_file:
-                    to_file.write(file_data)
+                from_path = os.path.join(workspace_directory, file)
+                transfer = self.track_transfer(file, os.path.getsize(from_path))
+                with self.host_transfer(), open(from_path, "rb") as from_file, open(
+                    os.path.join(remote_directory, file), "wb"
+                ) as to_file, self.span("transfer", file=file):
+                    copy_fileobj(from_file, to_file, transfer.add)
             except Exception:
-                add_file_log_entry(
-                    task_run_id=self.get_variable("workspace_id"),
-                    task_id=self.get_variable("task_id"),
-                    step_id=self.get_variable("step_id"),
-                    filename=file,
-                    status="error",
-                )
+                self.log_file(file, "error")
                 error = True
             else:
                 uploaded_files.append(file)
                 size = os.path.getsize(os.path.join(workspace_directory, file))
                 duration = time.time() - start_time
 
-                add_file_log_entry(
-                    task_run_id=self.get_variable("workspace_id"),
-                    task_id=self.get_variable("task_id"),
-                    step_id=self.get_variable("step_id"),
-                    filename=file,
-                    status="uploaded",
+                self.log_file(
+                    file,
+                    "uploaded",
                     duration_sec=duration,
                     filesize=size,
                     bytes_per_sec=size / duration,
                 )
 
+        self.transfer_files(files_left, upload)
+
         logging.info(f"Uploaded files {uploaded_files} to '{host.name}'.")
 
         if self.arguments.delete_files:
-            for file in uploaded_files:
-                os.remove(os.path.join(workspace_directory, file))
+            with self.span("delete"):
+                for file in uploaded_files:
+                    os.remove(os.path.join(workspace_directory, file))
 
         self.set_variable("found_files", files)
         self.set_variable("matched_files", files_to_upload)
@@ -1,20 +1,31 @@
 """Workspace plugin."""
-from email import encoders
-from email.mime.base import MIMEBase
+import base64
+from concurrent.futures import Future
+from contextlib import ExitStack
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from email.utils import formatdate
+from email.policy import SMTP
+from email.utils import encode_rfc2231, formatdate
 import logging
+import math
 import os
-from pathlib import Path
-import smtplib
+import tempfile
+from typing import BinaryIO
+import uuid
+import zipfile
 
 from pydantic import BaseModel
 
-from filetransferautomation import settings
+from filetransferautomation import bandwidth, settings
 from filetransferautomation.common import compare_filter
-from filetransferautomation.logs import add_file_log_entry
 from filetransferautomation.plugin_collection import Plugin
+from filetransferautomation.smtp_pool import SpooledMail, pool
+
+ENCODE_CHUNK_SIZE = 57 * 16 * 1024  # whole 76 character base64 lines
+SPOOL_MAX_MEMORY = 1024 * 1024
+MESSAGE_OVERHEAD = 16 * 1024  # headers and body text
+ATTACHMENT_OVERHEAD = 1024
+COMPRESSED_FILENAME = "files.zip"
 
 
 class Input(BaseModel):
@@ -26,6 +37,9 @@ class Input(BaseModel):
     to_addresses: list[str] | list = []
     subject: str | None = ""
     body: str | None = ""
+    mail_per_file: bool | None = False
+    async_delivery: bool | None = False
+    compress: bool | None = False
 
 
 class Output(BaseModel):
@@ -36,41 +50,139 @@ class Output(BaseModel):
     mailed_files: list[str] | None
 
 
-def send_mail(
+def attachment_headers(filename: str, boundary: str) -> bytes:
+    """Get the boundary and headers of a base64 attachment part."""
+    if filename.isascii():
+        disposition = f'attachment; filename="{filename}"'
+    else:
+        disposition = f"attachment; filename*={encode_rfc2231(filename, 'utf-8')}"
+    return (
+        f"--{boundary}\r\n"
+        "Content-Type: application/octet-stream\r\n"
+        "MIME-Version: 1.0\r\n"
+        "Content-Transfer-Encoding: base64\r\n"
+        f"Content-Disposition: {disposition}\r\n\r\n"
+    ).encode()
+
+
+def write_base64(from_file: BinaryIO, to_file: BinaryIO):
+    """Base64 encode a file in chunks, as 76 character CRLF lines."""
+    while chunk := from_file.read(ENCODE_CHUNK_SIZE):
+        to_file.write(base64.encodebytes(chunk).replace(b"\n", b"\r\n"))
+
+
+def zip_files(workspace_directory: str, files: list[str]) -> BinaryIO:
+    """Compress files to a spooled zip file, closed again when compressing fails."""
+    with ExitStack() as stack:
+        zipped = stack.enter_context(tempfile.SpooledTemporaryFile(SPOOL_MAX_MEMORY))
+        with zipfile.ZipFile(zipped, "w", zipfile.ZIP_DEFLATED) as archive:  # type: ignore
+            for file in files:
+                archive.write(os.path.join(workspace_directory, file), file)
+        zipped.seek(0)
+        stack.pop_all()
+    return zipped  # type: ignore
+
+
+def build_mail(
     send_from: str,
     send_to: list[str],
     subject: str,
     message: str,
     workspace_directory: str,
     files: list[str] = [],
-):
-    """Send mail."""
-    msg = MIMEMultipart()
+    compress: bool = False,
+) -> SpooledMail:
+    """Render mail with files attached to a spooled file, encoding in chunks."""
+    boundary = f"==============={uuid.uuid4().hex}=="
+    msg = MIMEMultipart(boundary=boundary, policy=SMTP)
     msg["From"] = send_from
     msg["To"] = ", ".join(send_to)
     msg["Date"] = formatdate(localtime=True)
     msg["Subject"] = subject
-
     msg.attach(MIMEText(message))
+    head = msg.as_bytes()
+    closing = f"--{boundary}--".encode()
+
+    with ExitStack() as stack:
+        data = stack.enter_context(tempfile.SpooledTemporaryFile(SPOOL_MAX_MEMORY))
+        data.write(head[: head.rindex(closing)])
+
+        zipped = None
+        if compress and files:
+            zipped = stack.enter_context(zip_files(workspace_directory, files))
+            size = sum(
+                os.path.getsize(os.path.join(workspace_directory, file))
+                for file in files
+            )
+            if zipped.seek(0, os.SEEK_END) >= size:
+                zipped.close()
+                zipped = None
+        if zipped:
+            zipped.seek(0)
+            data.write(attachment_headers(COMPRESSED_FILENAME, boundary))
+            write_base64(zipped, data)  # type: ignore
+            zipped.close()
+        else:
+            for file in files:
+                data.write(attachment_headers(file, boundary))
+                with open(os.path.join(workspace_directory, file), "rb") as from_file:
+                    write_base64(from_file, data)  # type: ignore
 
-    for file in files:
-        path = os.path.join(workspace_directory, file)
-        part = MIMEBase("application", "octet-stream")
-        with open(path, "rb") as file:
-            part.set_payload(file.read())
-        encoders.encode_base64(part)
-        part.add_header(
-            "Content-Disposition", f"attachment; filename={format(Path(path).name)}"
-        )
-        msg.attach(part)
-
-    smtp = smtplib.SMTP(settings.SMTP_HOSTNAME, settings.SMTP_PORT)
-    if settings.SMTP_TLS:
-        smtp.starttls()
-    if settings.SMTP_USERNAME:
-        smtp.login(settings.SMTP_USERNAME, settings.SMTP_PASSWORD)
-    smtp.send_message(msg)
-    smtp.quit()
+        data.write(closing + b"\r\n")
+        # Keep the mail data open for sending, it's closed when the mail was sent.
+        stack.pop_all()
+    return SpooledMail(send_from, send_to, data)  # type: ignore
+
+
+def encoded_size(size: int) -> int:
+    """Estimate size of a file base64 encoded as an attachment."""
+    return math.ceil(size / 57) * 78 + ATTACHMENT_OVERHEAD
+
+
+def split_files(
+    sizes: dict[str, int], max_size: int, per_file: bool = False
+) -> tuple[list[list[str]], list[str]]:
+    """Split files into batches that fit in a message, and files too big to mail."""
+    batches: list[list[str]] = []
+    too_big = []
+    batch: list[str] = []
+    batch_size = MESSAGE_OVERHEAD
+    for file, size in sizes.items():
+        file_size = encoded_size(size)
+        if MESSAGE_OVERHEAD + file_size > max_size:
+            too_big.append(file)
+            continue
+        if batch and (per_file or batch_size + file_size > max_size):
+            batches.append(batch)
+            batch = []
+            batch_size = MESSAGE_OVERHEAD
+        batch.append(file)
+        batch_size += file_size
+    if batch:
+        batches.append(batch)
+    return batches, too_big
+
+
+def close_mails(mails: list[SpooledMail]):
+    """Close spooled mails, removing them from disk."""
+    for mail in mails:
+        mail.data.close()
+
+
+def send_mail(
+    send_from: str,
+    send_to: list[str],
+    subject: str,
+    message: str,
+    workspace_directory: str,
+    files: list[str] = [],
+):
+    """Send mail over a pooled SMTP session."""
+    msg = build_mail(send_from, send_to, subject, message, workspace_directory, files)
+    error = pool.send_messages([msg])[0]
+    msg.data.close()
+    if error:
+        raise error
 
 
 class SendFiles(Plugin):
@@ -80,6 +192,56 @@ class SendFiles(Plugin):
     output_model = Output
     arguments = input_model
 
+    def log_delivery(
+        self, batches: list[list[str]], sizes: dict[str, int], errors: list
+    ) -> list[str]:
+        """Log files per mail as mailed or error, getting the mailed files."""
+        mailed_files = []
+        for batch, error in zip(batches, errors):
+            for file in batch:
+                if error:
+                    self.log_file(file, "error")
+                else:
+                    mailed_files.append(file)
+                    self.log_file(file, "mailed", filesize=sizes[file])
+        return mailed_files
+
+    def delete_files(self, files: list[str]):
+        """Delete mailed files from the workspace."""
+        for file in files:
+            os.remove(os.path.join(self.get_variable("workspace_directory"), file))
+
+    def deliver(
+        self,
+        batches: list[list[str]],
+        sizes: dict[str, int],
+        messages: list[SpooledMail],
+    ) -> Future:
+        """Send mails in the background.
+
+        Gets a future of whether all files were mailed, set when the files are
+        logged. The task run waits for it before setting its status.
+        """
+        delivery: Future = Future()
+
+        def delivered(future):
+            try:
+                errors = future.result()
+            except Exception as exc:
+                errors = [exc] * len(batches)
+            try:
+                close_mails(messages)
+                mailed_files = self.log_delivery(batches, sizes, errors)
+                if self.arguments.delete_files:
+                    self.delete_files(mailed_files)
+            except Exception as exc:
+                delivery.set_exception(exc)
+                return None
+            delivery.set_result(len(mailed_files) == sum(map(len, batches)))
+
+        pool.submit(messages).add_done_callback(delivered)
+        return delivery
+
     def process(self):
         """Send mail with files."""
 
@@ -89,6 +251,7 @@ class SendFiles(Plugin):
         files_to_mail = []
         files = []
         mailed_files = []
+        pending_files = []
 
         if not self.arguments.from_address:
             raise ValueError("argument from_address can't be empty.")
@@ -108,56 +271,77 @@ class SendFiles(Plugin):
             if compare_filter(file, self.arguments.file_filter):
                 files_to_mail.append(file)
 
-        for file in files_to_mail:
-            add_file_log_entry(
-                task_run_id=self.get_variable("workspace_id"),
-                task_id=self.get_variable("task_id"),
-                step_id=self.get_variable("step_id"),
-                filename=file,
-                status="mailing",
+        files_left, mailed_before = self.split_completed_files(files_to_mail)
+        for file in files_left:
+            self.log_file(file, "mailing")
+
+        if files_left:
+            sizes = {
+                file: os.path.getsize(os.path.join(workspace_directory, file))
+                for file in files_left
+            }
+            batches, too_big = split_files(
+                sizes,
+                settings.SMTP_MAX_MESSAGE_SIZE,
+                bool(self.arguments.mail_per_file),
             )
+            for file in too_big:
+                logging.error(
+                    f"File '{file}' is too big to mail, "
+                    f"max message size is {settings.SMTP_MAX_MESSAGE_SIZE} bytes."
+                )
+                self.log_file(file, "error")
 
-        if files_to_mail:
+            messages = []
             try:
-                send_mail(
-                    self.arguments.from_address,
-                    self.arguments.to_addresses,
-                    self.arguments.subject,
-                    self.arguments.body,
-                    workspace_directory,
-                    files_to_mail,
+                throttle = bandwidth.Throttle(
+                    self.get_variable("host"), self.get_variable("task")
                 )
-            except Exception:
-                for file in files_to_mail:
-                    add_file_log_entry(
-                        task_run_id=self.get_variable("workspace_id"),
-                        task_id=self.get_variable("task_id"),
-                        step_id=self.get_variable("step_id"),
-                        filename=file,
-                        status="error",
+                # Appended one by one, so a failing batch closes the mails built before it.
+                for batch in batches:
+                    messages.append(
+                        build_mail(
+                            self.arguments.from_address,
+                            self.arguments.to_addresses,
+                            self.arguments.subject,
+                            self.arguments.body,
+                            workspace_directory,
+                            batch,
+                            bool(self.arguments.compress),
+                        )
                     )
-                error = True
+                    messages[-1].throttle = throttle
+                deliveries = self.get_variable("pending_deliveries")
+                if self.arguments.async_delivery and deliveries is not None:
+                    deliveries.append(self.deliver(batches, sizes, messages))
+                    pending_files = [file for batch in batches for file in batch]
+                else:
+                    errors = pool.send_messages(messages)
+                    close_mails(messages)
+                    mailed_files = self.log_delivery(batches, sizes, errors)
+            except Exception:
+                close_mails(messages)
+                for batch in batches:
+                    for file in batch:
+                        self.log_file(file, "error")
+                mailed_files = []
+                pending_files = []
+            error = len(mailed_files) + len(pending_files) < len(files_left)
+
+            if pending_files:
+                logging.info(
+                    f"Delivering files {pending_files} in the background to: "
+                    f"'{self.arguments.to_addresses}'."
+                )
             else:
-                for file in files_to_mail:
-                    mailed_files.append(file)
-                    size = os.path.getsize(os.path.join(workspace_directory, file))
-
-                    add_file_log_entry(
-                        task_run_id=self.get_variable("workspace_id"),
-                        task_id=self.get_variable("task_id"),
-                        step_id=self.get_variable("step_id"),
-                        filename=file,
-                        status="mailed",
-                        filesize=size,
-                    )
+                logging.info(
+                    f"Mailed files {mailed_files} to: '{self.arguments.to_addresses}'."
+                )
 
-            logging.info(
-                f"Mailed files {mailed_files} to: '{self.arguments.to_addresses}'."
-            )
+        mailed_files = mailed_before + mailed_files
 
-            if self.arguments.delete_files:
-                for file in mailed_files:
-                    os.remove(os.path.join(workspace_directory, file))
+        if self.arguments.delete_files:
+            self.delete_files(mailed_files)
 
         self.set_variable("found_files", files)
         self.set_variable("matched_files", files_to_mail)
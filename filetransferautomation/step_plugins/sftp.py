@@ -1,5 +1,4 @@
 """SFTP plugin."""
-import io
 import logging
 import os
 import time
@@ -9,7 +8,6 @@ import pysftp
 
 from filetransferautomation.common import compare_filter
 from filetransferautomation.hosts import get_host
-from filetransferautomation.logs import add_file_log_entry
 from filetransferautomation.plugin_collection import Plugin
 
 
@@ -60,70 +58,59 @@ class Download(Plugin):
         if host and host.host and host.username and host.password:
             cnopts = pysftp.CnOpts()
             cnopts.hostkeys = None  # type: ignore
-            with pysftp.Connection(
-                host.host,
-                username=host.username,
-                password=host.password,
-                port=host.port if host.port else 22,
-                cnopts=cnopts,
-            ) as sftp:
+            with self.host_breaker(), self.span("connect", host=host.name):
+                connection = pysftp.Connection(
+                    host.host,
+                    username=host.username,
+                    password=host.password,
+                    port=host.port if host.port else 22,
+                    cnopts=cnopts,
+                )
+            with connection as sftp:
                 if host.directory:
                     sftp.chdir(host.directory)
 
-                files = sftp.listdir()
+                with self.span("list"):
+                    files = sftp.listdir()
                 for file in files:
                     if compare_filter(file, self.arguments.file_filter):
                         files_to_download.append(file)
 
-                for file in files_to_download:
-                    add_file_log_entry(
-                        task_run_id=self.get_variable("workspace_id"),
-                        task_id=self.get_variable("task_id"),
-                        step_id=self.get_variable("step_id"),
-                        filename=file,
-                        status="downloading",
-                    )
+                files_left, downloaded_files = self.split_completed_files(
+                    files_to_download
+                )
+                for file in files_left:
+                    self.log_file(file, "downloading")
 
-                for file in files_to_download:
+                for file in files_left:
                     try:
                         start_time = time.time()
+                        transfer = self.track_transfer(file)
 
-                        fo_data = io.BytesIO()
-                        sftp.getfo(file, fo_data)
-                        fo_data.seek(0)
-
-                        with open(
+                        with self.host_transfer(), open(
                             os.path.join(workspace_directory, file), "wb"
-                        ) as to_file:
-                            to_file.write(fo_data.read())
+                        ) as to_file, self.span("transfer", file=file):
+                            sftp.getfo(file, to_file, callback=transfer.set)
                     except Exception:
-                        add_file_log_entry(
-                            task_run_id=self.get_variable("workspace_id"),
-                            task_id=self.get_variable("task_id"),
-                            step_id=self.get_variable("step_id"),
-                            filename=file,
-                            status="error",
-                        )
+                        self.log_file(file, "error")
                         error = True
                     else:
                         downloaded_files.append(file)
                         size = os.path.getsize(os.path.join(workspace_directory, file))
                         duration = time.time() - start_time
 
-                        add_file_log_entry(
-                            task_run_id=self.get_variable("workspace_id"),
-                            task_id=self.get_variable("task_id"),
-                            step_id=self.get_variable("step_id"),
-                            filename=file,
-                            status="downloaded",
+                        self.log_file(
+                            file,
+                            "downloaded",
                             duration_sec=duration,
                             filesize=size,
                             bytes_per_sec=size / duration,
                         )
 
                 if self.arguments.delete_files:
-                    for file in downloaded_files:
-                        sftp.remove(file)
+                    with self.span("delete"):
+                        for file in downloaded_files:
+                            sftp.remove(file)
 
         logging.info(f"Downloaded files {downloaded_files} from '{host.name}'.")
 
@@ -166,34 +153,32 @@ class Upload(Plugin):
         if host and host.host and host.username and host.password:
             cnopts = pysftp.CnOpts()
             cnopts.hostkeys = None  # type: ignore
-            with pysftp.Connection(
-                host.host,
-                username=host.username,
-                password=host.password,
-                port=host.port if host.port else 22,
-                cnopts=cnopts,
-            ) as sftp:
+            with self.host_breaker(), self.span("connect", host=host.name):
+                connection = pysftp.Connection(
+                    host.host,
+                    username=host.username,
+                    password=host.password,
+                    port=host.port if host.port else 22,
+                    cnopts=cnopts,
+                )
+            with connection as sftp:
                 if host.directory:
                     sftp.chdir(host.directory)
 
-                files = os.listdir(workspace_directory)
+                with self.span("list"):
+                    files = os.listdir(workspace_directory)
                 for file in files:
                     if compare_filter(file, self.arguments.file_filter):
                         files_to_upload.append(file)
 
-                for file in files_to_upload:
-                    add_file_log_entry(
-                        task_run_id=self.get_variable("workspace_id"),
-                        task_id=self.get_variable("task_id"),
-                        step_id=self.get_variable("step_id"),
-                        filename=file,
-                        status="uploading",
-                    )
+                files_left, uploaded_files = self.split_completed_files(files_to_upload)
+                for file in files_left:
+                    self.log_file(file, "uploading")
 
-                for file in files_to_upload:
+                for file in files_left:
                     try:
                         start_time = time.time()
-                        with open(
+                        with self.host_transfer(), open(
                             os.path.join(workspace_directory, file), "rb"
                         ) as from_file:
                             if not host.directory:
@@ -203,17 +188,17 @@ class Upload(Plugin):
                             if sftp.exists(filename[:-4]):
                                 sftp.unlink(filename[:-4])
 
-                            sftp.putfo(from_file, f"{filename}")
+                            transfer = self.track_transfer(
+                                file, os.fstat(from_file.fileno()).st_size
+                            )
+                            with self.span("transfer", file=file):
+                                sftp.putfo(
+                                    from_file, f"{filename}", callback=transfer.set
+                                )
 
-                            sftp.rename(filename, filename[:-4])
+                                sftp.rename(filename, filename[:-4])
                     except Exception:
-                        add_file_log_entry(
-                            task_run_id=self.get_variable("workspace_id"),
-                            task_id=self.get_variable("task_id"),
-                            step_id=self.get_variable("step_id"),
-                            filename=file,
-                            status="error",
-                        )
+                        self.log_file(file, "error")
                         error = True
                     else:
                         uploaded_files.append(file)
@@ -221,12 +206,9 @@ class Upload(Plugin):
                         size = os.path.getsize(os.path.join(workspace_directory, file))
                         duration = time.time() - start_time
 
-                        add_file_log_entry(
-                            task_run_id=self.get_variable("workspace_id"),
-                            task_id=self.get_variable("task_id"),
-                            step_id=self.get_variable("step_id"),
-                            filename=file,
-                            status="uploaded",
+                        self.log_file(
+                            file,
+                            "uploaded",
                             duration_sec=duration,
                             filesize=size,
                             bytes_per_sec=size / duration,
@@ -235,8 +217,9 @@ class Upload(Plugin):
         logging.info(f"Uploaded files {uploaded_files} to '{host.name}'.")
 
         if self.arguments.delete_files:
-            for file in uploaded_files:
-                os.remove(os.path.join(workspace_directory, file))
+            with self.span("delete"):
+                for file in uploaded_files:
+                    os.remove(os.path.join(workspace_directory, file))
 
         self.set_variable("found_files", files)
         self.set_variable("matched_files", files_to_upload)
@@ -8,8 +8,8 @@ import smbclient
 
 from filetransferautomation.common import compare_filter
 from filetransferautomation.hosts import get_host
-from filetransferautomation.logs import add_file_log_entry
 from filetransferautomation.plugin_collection import Plugin
+from filetransferautomation.transfer import copy_fileobj
 
 
 def unc_path_join(path, filename):
@@ -41,6 +41,7 @@ class Download(Plugin):
     input_model = Input
     output_model = Output
     arguments = input_model
+    parallel_files = True
 
     def process(self):
         """Download files from smb/cifs share."""
@@ -66,60 +67,59 @@ class Download(Plugin):
         downloaded_files = []
 
         if host:
-            smbclient.ClientConfig(username=host.username, password=host.password)
-            files = smbclient.listdir(host.share)
+            # smbclient connects on the first request, listing the share.
+            with self.host_breaker():
+                with self.span("connect", host=host.name):
+                    smbclient.ClientConfig(
+                        username=host.username, password=host.password
+                    )
+                with self.span("list"):
+                    files = smbclient.listdir(host.share)
             for file in files:
                 if compare_filter(file, self.arguments.file_filter):
                     files_to_download.append(file)
 
-        for file in files_to_download:
-            add_file_log_entry(
-                task_run_id=self.get_variable("workspace_id"),
-                task_id=self.get_variable("task_id"),
-                step_id=self.get_variable("step_id"),
-                filename=file,
-                status="downloading",
-            )
+        files_left, downloaded_files = self.split_completed_files(files_to_download)
+        for file in files_left:
+            self.log_file(file, "downloading")
 
-        for file in files_to_download:
+        def download(file):
+            nonlocal error
             try:
                 start_time = time.time()
-                with smbclient.open_file(
-                    unc_path_join(host.share, file), "rb"
-                ) as from_file:
-                    file_data = from_file.read()
-                with open(os.path.join(workspace_directory, file), "wb") as to_file:
-                    to_file.write(file_data)  # type: ignore
+                from_path = unc_path_join(host.share, file)
+                transfer = self.track_transfer(file, smbclient.stat(from_path).st_size)
+                to_path = os.path.join(workspace_directory, file)
+                with self.host_transfer(), smbclient.open_file(
+                    from_path, "rb"
+                ) as from_file, open(to_path, "wb") as to_file, self.span(
+                    "transfer", file=file
+                ):
+                    copy_fileobj(from_file, to_file, transfer.add)  # type: ignore
             except Exception:
-                add_file_log_entry(
-                    task_run_id=self.get_variable("workspace_id"),
-                    task_id=self.get_variable("task_id"),
-                    step_id=self.get_variable("step_id"),
-                    filename=file,
-                    status="error",
-                )
+                self.log_file(file, "error")
                 error = True
             else:
                 size = os.path.getsize(os.path.join(workspace_directory, file))
                 duration = time.time() - start_time
 
-                add_file_log_entry(
-                    task_run_id=self.get_variable("workspace_id"),
-                    task_id=self.get_variable("task_id"),
-                    step_id=self.get_variable("step_id"),
-                    filename=file,
-                    status="downloaded",
+                self.log_file(
+                    file,
+                    "downloaded",
                     filesize=size,
                     duration_sec=duration,
                     bytes_per_sec=size / duration,
                 )
                 downloaded_files.append(file)
 
+        self.transfer_files(files_left, download)
+
         logging.info(f"Downloaded files {downloaded_files} from '{host.name}'.")
 
         if self.arguments.delete_files:
-            for file in downloaded_files:
-                smbclient.remove(unc_path_join(host.share, file))
+            with self.span("delete"):
+                for file in downloaded_files:
+                    smbclient.remove(unc_path_join(host.share, file))
 
         smbclient.reset_connection_cache()
 
@@ -162,55 +162,47 @@ class Upload(Plugin):
         uploaded_files = []
 
         if host:
-            files = os.listdir(workspace_directory)
+            with self.span("list"):
+                files = os.listdir(workspace_directory)
             for file in files:
                 if compare_filter(file, self.arguments.file_filter):
                     files_to_upload.append(file)
 
-        for file in files_to_upload:
-            add_file_log_entry(
-                task_run_id=self.get_variable("workspace_id"),
-                task_id=self.get_variable("task_id"),
-                step_id=self.get_variable("step_id"),
-                filename=file,
-                status="uploading",
-            )
+        files_left, uploaded_files = self.split_completed_files(files_to_upload)
+        for file in files_left:
+            self.log_file(file, "uploading")
+
+        if files_left:
+            with self.host_breaker(), self.span("connect", host=host.name):
+                smbclient.ClientConfig(username=host.username, password=host.password)
+                smbclient.stat(host.share)
 
-        for file in files_to_upload:
+        for file in files_left:
             try:
                 start_time = time.time()
-                with open(os.path.join(workspace_directory, file), "rb") as from_file:
-                    file_data = from_file.read()
-
+                from_path = os.path.join(workspace_directory, file)
+                transfer = self.track_transfer(file, os.path.getsize(from_path))
+                with self.host_transfer(), open(from_path, "rb") as from_file:
                     smbclient.ClientConfig(
                         username=host.username, password=host.password
                     )
                     with smbclient.open_file(
                         unc_path_join(host.share, file), "wb"
-                    ) as to_file:
-                        to_file.write(file_data)  # type: ignore
+                    ) as to_file, self.span("transfer", file=file):
+                        copy_fileobj(from_file, to_file, transfer.add)  # type: ignore
                     smbclient.reset_connection_cache()
 
             except Exception:
-                add_file_log_entry(
-                    task_run_id=self.get_variable("workspace_id"),
-                    task_id=self.get_variable("task_id"),
-                    step_id=self.get_variable("step_id"),
-                    filename=file,
-                    status="error",
-                )
+                self.log_file(file, "error")
                 error = True
             else:
                 uploaded_files.append(file)
                 size = os.path.getsize(os.path.join(workspace_directory, file))
                 duration = time.time() - start_time
 
-                add_file_log_entry(
-                    task_run_id=self.get_variable("workspace_id"),
-                    task_id=self.get_variable("task_id"),
-                    step_id=self.get_variable("step_id"),
-                    filename=file,
-                    status="uploaded",
+                self.log_file(
+                    file,
+                    "uploaded",
                     duration_sec=duration,
                     filesize=size,
                     bytes_per_sec=size / duration,
@@ -219,8 +211,9 @@ class Upload(Plugin):
         logging.info(f"Uploaded files {uploaded_files} to '{host.name}'.")
 
         if self.arguments.delete_files:
-            for file in uploaded_files:
-                os.remove(os.path.join(workspace_directory, file))
+            with self.span("delete"):
+                for file in uploaded_files:
+                    os.remove(os.path.join(workspace_directory, file))
 
         self.set_variable("found_files", files)
         self.set_variable("matched_files", files_to_upload)
@@ -36,7 +36,7 @@ def get_active_steps():
 
 
 @router.get("")
-async def get_steps():
+def get_steps():
     """Get all steps."""
     with SessionLocal() as db:
         result = db.query(models.Step).all()
@@ -44,7 +44,7 @@ async def get_steps():
 
 
 @router.post("", status_code=201)
-async def add_step(step: shemas.AddStep):
+def add_step(step: shemas.AddStep):
     """Add a step."""
     with SessionLocal() as db:
         db_step = Step(**step.dict())
@@ -55,7 +55,7 @@ async def add_step(step: shemas.AddStep):
 
 
 @router.put("/{step_id}")
-async def update_step(step_id: int, step: shemas.AddStep):
+def update_step(step_id: int, step: shemas.AddStep):
     """Update a step."""
     with SessionLocal() as db:
         db_step = db.query(Step).filter(Step.step_id == step_id)
@@ -70,7 +70,7 @@ async def update_step(step_id: int, step: shemas.AddStep):
 
 
 @router.delete("/{step_id}", status_code=204)
-async def delete_step(step_id: int):
+def delete_step(step_id: int):
     """Delete a step."""
     with SessionLocal() as db:
         db_step = db.query(Step).filter(Step.step_id == step_id)
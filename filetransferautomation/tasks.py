@@ -1,33 +1,77 @@
 """Tasks api and data."""
 from __future__ import annotations
 
-import asyncio
+from collections.abc import Iterator
+from concurrent.futures import Future
+from contextlib import contextmanager
+import datetime
+from functools import partial
 import logging
 import os
 import shutil
 import threading
+import time
 import uuid
 
-from fastapi import APIRouter, HTTPException
-from sqlalchemy import and_
-from sqlalchemy.sql.functions import func
-
-from filetransferautomation import models, settings, shemas
+from fastapi import APIRouter, HTTPException, Query
+
+from filetransferautomation import (
+    diagnostics,
+    metrics,
+    models,
+    progress,
+    run_queue,
+    settings,
+    shemas,
+    tracing,
+)
 from filetransferautomation.database import SessionLocal
 from filetransferautomation.hosts import get_host
-from filetransferautomation.logs import add_step_log_entry, add_task_log_entry
-from filetransferautomation.models import FileLog, Task, TaskLog
-from filetransferautomation.plugin_collection import PluginCollection
+from filetransferautomation.logs import (
+    add_step_log_entry,
+    add_task_log_entry,
+    get_completed_files,
+    get_completed_steps,
+)
+from filetransferautomation.models import Task
+from filetransferautomation.plugin_collection import RunCancelledError, get_plugin
+from filetransferautomation.status_counts import STATUSES, get_status_counts
 
 router = APIRouter()
 
 
-def run_task(task_id: int):
-    """Run task."""
+@contextmanager
+def run_in_progress(task_run_id: str) -> Iterator[None]:
+    """Count a task run as in progress in the block, finishing it even on errors."""
+    metrics.TASK_RUNS_IN_PROGRESS.inc()
+    try:
+        yield None
+    finally:
+        progress.reporter.finish_run(task_run_id)
+        metrics.TASK_RUNS_IN_PROGRESS.dec()
+
+
+def run_task(
+    task_id: int,
+    task_run_id: str | None = None,
+    resume: bool = False,
+    cancelled: threading.Event | None = None,
+) -> str | None:
+    """Run task, getting the status of the run, None if it didn't run.
+
+    Resuming a run of an earlier attempt with the same task_run_id skips the steps
+    and files it completed, if its workspace directory is still there. Setting
+    cancelled stops the run before its next step or file, leaving its workspace
+    and task log to the attempt that resumes it.
+    """
 
-    task = asyncio.run(get_task(task_id))
+    try:
+        task = get_task(task_id)
+    except HTTPException:
+        task = None
 
-    workspace_id = str(uuid.uuid4())
+    workspace_id = task_run_id or str(uuid.uuid4())
+    workspace_directory = os.path.join(settings.WORK_DIR, workspace_id)
 
     if task:
         if task.active == 0:
@@ -37,123 +81,205 @@ def run_task(task_id: int):
             return None
 
         error = False
+        run_cancelled = False
+
+        completed_steps = set()
+        if resume and os.path.isdir(workspace_directory):
+            completed_steps = get_completed_steps(workspace_id)
+            logging.info(
+                f"Resuming task_run_id: {workspace_id}, completed steps {completed_steps}."
+            )
+        elif resume:
+            logging.warning(
+                f"Workspace of task_run_id: {workspace_id} is gone, running all steps."
+            )
+            resume = False
 
         logging.info(
             f"--- Running task '{task.name}', id: {task.task_id}, task_run_id: {workspace_id}, "
             f"thread {threading.get_native_id()}."
         )
-        add_task_log_entry(workspace_id, task.task_id, "running")
-
-        step_plugins = PluginCollection("filetransferautomation.step_plugins")
-
-        global_variables = {
-            "task_id": task.task_id,
-            "task_name": task.name,
-            "task": task,
-            "workspace_id": workspace_id,
-            "workspace_directory": os.path.join(settings.WORK_DIR, workspace_id),
-        }
-        logging.debug(f"{global_variables=}")
-
-        variables = {}
-
-        create_workspace_directory(global_variables)
-
-        for step in task.steps:
-            host = None
-            if step.host_id:
-                host = get_host(step.host_id)
-            variables = {
-                **variables,
-                "step_id": step.step_id,
-                "step": step,
-                "host_id": step.host_id,
-                "host": host,
-                "error": False,
-                "error_message": "",
+        tracing.tracer.start_run(workspace_id)
+        span = partial(tracing.tracer.span, workspace_id)
+        with run_in_progress(workspace_id), diagnostics.thread_run(
+            task_id=task.task_id, task_run_id=workspace_id
+        ), span("task", task_id=task.task_id, task_name=task.name):
+            with span("log", "log", status="running"):
+                add_task_log_entry(workspace_id, task.task_id, "running")
+
+            global_variables = {
+                "task_id": task.task_id,
+                "task_name": task.name,
+                "task": task,
+                "workspace_id": workspace_id,
+                "workspace_directory": workspace_directory,
+                "pending_deliveries": [],
+                "cancelled": cancelled,
             }
-            plugin_found = False
-            for plugin in step_plugins.plugins:
+            logging.debug(f"{global_variables=}")
+
+            variables = {}
+
+            if not resume:
+                with span("create workspace"):
+                    create_workspace_directory(global_variables)
+
+            for step in task.steps:
+                if cancelled and cancelled.is_set():
+                    run_cancelled = True
+                    break
                 if step.active == 0:
                     logging.info(
                         f"Step is not active. Skipping step, step_id: {step.step_id}, "
-                        f"script: {plugin.name.lower()}"
+                        f"script: {step.script.lower()}"
+                    )
+                    continue
+                if step.step_id in completed_steps:
+                    logging.info(
+                        f"Step completed by an earlier attempt. Skipping step, "
+                        f"step_id: {step.step_id}, script: {step.script.lower()}"
                     )
-                elif step.script.lower() == plugin.name.lower():
-                    plugin_found = True
-                    variables = run_step_process(
-                        global_variables, variables, step, plugin
+                    continue
+                with span("load plugin", script=step.script.lower()):
+                    plugin = get_plugin(step.script)
+                if not plugin:
+                    logging.error(f"Plugin script '{step.script.lower()}' not found.")
+                    error = True
+                    break
+                host = None
+                if step.host_id:
+                    with span("get host", host_id=step.host_id):
+                        host = get_host(step.host_id)
+                variables = {
+                    **variables,
+                    "step_id": step.step_id,
+                    "step": step,
+                    "host_id": step.host_id,
+                    "host": host,
+                    "error": False,
+                    "error_message": "",
+                    "completed_files": get_completed_files(workspace_id, step.step_id)
+                    if resume
+                    else set(),
+                }
+                variables = run_step_process(global_variables, variables, step, plugin)
+                if variables.get("run_cancelled"):
+                    run_cancelled = True
+                    break
+                if variables["error"]:
+                    logging.error(
+                        f"Error in step {step.step_id}, '{plugin.name.lower()}', "
+                        f"message: '{variables['error_message']}'."
                     )
-                    if variables["error"]:
-                        logging.error(
-                            f"Error in step {step.step_id}, '{plugin.name.lower()}', "
-                            f"message: '{variables['error_message']}'."
-                        )
+                    error = True
+                    break
+
+            if global_variables["pending_deliveries"] and not run_cancelled:
+                with span("wait deliveries"):
+                    if not wait_deliveries(global_variables["pending_deliveries"]):
                         error = True
-                        break
-            if not plugin_found:
-                logging.error(f"Plugin script '{step.script.lower()}' not found.")
+
+            if run_cancelled:
+                # A resumed attempt may already use the workspace and task log.
+                logging.warning(
+                    f"Task '{task.name}', id: {task.task_id}, task_run_id: "
+                    f"{workspace_id} cancelled, its worker lost the lease."
+                )
                 error = True
-                break
-            if error:
-                break
+            elif not error or not workspace_directory_files(global_variables):
+                with span("delete workspace"):
+                    delete_workspace_directory(global_variables)
 
-        if not error or (error and not workspace_directory_files(global_variables)):
-            delete_workspace_directory(global_variables)
+            if not run_cancelled:
+                with span("log", "log", status="error" if error else "success"):
+                    if error:
+                        logging.error(
+                            f"Error in task '{task.name}', id: {task.task_id}, "
+                            f"task_run_id: {workspace_id} halted."
+                        )
+                        add_task_log_entry(workspace_id, task.task_id, "error")
+                    else:
+                        logging.info(
+                            f"Task '{task.name}', id: {task.task_id}, "
+                            f"task_run_id: {workspace_id} completed."
+                        )
+                        add_task_log_entry(workspace_id, task.task_id, "success")
 
-        if error:
-            logging.error(
-                f"Error in task '{task.name}', id: {task.task_id}, "
-                f"task_run_id: {workspace_id} halted."
-            )
-            add_task_log_entry(workspace_id, task.task_id, "error")
-        else:
-            logging.info(
-                f"Task '{task.name}', id: {task.task_id}, task_run_id: {workspace_id} completed."
-            )
-            add_task_log_entry(workspace_id, task.task_id, "success")
+        metrics.TASK_RUNS.inc(status="error" if error else "success")
 
         logging.info(
             f"--- Exiting task '{task.name}', id: {task.task_id}, task_run_id: {workspace_id}, "
             f"thread {threading.get_native_id()}."
         )
+        return "error" if error else "success"
 
-    else:
-        logging.error(f"Task id: {task.task_id}, not found.")
+    logging.error(f"Task id: {task_id}, not found.")
+    return None
 
 
 def run_step_process(global_variables, variables, step, plugin):
     """Run plugin for step in task."""
-    add_step_log_entry(
-        global_variables["workspace_id"],
-        global_variables["task_id"],
-        step.step_id,
-        "running",
-    )
+    diagnostics.set_thread_run(step_id=step.step_id, script=plugin.name.lower())
+    span = partial(tracing.tracer.span, global_variables["workspace_id"])
+    with span("step", step_id=step.step_id, script=plugin.name.lower()):
+        with span("log", "log", status="running"):
+            add_step_log_entry(
+                global_variables["workspace_id"],
+                global_variables["task_id"],
+                step.step_id,
+                "running",
+            )
 
-    logging.debug(
-        f"--- Running step '{plugin.name.lower()}', "
-        f"input arguments={step.arguments}, {variables=}."
-    )
-    try:
-        tmp = plugin(step.arguments, {**variables, **global_variables})
-        tmp.process()
-        variables = tmp.variables
-    except Exception as exc:
-        variables["error"] = True
-        variables["error_message"] = exc
-
-    add_step_log_entry(
-        global_variables["workspace_id"],
-        global_variables["task_id"],
-        step.step_id,
-        "error" if variables["error"] else "success",
-    )
-    logging.debug(f"--- Step '{plugin.name.lower()}' done, output {variables=}.")
+        logging.debug(
+            f"--- Running step '{plugin.name.lower()}', "
+            f"input arguments={step.arguments}, {variables=}."
+        )
+        start_time = time.time()
+        try:
+            with span("init plugin"):
+                tmp = plugin(step.arguments, {**variables, **global_variables})
+            with tmp.host_session():
+                tmp.process()
+            variables = tmp.variables
+        except RunCancelledError:
+            variables["run_cancelled"] = True
+            return variables
+        except Exception as exc:
+            variables["error"] = True
+            variables["error_message"] = exc
+        metrics.STEP_DURATION.observe(
+            time.time() - start_time,
+            script=plugin.name.lower(),
+            status="error" if variables["error"] else "success",
+        )
+
+        status = "error" if variables["error"] else "success"
+        with span("log", "log", status=status):
+            add_step_log_entry(
+                global_variables["workspace_id"],
+                global_variables["task_id"],
+                step.step_id,
+                status,
+            )
+        logging.debug(f"--- Step '{plugin.name.lower()}' done, output {variables=}.")
 
     return variables
 
 
+def wait_deliveries(deliveries: list[Future]) -> bool:
+    """Wait for background deliveries of steps, getting whether all succeeded."""
+    delivered = True
+    for delivery in deliveries:
+        try:
+            delivered = delivery.result() and delivered
+        except Exception as exc:
+            logging.error(f"Error in background delivery, message: '{exc}'.")
+            delivered = False
+    if not delivered:
+        logging.error("Files of background deliveries failed to deliver.")
+    return delivered
+
+
 def workspace_directory_files(global_variables) -> list:
     """List all files in workspace directory."""
     files = os.listdir(global_variables["workspace_directory"])
@@ -176,59 +302,19 @@ def create_workspace_directory(global_variables):
     )
 
 
-def run_task_threaded(task: int):
-    """Run task in thread."""
-    new_thread = threading.Thread(target=run_task, args=(task,))
-    new_thread.start()
-
-
 @router.get("/status")
-async def get_status():
-    """Get tasks status."""
-    return_data = []
+def get_status(days: int | None = Query(None, ge=1)):
+    """Get tasks status, optionally for runs started the last number of days."""
+    since = None
+    if days:
+        since = datetime.date.today() - datetime.timedelta(days=days - 1)
     with SessionLocal() as db:
-        for status in ("success", "error", "running", "no_files"):
-            if status == "success":
-                tmp = (
-                    db.query(TaskLog.status, func.count(TaskLog.joblog_id))
-                    .join(FileLog, FileLog.task_run_id == TaskLog.task_run_id)
-                    .where(TaskLog.status == status)
-                    .group_by(TaskLog.status)
-                    .one_or_none()
-                )
-            elif status == "no_files":
-                tmp = (
-                    db.query(TaskLog.status, func.count(TaskLog.joblog_id))
-                    .join(
-                        FileLog,
-                        FileLog.task_run_id == TaskLog.task_run_id,
-                        isouter=True,
-                    )
-                    .where(
-                        and_(
-                            TaskLog.status == "success",
-                            FileLog.filelog_id.is_(None),
-                        )
-                    )
-                    .group_by(TaskLog.status)
-                    .one_or_none()
-                )
-            else:
-                tmp = (
-                    db.query(TaskLog.status, func.count(TaskLog.joblog_id))
-                    .where(TaskLog.status == status)
-                    .group_by(TaskLog.status)
-                    .one_or_none()
-                )
-            if tmp:
-                return_data.append({"status": status, "count": tmp[1]})
-            else:
-                return_data.append({"status": status, "count": 0})
-    return return_data
+        counts = get_status_counts(db, since)
+    return [{"status": status, "count": counts[status]} for status in STATUSES]
 
 
 @router.get("/{task_id}")
-async def get_task(task_id: int):
+def get_task(task_id: int):
     """Get a task."""
     with SessionLocal() as db:
         db_task = (
@@ -236,35 +322,35 @@ async def get_task(task_id: int):
         )
         if not db_task:
             raise HTTPException(status_code=404, detail="task not found")
-        db_task.schedules = await get_task_schedules(db_task.task_id)
-        db_task.steps = await get_task_steps(db_task.task_id)
+        db_task.schedules = get_task_schedules(db_task.task_id)
+        db_task.steps = get_task_steps(db_task.task_id)
         return db_task
 
 
 @router.get("/active")
-async def get_active_tasks():
+def get_active_tasks():
     """Get all active tasks."""
     with SessionLocal() as db:
         result = db.query(models.Task).filter(models.Task.active == 1).all()
         for row in result:
-            row.schedules = await get_task_schedules(row.task_id)
-            row.steps = await get_task_steps(row.task_id)
+            row.schedules = get_task_schedules(row.task_id)
+            row.steps = get_task_steps(row.task_id)
         return result
 
 
 @router.get("")
-async def get_tasks():
+def get_tasks():
     """Get all tasks."""
     with SessionLocal() as db:
         result = db.query(models.Task).all()
         for row in result:
-            row.schedules = await get_task_schedules(row.task_id)
-            row.steps = await get_task_steps(row.task_id)
+            row.schedules = get_task_schedules(row.task_id)
+            row.steps = get_task_steps(row.task_id)
         return result
 
 
 @router.post("", status_code=201)
-async def add_task(task: shemas.AddTask):
+def add_task(task: shemas.AddTask):
     """Add a task."""
     with SessionLocal() as db:
         db_task = Task(**task.dict())
@@ -275,7 +361,7 @@ async def add_task(task: shemas.AddTask):
 
 
 @router.put("/{task_id}")
-async def update_task(task_id: int, task: shemas.AddTask):
+def update_task(task_id: int, task: shemas.AddTask):
     """Update a task."""
     with SessionLocal() as db:
         db_task = db.query(Task).filter(Task.task_id == task_id)
@@ -290,7 +376,7 @@ async def update_task(task_id: int, task: shemas.AddTask):
 
 
 @router.delete("/{task_id}", status_code=204)
-async def delete_task(task_id: int):
+def delete_task(task_id: int):
     """Delete a task."""
     with SessionLocal() as db:
         db_task = db.query(models.Task).filter(models.Task.task_id == task_id)
@@ -303,7 +389,7 @@ async def delete_task(task_id: int):
 
 
 @router.get("/{task_id}/steps")
-async def get_task_steps(task_id: int):
+def get_task_steps(task_id: int):
     """Get all tasks steps."""
     with SessionLocal() as db:
         result = (
@@ -319,7 +405,7 @@ async def get_task_steps(task_id: int):
 
 
 @router.get("/{task_id}/schedules")
-async def get_task_schedules(task_id: int):
+def get_task_schedules(task_id: int):
     """Get a tasks schedules."""
     with SessionLocal() as db:
         db_task = (
@@ -329,7 +415,7 @@ async def get_task_schedules(task_id: int):
 
 
 @router.delete("/{task_id}/schedules/{schedule_id}", status_code=204)
-async def delete_schedule(task_id: int, schedule_id: int):
+def delete_schedule(task_id: int, schedule_id: int):
     """Delete a schedule."""
     with SessionLocal() as db:
         db_schedule = db.query(models.Schedule).filter(
@@ -345,10 +431,10 @@ async def delete_schedule(task_id: int, schedule_id: int):
 
 
 @router.post("/{task_id}/run")
-async def run_task_now(task_id: int):
-    """Run a task."""
-    db_task = await get_task(task_id)
+def run_task_now(task_id: int):
+    """Queue a run of a task, for a worker to run."""
+    db_task = get_task(task_id)
     if not db_task:
         raise HTTPException(status_code=404, detail="task not found")
-    run_task_threaded(db_task.task_id)
+    run_queue.enqueue(db_task.task_id)
     return None
@@ -0,0 +1,79 @@
+"""Per task run timeline tracing, exported as Chrome trace events."""
+from __future__ import annotations
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import os
+import random
+import threading
+import time
+
+from filetransferautomation import settings
+
+
+class Tracer:
+    """Keeps spans of sampled task runs in memory."""
+
+    def __init__(self):
+        """Init."""
+        self._lock = threading.Lock()
+        self._runs: OrderedDict[str, list[dict]] = OrderedDict()
+
+    def start_run(self, task_run_id: str) -> bool:
+        """Decide if a task run is traced, dropping the oldest traced runs."""
+        if random.random() >= settings.TRACE_SAMPLE_RATE:
+            return False
+        with self._lock:
+            self._runs[task_run_id] = []
+            while len(self._runs) > settings.TRACE_RETAIN_RUNS:
+                self._runs.popitem(last=False)
+        return True
+
+    def is_traced(self, task_run_id: str) -> bool:
+        """Check if a task run is traced."""
+        with self._lock:
+            return task_run_id in self._runs
+
+    @contextmanager
+    def span(self, task_run_id: str, name: str, category: str = "task", **args):
+        """Record the time spent in the block as a span of a traced task run."""
+        if not self.is_traced(task_run_id):
+            yield
+            return None
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            event = {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": int(start_time * 1_000_000),
+                "dur": int((time.time() - start_time) * 1_000_000),
+                "pid": os.getpid(),
+                "tid": threading.get_native_id(),
+                "args": {key: str(value) for key, value in args.items()},
+            }
+            with self._lock:
+                if task_run_id in self._runs:
+                    self._runs[task_run_id].append(event)
+
+    def traced_runs(self) -> list[str]:
+        """List traced task runs, oldest first."""
+        with self._lock:
+            return list(self._runs)
+
+    def chrome_trace(self, task_run_id: str) -> dict | None:
+        """Get spans of a task run in Chrome Trace Event format."""
+        with self._lock:
+            if task_run_id not in self._runs:
+                return None
+            events = sorted(self._runs[task_run_id], key=lambda event: event["ts"])
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {"task_run_id": task_run_id},
+        }
+
+
+tracer = Tracer()
@@ -0,0 +1,26 @@
+"""Shared helpers for plugin transfer loops."""
+from __future__ import annotations
+
+from collections.abc import Callable
+from typing import BinaryIO
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def copy_fileobj(
+    from_file: BinaryIO,
+    to_file: BinaryIO,
+    callback: Callable[[int], None] | None = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> int:
+    """Copy file data in chunks, calling callback with the size of each chunk."""
+    done = 0
+    while True:
+        chunk = from_file.read(chunk_size)
+        if not chunk:
+            break
+        to_file.write(chunk)
+        done += len(chunk)
+        if callback:
+            callback(len(chunk))
+    return done
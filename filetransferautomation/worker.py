@@ -0,0 +1,97 @@
+"""Worker running task runs claimed from the run queue."""
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+
+from filetransferautomation import run_queue, settings, tasks
+from filetransferautomation.leases import PROCESS_ID
+
+
+class Worker:
+    """Runs claimed task runs in threads, up to WORKER_CONCURRENCY at a time."""
+
+    def __init__(self, worker_id: str = PROCESS_ID):
+        """Init."""
+        self.worker_id = worker_id
+        self.run_ids: set[int] = set()
+        # Set to stop the run of a lost lease, before it writes more files.
+        self.cancelled: dict[int, threading.Event] = {}
+        self.next_heartbeat = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> int:
+        """Number of runs in progress."""
+        return len(self.run_ids)
+
+    def run(self, run: run_queue.ClaimedRun):
+        """Run a claimed task run and record its status."""
+        status = "error"
+        try:
+            status = (
+                tasks.run_task(
+                    run.task_id,
+                    run.task_run_id,
+                    resume=run.attempts > 1,
+                    cancelled=self.cancelled[run.run_id],
+                )
+                or "skipped"
+            )
+        finally:
+            try:
+                run_queue.finish(run.run_id, self.worker_id, status)
+            finally:
+                with self._lock:
+                    self.run_ids.discard(run.run_id)
+                    self.cancelled.pop(run.run_id, None)
+                run_queue.wakeup.set()
+
+    def heartbeat(self):
+        """Renew the leases of the runs in progress and recover expired runs."""
+        with self._lock:
+            run_ids = list(self.run_ids)
+        lost = run_queue.heartbeat(self.worker_id, run_ids, settings.RUN_LEASE_SEC)
+        for run_id in lost:
+            logging.warning(
+                f"Worker '{self.worker_id}' lost the lease of run {run_id}, "
+                "stopping it."
+            )
+            with self._lock:
+                if run_id in self.cancelled:
+                    self.cancelled[run_id].set()
+        run_queue.recover_expired(
+            self.worker_id, settings.RUN_MAX_ATTEMPTS, settings.RUN_LEASE_SEC
+        )
+
+    def poll(self) -> int:
+        """Claim runs for the free slots and start them, getting how many started."""
+        if time.monotonic() >= self.next_heartbeat:
+            self.next_heartbeat = time.monotonic() + settings.RUN_HEARTBEAT_SEC
+            self.heartbeat()
+        with self._lock:
+            free = settings.WORKER_CONCURRENCY - len(self.run_ids)
+        claimed = run_queue.claim(self.worker_id, free, settings.RUN_LEASE_SEC)
+        for run in claimed:
+            with self._lock:
+                self.run_ids.add(run.run_id)
+                self.cancelled[run.run_id] = threading.Event()
+            threading.Thread(
+                target=self.run, args=(run,), name=f"run-{run.run_id}"
+            ).start()
+        return len(claimed)
+
+
+async def run_worker(worker: Worker | None = None) -> None:
+    """Run queued task runs, polling the queue and renewing the leases of runs."""
+    worker = worker or Worker()
+    logging.info(f"Worker '{worker.worker_id}' started.")
+    while True:
+        run_queue.wakeup.clear()
+        try:
+            await asyncio.to_thread(worker.poll)
+        except Exception as exc:
+            logging.error(f"Claiming queued runs failed, message: '{exc}'.")
+        await asyncio.to_thread(run_queue.wakeup.wait, settings.WORKER_POLL_SEC)
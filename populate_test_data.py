@@ -1,22 +1,23 @@
-"""Populate test data for dev."""
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+"""Populate test data for dev, or generated tasks for load tests.
 
-from filetransferautomation import models, settings
+python populate_test_data.py
+python populate_test_data.py --tasks 10000 --steps 2 --cron "*/5 * * * *"
+"""
+import argparse
 
-SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.orm import Session, sessionmaker
+
+from filetransferautomation import migrations, models, settings
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    # connect_args={"check_same_thread": False},
-    # echo=True,
-)
+SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+LOAD_TEST_SCRIPT = "local_directory_download_files"
+LOAD_TEST_ARGUMENTS = '{"file_filter":"*.txt"}'
 
-models.Base.metadata.create_all(bind=engine)
 
-with SessionLocal() as db:
+def add_dev_data(db: Session):
+    """Add local directory hosts and a task moving *.txt files every minute."""
     sql = []
     sql.append(
         models.Host(
@@ -63,4 +64,87 @@ with SessionLocal() as db:
     )
     sql.append(models.Task(task_id=1, name="test", description="", active=1))
     db.add_all(sql)
-    db.commit()
+
+
+def add_load_test_data(
+    db: Session,
+    task_count: int,
+    steps_per_task: int = 1,
+    cron: str = "*/1 * * * *",
+    script: str = LOAD_TEST_SCRIPT,
+    arguments: str = LOAD_TEST_ARGUMENTS,
+    host_id: int | None = None,
+) -> list[int]:
+    """Add active tasks with steps and a cron schedule each, getting the task ids."""
+    first_id = (db.scalar(select(func.max(models.Task.task_id))) or 0) + 1
+    task_ids = list(range(first_id, first_id + task_count))
+    db.execute(
+        insert(models.Task),
+        [
+            {
+                "task_id": task_id,
+                "name": f"load test {task_id}",
+                "description": "",
+                "active": 1,
+            }
+            for task_id in task_ids
+        ],
+    )
+    db.execute(
+        insert(models.Step),
+        [
+            {
+                "task_id": task_id,
+                "sort_order": (number + 1) * 10,
+                "host_id": host_id,
+                "script": script,
+                "arguments": arguments,
+                "active": 1,
+            }
+            for task_id in task_ids
+            for number in range(steps_per_task)
+        ],
+    )
+    db.execute(
+        insert(models.Schedule),
+        [{"task_id": task_id, "cron": cron} for task_id in task_ids],
+    )
+    return task_ids
+
+
+def main():
+    """Populate database."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--tasks", type=int, default=0, help="add this many generated tasks"
+    )
+    parser.add_argument("--steps", type=int, default=1, help="steps per task")
+    parser.add_argument("--cron", default="*/1 * * * *", help="schedule per task")
+    parser.add_argument("--script", default=LOAD_TEST_SCRIPT, help="step script")
+    parser.add_argument(
+        "--arguments", default=LOAD_TEST_ARGUMENTS, help="step arguments"
+    )
+    args = parser.parse_args()
+
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        # connect_args={"check_same_thread": False},
+        # echo=True,
+    )
+
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    migrations.upgrade(engine)
+
+    with SessionLocal() as db:
+        if args.tasks:
+            add_load_test_data(
+                db, args.tasks, args.steps, args.cron, args.script, args.arguments
+            )
+        else:
+            add_dev_data(db)
+        db.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""Test bandwidth shaping."""
+from pydantic import ValidationError
+import pytest
+
+from filetransferautomation import bandwidth, settings
+from filetransferautomation.bandwidth import PRIORITIES, Throttle, TokenBucket
+from filetransferautomation.models import Host, Task
+from filetransferautomation.shemas import AddHost, AddTask
+
+
+def test_token_bucket():
+    """Test a bucket allows a burst, then holds back less urgent priorities more."""
+    high, normal, low = (PRIORITIES.index(name) for name in PRIORITIES)
+    bucket = TokenBucket(1000, burst=1000)
+    assert bucket.reserve(1000, low) == 0
+    assert bucket.reserve(1000, low) == pytest.approx(1, abs=0.05)
+    assert bucket.reserve(1000, high) == 0
+    assert bucket.reserve(500, normal) == pytest.approx(0.5, abs=0.05)
+    assert bucket.reserve(500, low) == pytest.approx(3, abs=0.05)
+
+
+def test_throttle(monkeypatch):
+    """Test a transfer passes through the buckets of the positive limits set."""
+    monkeypatch.setattr(bandwidth, "_buckets", {})
+    monkeypatch.setattr(settings, "BANDWIDTH_LIMIT", 0)
+    host = Host(host_id=1, name="partner", max_bytes_per_sec=1000)
+    task = Task(task_id=1, name="urgent", priority="high")
+    throttle = Throttle(host, task)
+    assert (throttle.priority, len(throttle.buckets)) == ("high", 1)
+    assert Throttle(None, None).priority == "normal"
+
+    host.max_bytes_per_sec = 2000
+    Throttle(host, task)
+    assert bandwidth._buckets[("host", 1)].rate == 2000
+
+    task.max_bytes_per_sec = -1
+    assert len(Throttle(host, task).buckets) == 1
+    with pytest.raises(ValidationError):
+        AddTask(name="urgent", max_bytes_per_sec=-1)
+    with pytest.raises(ValidationError):
+        AddHost(name="partner", type="local_directory", max_bytes_per_sec=0)
@@ -0,0 +1,89 @@
+"""Test per host circuit breakers."""
+import pytest
+
+from filetransferautomation import circuit_breaker, settings
+from filetransferautomation.circuit_breaker import CircuitOpenError
+from filetransferautomation.models import Host
+
+
+def connect(host, error=None):
+    """Connect to a host in the guard, failing with error if set."""
+    with circuit_breaker.guard(host):
+        if error:
+            raise error
+
+
+@pytest.fixture(autouse=True)
+def no_breakers(monkeypatch):
+    """Start without breakers."""
+    monkeypatch.setattr(circuit_breaker, "_breakers", {})
+
+
+def test_circuit_breaker(monkeypatch, use_database):
+    """Test a circuit opens on failures, fails fast and closes after a trial."""
+    use_database(circuit_breaker)
+    monkeypatch.setattr(settings, "CIRCUIT_FAILURE_THRESHOLD", 2)
+    monkeypatch.setattr(settings, "CIRCUIT_OPEN_SEC", 0)
+    host = Host(host_id=1, name="partner")
+
+    with pytest.raises(ConnectionRefusedError):
+        connect(host, ConnectionRefusedError("refused"))
+    connect(host)
+    for _ in range(2):
+        with pytest.raises(TimeoutError):
+            connect(host, TimeoutError("timed out"))
+    assert circuit_breaker.get_state(1)["state"] == "open"
+
+    # Half open once CIRCUIT_OPEN_SEC passed, a failed trial opens it again.
+    with pytest.raises(TimeoutError):
+        connect(host, TimeoutError("timed out"))
+    assert circuit_breaker.get_state(1)["state"] == "open"
+
+    monkeypatch.setattr(settings, "CIRCUIT_OPEN_SEC", 60)
+    with pytest.raises(CircuitOpenError):
+        connect(host)
+    monkeypatch.setattr(settings, "CIRCUIT_OPEN_SEC", 0)
+    breaker = circuit_breaker.get_breaker(host)
+    breaker.before_connect()
+    with pytest.raises(CircuitOpenError):
+        connect(host)
+    breaker.success()
+    assert circuit_breaker.get_state(1) == {
+        "state": "closed",
+        "failures": 0,
+        "last_error": "timed out",
+        "retry_in_sec": None,
+    }
+    assert circuit_breaker.get_state(2)["state"] == "closed"
+
+
+def test_stored_state(monkeypatch, use_database):
+    """Test the state is read back from the database, as other processes see it."""
+    use_database(circuit_breaker)
+    monkeypatch.setattr(settings, "CIRCUIT_FAILURE_THRESHOLD", 1)
+    monkeypatch.setattr(settings, "CIRCUIT_OPEN_SEC", 60)
+    with pytest.raises(TimeoutError):
+        connect(Host(host_id=1, name="partner"), TimeoutError("timed out"))
+    connect(Host(host_id=2, name="other"))
+
+    monkeypatch.setattr(circuit_breaker, "_breakers", {})
+    states = circuit_breaker.get_states()
+    assert list(states) == [1]
+    assert (states[1]["state"], states[1]["last_error"]) == ("open", "timed out")
+    assert 59 < states[1]["retry_in_sec"] <= 60
+
+
+def test_interrupted_trial(monkeypatch, use_database):
+    """Test a trial connection ended by a BaseException lets the next trial through."""
+    use_database(circuit_breaker)
+    monkeypatch.setattr(settings, "CIRCUIT_FAILURE_THRESHOLD", 1)
+    monkeypatch.setattr(settings, "CIRCUIT_OPEN_SEC", 0)
+    host = Host(host_id=1, name="partner")
+    with pytest.raises(TimeoutError):
+        connect(host, TimeoutError("timed out"))
+
+    with pytest.raises(KeyboardInterrupt):
+        connect(host, KeyboardInterrupt())
+    assert circuit_breaker.get_state(1)["state"] == "half_open"
+    connect(host)
+    assert circuit_breaker.get_state(1)["state"] == "closed"
@@ -0,0 +1,21 @@
+"""Test the command line task runner."""
+import threading
+
+from filetransferautomation import cli, tasks
+
+
+def test_run_tasks(monkeypatch):
+    """Test tasks run in parallel and the worst status sets the exit code."""
+    statuses = {1: "success", 2: "error", 3: None}
+    started = threading.Barrier(3, timeout=5)
+
+    def run_task(task_id):
+        started.wait()
+        return statuses[task_id]
+
+    monkeypatch.setattr(tasks, "run_task", run_task)
+    assert cli.run_tasks([1, 2, 3], parallel=3) == statuses
+
+    assert cli.exit_code({1: "success"}) == cli.EXIT_SUCCESS
+    assert cli.exit_code({1: "success", 3: None}) == cli.EXIT_NOT_RUN
+    assert cli.exit_code(statuses) == cli.EXIT_ERROR
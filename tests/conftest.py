@@ -0,0 +1,23 @@
+"""Shared test fixtures."""
+from collections.abc import Callable
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from filetransferautomation import migrations
+
+
+@pytest.fixture
+def use_database(monkeypatch, tmp_path) -> Callable[..., sessionmaker]:
+    """Get a function using a new database as the SessionLocal of modules."""
+    engine = create_engine(f"sqlite:///{tmp_path}/test.db")
+    migrations.upgrade(engine)
+    session = sessionmaker(bind=engine)
+
+    def use(*modules) -> sessionmaker:
+        for module in modules:
+            monkeypatch.setattr(module, "SessionLocal", session)
+        return session
+
+    return use
@@ -0,0 +1,38 @@
+"""Test the SQLite engine profile and the writer thread."""
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+from sqlalchemy import create_engine, event, text
+
+from filetransferautomation import database, settings
+
+
+def test_sqlite_pragmas(tmp_path):
+    """Test SQLite file connections use WAL, the page cache and busy timeout."""
+    engine = create_engine(f"sqlite:///{tmp_path}/test.db")
+    event.listen(engine, "connect", database.set_sqlite_pragmas)
+    with engine.connect() as connection:
+        pragma = lambda name: connection.execute(text(f"PRAGMA {name}")).scalar()
+        assert pragma("journal_mode") == "wal"
+        assert pragma("synchronous") == 1
+        assert pragma("cache_size") == -settings.SQLITE_CACHE_SIZE_KB
+        assert pragma("busy_timeout") == int(settings.SQLITE_BUSY_TIMEOUT_SEC * 1000)
+
+
+def test_serialized_write(monkeypatch):
+    """Test writes run on the writer thread, also when nested or disabled."""
+    writer = ThreadPoolExecutor(1, thread_name_prefix=database.WRITER_THREAD_NAME)
+    monkeypatch.setattr(database, "writer", writer)
+
+    @database.serialized_write
+    def write(nested: bool = False):
+        thread = threading.current_thread().name
+        return [thread, *write()] if nested else [thread]
+
+    threads = write(nested=True)
+    assert threads[0] == threads[1]
+    assert threads[0].startswith(database.WRITER_THREAD_NAME)
+    writer.shutdown()
+
+    monkeypatch.setattr(database, "writer", None)
+    assert write() == [threading.current_thread().name]
@@ -0,0 +1,56 @@
+"""Test process diagnostics."""
+import threading
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import pytest
+
+from filetransferautomation import diagnostics
+
+
+def busy_step(stop: threading.Event):
+    """Pretend to run a task step until stopped."""
+    diagnostics.set_thread_run(task_id=7, task_run_id="run", step_id=3)
+    while not stop.is_set():
+        time.sleep(0.001)
+    diagnostics.clear_thread_run()
+
+
+def test_sample_stacks():
+    """Test stacks of task threads are sampled and labeled with task and step."""
+    stop = threading.Event()
+    thread = threading.Thread(target=busy_step, args=(stop,))
+    thread.start()
+    try:
+        time.sleep(0.05)
+        stacks = diagnostics.sample_stacks(0.1, 0.01, tasks_only=True)
+    finally:
+        stop.set()
+        thread.join()
+
+    assert stacks
+    for stack in stacks:
+        assert stack.startswith("task_id=7;step_id=3;")
+        assert "diagnostics_test:busy_step" in stack
+    assert thread.ident not in diagnostics.thread_runs()
+
+
+def test_thread_run_cleared_on_error():
+    """Test task run info of a thread is cleared when the run fails."""
+    with pytest.raises(RuntimeError), diagnostics.thread_run(task_id=7):
+        assert diagnostics.thread_runs()[threading.get_ident()] == {"task_id": 7}
+        raise RuntimeError("failed")
+    assert threading.get_ident() not in diagnostics.thread_runs()
+
+
+def test_stacks_interval_validated():
+    """Test a sampling interval below 1 ms is refused instead of busy looping."""
+    app = FastAPI()
+    app.include_router(diagnostics.router, prefix="/diagnostics")
+    client = TestClient(app)
+    for interval_ms in (0, -1):
+        response = client.get(
+            "/diagnostics/stacks", params={"seconds": 1, "interval_ms": interval_ms}
+        )
+        assert response.status_code == 422
@@ -0,0 +1,28 @@
+"""Test directory index paging."""
+from filetransferautomation import directory_index
+
+
+def test_listing_pages(tmp_path):
+    """Test pages continue after the cursor for each sort and order."""
+    for number in range(10):
+        (tmp_path / f"file{number}.{'txt' if number % 2 else 'csv'}").write_bytes(
+            b"x" * (number % 3)
+        )
+    (tmp_path / ".upload-part").write_bytes(b"")
+    listing = directory_index.DirectoryListing(str(tmp_path), ".upload-")
+
+    for sort in directory_index.SORT_KEYS:
+        for descending in (False, True):
+            names = []
+            after = None
+            while True:
+                page, after = listing.page(sort, descending, "*.txt", 2, after)
+                names += [file["name"] for file in page]
+                if not after:
+                    break
+                after = directory_index.decode_cursor(
+                    directory_index.encode_cursor(after)
+                )
+            expected = [file["name"] for file in listing.page(sort, descending)[0]]
+            assert names == [name for name in expected if name.endswith(".txt")]
+            assert len(names) == 5
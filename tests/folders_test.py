@@ -0,0 +1,83 @@
+"""Test folder uploads."""
+import asyncio
+import hashlib
+import io
+import os
+from types import SimpleNamespace
+import zipfile
+
+from fastapi import HTTPException, UploadFile
+import pytest
+
+from filetransferautomation import archive, folders
+
+
+def test_save_file(tmp_path):
+    """Test files are saved to a temp file, removed when the checksum mismatches."""
+    path = tmp_path / "test.txt"
+    data = b"test" * 1000
+    result = folders.save_file(str(path), io.BytesIO(data))
+    assert result["sha256"] == hashlib.sha256(data).hexdigest()
+    folders.replace_files(str(tmp_path), [result])
+    assert path.read_bytes() == data
+
+    with pytest.raises(HTTPException) as exc_info:
+        folders.save_file(str(path), io.BytesIO(b"changed"), "0" * 64)
+    assert exc_info.value.status_code == 422
+    assert path.read_bytes() == data
+    assert [file.name for file in tmp_path.iterdir()] == ["test.txt"]
+
+
+def test_upload_files(monkeypatch, tmp_path):
+    """Test no file of an upload is saved when one fails its checksum."""
+    (tmp_path / "in").mkdir()
+    monkeypatch.setattr(folders.settings, "FOLDERS_DIR", str(tmp_path))
+    monkeypatch.setattr(
+        folders, "get_folder", lambda id: SimpleNamespace(name="in", max_size=None)
+    )
+
+    def upload(sha256: list[str]):
+        files = [
+            UploadFile(io.BytesIO(b"a"), filename="a.txt"),
+            UploadFile(io.BytesIO(b""), filename=""),
+            UploadFile(io.BytesIO(b"b"), filename="b.txt"),
+        ]
+        return asyncio.run(folders.create_upload_files(1, files, sha256))
+
+    checksums = [hashlib.sha256(data).hexdigest() for data in (b"a", b"", b"b")]
+    with pytest.raises(HTTPException) as exc_info:
+        upload(checksums[:2] + ["0" * 64])
+    assert exc_info.value.status_code == 422
+    assert list((tmp_path / "in").iterdir()) == []
+
+    result = upload(checksums)
+    assert result["filenames"] == ["a.txt", "b.txt"]
+    assert [file["sha256"] for file in result["files"]] == [checksums[0], checksums[2]]
+    assert sorted(file.name for file in (tmp_path / "in").iterdir()) == [
+        "a.txt",
+        "b.txt",
+    ]
+
+
+def test_parse_range():
+    """Test byte ranges, suffix ranges and unsatisfiable ranges."""
+    assert folders.parse_range("bytes=0-99", 1000) == (0, 99)
+    assert folders.parse_range("bytes=900-", 1000) == (900, 999)
+    assert folders.parse_range("bytes=-100", 1000) == (900, 999)
+    assert folders.parse_range("bytes=990-2000", 1000) == (990, 999)
+    assert folders.parse_range("bytes=0-1,5-6", 1000) is None
+    assert folders.parse_range("items=0-1", 1000) is None
+    with pytest.raises(HTTPException) as exc_info:
+        folders.parse_range("bytes=1000-", 1000)
+    assert exc_info.value.status_code == 416
+
+
+def test_stream_archive(tmp_path):
+    """Test a zip archive is streamed in chunks and holds all files."""
+    (tmp_path / "a.txt").write_bytes(b"a" * 10)
+    (tmp_path / "b.bin").write_bytes(os.urandom(3 * 1024 * 1024))
+    chunks = list(archive.stream_archive(str(tmp_path), ["a.txt", "b.bin"], "zip"))
+    assert len(chunks) > 1
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as zip_file:
+        assert zip_file.read("a.txt") == b"a" * 10
+        assert zip_file.read("b.bin") == (tmp_path / "b.bin").read_bytes()
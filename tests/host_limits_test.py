@@ -0,0 +1,78 @@
+"""Test per host session and transfer limits."""
+import threading
+
+from pydantic import ValidationError
+import pytest
+
+from filetransferautomation import host_limits
+from filetransferautomation.host_limits import FairSemaphore
+from filetransferautomation.models import Host
+from filetransferautomation.shemas import AddHost
+
+
+def test_fair_semaphore():
+    """Test freed slots go to waiting tasks in turn, not in arrival order."""
+    semaphore = FairSemaphore(1)
+    semaphore.acquire(1)
+    order = []
+    threads = []
+    for task_id in (1, 1, 1, 2, 3):
+        thread = threading.Thread(
+            target=lambda task_id=task_id: (
+                semaphore.acquire(task_id),
+                order.append(task_id),
+                semaphore.release(),
+            )
+        )
+        thread.start()
+        threads.append(thread)
+        while semaphore.waiting < len(threads):
+            pass
+
+    semaphore.release()
+    for thread in threads:
+        thread.join(5)
+    assert order == [1, 2, 3, 1, 1]
+    assert semaphore.in_use == 0
+
+
+def test_set_limit():
+    """Test a raised limit wakes waiters, a lowered one holds back freed slots."""
+    semaphore = FairSemaphore(1)
+    semaphore.acquire(1)
+    thread = threading.Thread(target=semaphore.acquire, args=(2,))
+    thread.start()
+    while not semaphore.waiting:
+        pass
+    semaphore.set_limit(2)
+    thread.join(5)
+    assert (semaphore.in_use, semaphore.waiting) == (2, 0)
+
+    semaphore.set_limit(1)
+    semaphore.release()
+    assert semaphore.in_use == 1
+    semaphore.release()
+    assert semaphore.in_use == 0
+
+
+def test_slot(monkeypatch):
+    """Test hosts without a limit are not limited."""
+    monkeypatch.setattr(host_limits, "_semaphores", {})
+    host = Host(host_id=1, name="partner", max_sessions=2)
+    with host_limits.session(host, 1), host_limits.session(host, 2):
+        assert host_limits._semaphores[("session", 1)].in_use == 2
+    assert host_limits._semaphores[("session", 1)].in_use == 0
+    with host_limits.transfer(host, 1), host_limits.session(None, 1):
+        assert ("transfer", 1) not in host_limits._semaphores
+    with host_limits.session(Host(host_id=2, name="bad", max_sessions=-1), 1):
+        assert ("session", 2) not in host_limits._semaphores
+
+
+def test_limits_must_be_positive():
+    """Test limits below 1 are refused by the API and the semaphore."""
+    with pytest.raises(ValidationError):
+        AddHost(name="partner", type="local_directory", max_sessions=-1)
+    with pytest.raises(ValidationError):
+        AddHost(name="partner", type="local_directory", max_parallel_transfers=0)
+    with pytest.raises(ValueError):
+        FairSemaphore(0)
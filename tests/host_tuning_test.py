@@ -0,0 +1,56 @@
+"""Test auto tuning of parallel transfers per host."""
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from filetransferautomation import host_tuning, migrations, settings
+from filetransferautomation.host_tuning import Tuner
+from filetransferautomation.models import Host, HostTuning
+
+
+def test_tuner(monkeypatch):
+    """Test parallel transfers go up by one and are halved on errors or a slowdown."""
+    monkeypatch.setattr(settings, "AUTOTUNE_WINDOW_FILES", 2)
+    monkeypatch.setattr(settings, "AUTOTUNE_MAX_TRANSFERS", 3)
+    tuner = Tuner(1)
+    assert tuner.record(False, 1000, 1) is None
+    assert tuner.record(False, 1000, 1) == 2
+    assert (tuner.record(False, 1000, 1), tuner.record(False, 1000, 1)) == (None, 3)
+    tuner.record(False, 1000, 1)
+    assert tuner.record(False, 1000, 1) is None
+    assert tuner.concurrency == 3
+
+    tuner.record(False, 1000, 1)
+    assert tuner.record(False, 500, 1) == 1
+    tuner.record(False, 1000, 1)
+    assert tuner.record(True, None, None) is None
+    assert tuner.concurrency == 1
+
+
+def test_record(monkeypatch, tmp_path):
+    """Test learned parallel transfers are stored and capped by the host."""
+    engine = create_engine(f"sqlite:///{tmp_path}/test.db")
+    migrations.upgrade(engine)
+    monkeypatch.setattr(host_tuning, "SessionLocal", sessionmaker(bind=engine))
+    monkeypatch.setattr(host_tuning, "_tuners", {})
+    monkeypatch.setattr(settings, "AUTOTUNE_TRANSFERS", True)
+    monkeypatch.setattr(settings, "AUTOTUNE_WINDOW_FILES", 1)
+    host = Host(host_id=1, name="partner")
+
+    assert host_tuning.get_concurrency(host) == 1
+    host_tuning.record(host, "downloading")
+    host_tuning.record(host, "downloaded", 1000, 1)
+    host_tuning.record(host, "downloaded", 1000, 1)
+    assert host_tuning.get_concurrency(host) == 3
+    host.max_parallel_transfers = 2
+    assert host_tuning.get_concurrency(host) == 2
+
+    monkeypatch.setattr(host_tuning, "_tuners", {})
+    assert host_tuning.get_tuner(1).concurrency == 3
+
+    with host_tuning.SessionLocal() as db:
+        db.merge(HostTuning(host_id=1, concurrency=1, bytes_per_sec=500))
+        db.commit()
+    assert host_tuning.get_tuner(1).concurrency == 3
+    host_tuning.get_tuner(1).loaded_at -= host_tuning.REFRESH_SEC
+    assert host_tuning.get_tuner(1).concurrency == 1
+    assert host_tuning.get_tuner(1).bytes_per_sec == 500
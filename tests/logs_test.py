@@ -0,0 +1,172 @@
+"""Test the logs API queries."""
+import datetime
+
+from fastapi import FastAPI, Response
+from fastapi.testclient import TestClient
+
+from filetransferautomation import logs
+from filetransferautomation.logs import NEXT_CURSOR_HEADER
+from filetransferautomation.models import FileLog, Step, Task, TaskLog
+
+TIMESTAMP = datetime.datetime(2023, 1, 1, 12)
+
+
+def add_tasks(session):
+    """Add two tasks, the second with a step on host 1."""
+    with session() as db:
+        db.add(Task(task_id=1, name="first", description="", active=1))
+        db.add(Task(task_id=2, name="second", description="", active=1))
+        db.add(Step(step_id=2, sort_order=1, task_id=2, host_id=1))
+        db.commit()
+
+
+def add_file_logs(session, task_run_id: str, task_id: int, statuses: list[tuple]):
+    """Add file log rows, all with the same timestamp."""
+    with session() as db:
+        for file_name, status in statuses:
+            db.add(
+                FileLog(
+                    task_run_id=task_run_id,
+                    task_id=task_id,
+                    step_id=task_id,
+                    file_name=file_name,
+                    status=status,
+                    timestamp=TIMESTAMP,
+                )
+            )
+        db.commit()
+
+
+def read_pages(get_page, limit: int) -> list[list]:
+    """Read all pages, following the X-Next-Cursor header."""
+    pages = []
+    cursor = None
+    while True:
+        response = Response()
+        pages.append(get_page(response, limit, cursor))
+        if NEXT_CURSOR_HEADER not in response.headers:
+            return pages
+        cursor = int(response.headers[NEXT_CURSOR_HEADER])
+
+
+def test_files_log(use_database):
+    """Test the latest status per file, filters and paging through ties."""
+    session = use_database(logs)
+    add_tasks(session)
+    add_file_logs(
+        session,
+        "run1",
+        1,
+        [
+            ("a.txt", "downloading"),
+            ("b.txt", "downloading"),
+            ("a.txt", "downloaded"),
+            ("b.txt", "error"),
+            ("c.txt", "downloaded"),
+        ],
+    )
+    add_file_logs(session, "run2", 2, [("a.txt", "uploaded")])
+
+    def files(response, limit, cursor, **filters):
+        return logs.get_files_log(response, limit=limit, cursor=cursor, **filters)
+
+    pages = read_pages(files, 2)
+    assert [
+        [(row["task_run_id"], row["file_name"]) for row in page] for page in pages
+    ] == [
+        [("run2", "a.txt"), ("run1", "c.txt")],
+        [("run1", "b.txt"), ("run1", "a.txt")],
+    ]
+    assert [row["status"] for row in pages[1]] == ["error", "downloaded"]
+    assert pages[0][0]["name"] == "second"
+
+    pages = read_pages(lambda *args: files(*args, task_run_id="run1"), 2)
+    assert [[row["file_name"] for row in page] for page in pages] == [
+        ["a.txt", "b.txt"],
+        ["c.txt"],
+    ]
+
+    response = Response()
+    assert [row["file_name"] for row in files(response, 30, None, status="error")] == [
+        "b.txt"
+    ]
+    assert [row["task_run_id"] for row in files(response, 30, None, task_id=2)] == [
+        "run2"
+    ]
+    assert [row["task_run_id"] for row in files(response, 30, None, host_id=1)] == [
+        "run2"
+    ]
+    after = TIMESTAMP + datetime.timedelta(seconds=1)
+    assert files(response, 30, None, start=after) == []
+    assert len(files(response, 30, None, end=after)) == 4
+    assert NEXT_CURSOR_HEADER not in response.headers
+
+
+def test_tasks_log(use_database):
+    """Test runs with transferred files are counted, filtered and paged."""
+    session = use_database(logs)
+    add_tasks(session)
+    with session() as db:
+        for number, (task_id, status) in enumerate(
+            [(1, "success"), (1, "error"), (2, "success"), (1, "success")]
+        ):
+            db.add(
+                TaskLog(
+                    task_run_id=f"run{number}",
+                    task_id=task_id,
+                    status=status,
+                    start_time=TIMESTAMP + datetime.timedelta(days=number),
+                )
+            )
+        db.commit()
+    add_file_logs(session, "run0", 1, [("a.txt", "downloaded"), ("a.txt", "uploaded")])
+    add_file_logs(session, "run1", 1, [("a.txt", "downloaded"), ("b.txt", "error")])
+    add_file_logs(session, "run2", 2, [("a.txt", "mailed"), ("b.txt", "uploaded")])
+    add_file_logs(session, "run3", 1, [("a.txt", "error")])
+
+    def tasks(response, limit, cursor, **filters):
+        return logs.get_tasks_log(response, limit=limit, cursor=cursor, **filters)
+
+    pages = read_pages(tasks, 2)
+    assert [
+        [
+            (row["task_run_id"], row["downloaded_files"], row["uploaded_files"])
+            for row in page
+        ]
+        for page in pages
+    ] == [[("run2", 0, 2), ("run1", 1, 0)], [("run0", 1, 1)]]
+    assert "joblog_id" not in pages[0][0]
+
+    response = Response()
+    assert [
+        row["task_run_id"] for row in tasks(response, 30, None, status="error")
+    ] == ["run1"]
+    assert [row["task_run_id"] for row in tasks(response, 30, None, task_id=1)] == [
+        "run1",
+        "run0",
+    ]
+    assert [row["task_run_id"] for row in tasks(response, 30, None, host_id=1)] == [
+        "run2"
+    ]
+    assert [
+        row["task_run_id"]
+        for row in tasks(
+            response,
+            30,
+            None,
+            start=TIMESTAMP + datetime.timedelta(days=1),
+            end=TIMESTAMP + datetime.timedelta(days=2),
+        )
+    ] == ["run1"]
+
+
+def test_paging_parameters_validated():
+    """Test a limit below 1 or a negative cursor is refused instead of failing."""
+    app = FastAPI()
+    app.include_router(logs.router, prefix="/logs")
+    client = TestClient(app)
+    for url in ("/logs/files", "/logs/tasks", "/logs/archive/file_log/2023-01-01"):
+        assert client.get(url, params={"limit": 0}).status_code == 422
+        assert client.get(url, params={"limit": -1}).status_code == 422
+    response = client.get("/logs/archive/file_log/2023-01-01", params={"cursor": -1})
+    assert response.status_code == 422
@@ -0,0 +1,122 @@
+"""Test mail attachments."""
+from concurrent.futures import Future
+import email
+import json
+import smtplib
+
+import pytest
+
+from filetransferautomation.step_plugins import mail
+
+
+def test_split_files():
+    """Test files are split to fit the max message size, skipping too big files."""
+    sizes = {"a": 40_000, "b": 40_000, "c": 10, "big": 500_000}
+    assert mail.split_files(sizes, 100_000) == ([["a"], ["b", "c"]], ["big"])
+    assert mail.split_files(sizes, 100_000, True) == ([["a"], ["b"], ["c"]], ["big"])
+
+
+def test_build_mail(tmp_path):
+    """Test attachments are encoded as a parsable message."""
+    data = b"\x00\x01" * 100_000
+    (tmp_path / "test.bin").write_bytes(data)
+    spooled = mail.build_mail(
+        "from@example.com",
+        ["to@example.com"],
+        "Test",
+        "Body",
+        str(tmp_path),
+        ["test.bin"],
+    )
+    spooled.data.seek(0)
+    raw = spooled.data.read()
+    assert all(len(line) <= 78 for line in raw.split(b"\r\n"))
+
+    message = email.message_from_bytes(raw)
+    parts = [part for part in message.walk() if part.get_filename()]
+    assert [part.get_filename() for part in parts] == ["test.bin"]
+    assert parts[0].get_payload(decode=True) == data
+
+    compressed = mail.build_mail(
+        "from@example.com",
+        ["to@example.com"],
+        "Test",
+        "",
+        str(tmp_path),
+        ["test.bin"],
+        True,
+    )
+    compressed.data.seek(0)
+    message = email.message_from_bytes(compressed.data.read())
+    assert [part.get_filename() for part in message.walk() if part.get_filename()] == [
+        mail.COMPRESSED_FILENAME
+    ]
+
+
+def test_async_delivery(monkeypatch, tmp_path):
+    """Test files delivered in the background aren't mailed until delivered."""
+    (tmp_path / "a.txt").write_text("a")
+    sent = Future()
+    monkeypatch.setattr(mail.pool, "submit", lambda messages: sent)
+    logged = []
+    monkeypatch.setattr(
+        mail.SendFiles,
+        "log_file",
+        lambda self, file, status, **_: logged.append(status),
+    )
+    arguments = {
+        "from_address": "from@example.com",
+        "to_addresses": ["to@example.com"],
+        "subject": "Test",
+        "body": "Body",
+        "async_delivery": True,
+    }
+    deliveries = []
+    plugin = mail.SendFiles(
+        json.dumps(arguments),
+        {"workspace_directory": str(tmp_path), "pending_deliveries": deliveries},
+    )
+    plugin.process()
+    assert plugin.get_variable("mailed_files") == []
+    assert logged == ["mailing"]
+    assert not deliveries[0].done()
+
+    sent.set_result([smtplib.SMTPDataError(554, b"rejected")])
+    assert deliveries[0].result() is False
+    assert logged == ["mailing", "error"]
+
+
+def test_failed_build_closes_mails(monkeypatch, tmp_path):
+    """Test mails built before a failing batch are closed."""
+    (tmp_path / "a.txt").write_text("a")
+    (tmp_path / "b.txt").write_text("b")
+    built = []
+
+    def build_mail(*args):
+        if built:
+            raise OSError("disk full")
+        built.append(real_build_mail(*args))
+        return built[-1]
+
+    real_build_mail = mail.build_mail
+    monkeypatch.setattr(mail, "build_mail", build_mail)
+    logged = []
+    monkeypatch.setattr(
+        mail.SendFiles,
+        "log_file",
+        lambda self, file, status, **_: logged.append(status),
+    )
+    arguments = {
+        "from_address": "from@example.com",
+        "to_addresses": ["to@example.com"],
+        "subject": "Test",
+        "body": "Body",
+        "mail_per_file": True,
+    }
+    plugin = mail.SendFiles(
+        json.dumps(arguments), {"workspace_directory": str(tmp_path)}
+    )
+    with pytest.raises(Exception, match="error in file transfer"):
+        plugin.process()
+    assert built[0].data.closed
+    assert logged == ["mailing", "mailing", "error", "error"]
@@ -0,0 +1,21 @@
+"""Test metrics rendering."""
+from filetransferautomation import metrics
+
+
+def test_histogram_render():
+    """Test histogram buckets are cumulative and labels are escaped."""
+    histogram = metrics.Histogram(
+        "test_duration_seconds", "Test histogram.", ("host",), (1, 10)
+    )
+    metrics.REGISTRY.remove(histogram)
+    histogram.observe(0.5, host='a "b"')
+    histogram.observe(5, host='a "b"')
+    histogram.observe(50, host='a "b"')
+
+    lines = histogram.render().splitlines()
+    assert lines[1] == "# TYPE test_duration_seconds histogram"
+    assert 'test_duration_seconds_bucket{host="a \\"b\\"",le="1.0"} 1.0' in lines
+    assert 'test_duration_seconds_bucket{host="a \\"b\\"",le="10.0"} 2.0' in lines
+    assert 'test_duration_seconds_bucket{host="a \\"b\\"",le="+Inf"} 3.0' in lines
+    assert 'test_duration_seconds_sum{host="a \\"b\\""} 55.5' in lines
+    assert 'test_duration_seconds_count{host="a \\"b\\""} 3.0' in lines
@@ -0,0 +1,27 @@
+"""Test database migrations."""
+from sqlalchemy import create_engine, inspect
+
+from filetransferautomation import migrations
+
+
+def test_upgrade_adds_log_indexes():
+    """Test indexes are added to an existing database."""
+    engine = create_engine("sqlite://")
+    migrations.models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DROP INDEX ix_step_log_task_run_id_step_id")
+        connection.exec_driver_sql("DROP INDEX ix_file_log_task_run_id_status")
+
+    migrations.upgrade(engine)
+    migrations.upgrade(engine)
+
+    indexes = {
+        index["name"]: index["column_names"]
+        for index in inspect(engine).get_indexes("step_log")
+    }
+    assert indexes["ix_step_log_task_run_id_step_id"] == ["task_run_id", "step_id"]
+    assert "ix_file_log_task_run_id_status" in {
+        index["name"] for index in inspect(engine).get_indexes("file_log")
+    }
+    with engine.connect() as connection:
+        assert migrations.get_schema_version(connection) == migrations.MIGRATIONS[-1][0]
@@ -0,0 +1,72 @@
+"""Test plugin lookup."""
+from filetransferautomation import plugin_collection
+from filetransferautomation.plugin_collection import (
+    PLUGIN_PACKAGE,
+    Plugin,
+    PluginCollection,
+    get_plugin,
+    list_plugins,
+    load_manifest,
+    register_plugin,
+)
+
+
+def test_manifest_is_current():
+    """Test the manifest lists every plugin, regenerate it if this fails."""
+    plugins = PluginCollection(PLUGIN_PACKAGE).plugins
+    assert load_manifest() == {
+        plugin.name: {
+            "module": plugin.__module__,
+            "class": plugin.__name__,
+            "description": plugin.__doc__,
+            "input_model": plugin.input_model.schema(),
+            "output_model": plugin.output_model.schema(),
+        }
+        for plugin in plugins
+    }
+
+
+def test_get_plugin(monkeypatch):
+    """Test plugins are found by script name, from the manifest or by walking."""
+    monkeypatch.setattr(plugin_collection, "_loaded_plugins", {})
+    monkeypatch.setattr(plugin_collection, "_package_walked", False)
+    plugin = get_plugin("Local_Directory_Download_Files")
+    assert plugin.__name__ == "DownloadFiles"
+    assert plugin.name == "local_directory_download_files"
+    assert get_plugin("local_directory_download_files") is plugin
+    assert get_plugin("no_such_script") is None
+    with monkeypatch.context() as patch:
+        patch.delattr(plugin_collection, "PluginCollection")
+        assert get_plugin("no_such_script") is None
+
+    monkeypatch.setattr(plugin_collection, "_manifest", {})
+    assert get_plugin("ftp_upload").__name__ == "Upload"
+
+    class Noop(Plugin):
+        """Do nothing."""
+
+    register_plugin(Noop)
+    assert get_plugin(Noop.name) is Noop
+
+
+def test_list_plugins(monkeypatch):
+    """Test plugins are listed from the manifest, without loading them."""
+    monkeypatch.setattr(plugin_collection, "_loaded_plugins", {})
+    listed = {plugin["name"]: plugin for plugin in list_plugins()}
+    assert list(listed) == list(load_manifest())
+    assert listed["ftp_upload"]["description"] == "Upload file to FTP."
+    assert "properties" in listed["ftp_upload"]["input_model"]
+    assert plugin_collection._loaded_plugins == {}
+
+    class Noop(Plugin):
+        """Do nothing."""
+
+    register_plugin(Noop)
+    assert list_plugins()[-1]["description"] == "Do nothing."
+
+
+def test_split_completed_files():
+    """Test files a resumed run already transferred are split off."""
+    plugin = Plugin("{}", {"completed_files": {"b.txt"}})
+    assert plugin.split_completed_files(["a.txt", "b.txt"]) == (["a.txt"], ["b.txt"])
+    assert Plugin("{}", {}).split_completed_files(["a.txt"]) == (["a.txt"], [])
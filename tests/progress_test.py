@@ -0,0 +1,42 @@
+"""Test transfer progress reporting."""
+from filetransferautomation import progress
+
+
+def test_progress_changes():
+    """Test only changed files of the requested runs are returned."""
+    reporter = progress.ProgressReporter()
+    transfer = reporter.start("run1", 1, "a.txt", 100)
+    reporter.start("run2", 1, "b.txt", None)
+    version, changes = reporter.changes(0, ["run1"])
+    assert [change["file_name"] for change in changes] == ["a.txt"]
+
+    transfer.add(b"0123456789")
+    transfer.add(20)
+    version, changes = reporter.changes(version)
+    assert [(change["file_name"], change["bytes_done"]) for change in changes] == [
+        ("a.txt", 30)
+    ]
+
+    reporter.finish("run1", 1, "a.txt", "downloaded")
+    reporter.finish_run("run2")
+    version, changes = reporter.changes(version)
+    assert [(change["status"], change["bytes_done"]) for change in changes] == [
+        ("downloaded", 100),
+        ("aborted", 0),
+    ]
+    assert reporter.changes(version) == (version, [])
+
+
+def test_progress_prunes_finished(monkeypatch):
+    """Test finished files are removed when runs finish, without reading changes."""
+    monkeypatch.setattr(progress, "FINISHED_RETAIN_SEC", 0)
+    reporter = progress.ProgressReporter()
+    reporter.start("run1", 1, "a.txt", 100)
+    reporter.start("run1", 1, "b.txt", 100)
+    reporter.finish("run1", 1, "a.txt", "downloaded")
+    reporter.start("run2", 1, "c.txt", 100)
+    assert sorted(file for _, _, file in reporter._files) == ["b.txt", "c.txt"]
+
+    reporter.finish_run("run1")
+    reporter.prune()
+    assert list(reporter._files) == [("run2", 1, "c.txt")]
@@ -0,0 +1,113 @@
+"""Test log retention."""
+import datetime
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from filetransferautomation import retention, settings
+from filetransferautomation.models import FileLog, StepLog, TaskLog, TaskLogDaily
+
+
+def add_runs(db: Session, start_times: list[datetime.datetime]):
+    """Add finished task runs with a step and a downloaded file."""
+    for number, start_time in enumerate(start_times):
+        task_run_id = f"run{number}"
+        db.add(
+            TaskLog(
+                task_run_id=task_run_id,
+                task_id=1,
+                status="success",
+                start_time=start_time,
+                duration_sec=2.0,
+            )
+        )
+        db.add(
+            StepLog(
+                task_run_id=task_run_id,
+                task_id=1,
+                step_id=1,
+                status="success",
+                start_time=start_time,
+            )
+        )
+        for status in ("downloading", "downloaded"):
+            db.add(
+                FileLog(
+                    task_run_id=task_run_id,
+                    task_id=1,
+                    step_id=1,
+                    file_name="test.txt",
+                    status=status,
+                    size=10,
+                )
+            )
+    db.commit()
+
+
+@pytest.fixture(autouse=True)
+def archive_dir(monkeypatch, tmp_path):
+    """Use a new archive directory."""
+    monkeypatch.setattr(settings, "ARCHIVE_DIR", str(tmp_path / "archive"))
+
+
+def test_archive_batch(use_database):
+    """Test old runs are archived, rolled up and deleted in batches."""
+    session = use_database(retention)
+    old = datetime.datetime(2023, 1, 1, 12)
+    now = datetime.datetime(2023, 6, 1, 12)
+
+    with session() as db:
+        add_runs(db, [old, old, old, now])
+
+    cutoff = datetime.datetime(2023, 3, 1)
+    assert retention.archive_batch(cutoff, 2) == 2
+    assert retention.archive_batch(cutoff, 2) == 1
+    assert retention.archive_batch(cutoff, 2) == 0
+
+    with session() as db:
+        assert db.scalar(select(func.count(TaskLog.joblog_id))) == 1
+        assert db.scalar(select(func.count(FileLog.filelog_id))) == 2
+        daily = db.execute(select(TaskLogDaily)).scalars().one()
+        assert (daily.day, daily.runs, daily.success_runs) == (old.date(), 3, 3)
+        assert (daily.files, daily.size, daily.duration_sec) == (3, 30, 6.0)
+
+    archived = list(retention.read_archive("file_log", old.date()))
+    assert len(archived) == 6
+    assert {row["task_run_id"] for row in archived} == {"run0", "run1", "run2"}
+    assert [archive["table"] for archive in retention.list_archives()] == [
+        "task_log",
+        "step_log",
+        "file_log",
+    ]
+
+
+def test_archive_batch_failed(tmp_path, monkeypatch, use_database):
+    """Test a batch that fails to commit archives nothing, and pending files recover."""
+    session = use_database(retention)
+    old = datetime.datetime(2023, 1, 1, 12)
+    cutoff = datetime.datetime(2023, 3, 1)
+    with session() as db:
+        add_runs(db, [old, old])
+
+    def fail(runs, files):
+        raise OSError("database is locked")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(retention, "delete_batch", fail)
+        with pytest.raises(OSError):
+            retention.archive_batch(cutoff, 1)
+    assert retention.list_archives() == []
+
+    with session() as db:
+        runs = db.execute(select(TaskLog).order_by(TaskLog.joblog_id)).scalars().all()
+        for run in runs:
+            retention.write_archive("task_log", run.joblog_id, {old.date(): [run]})
+        db.delete(runs[0])
+        db.commit()
+
+    retention.recover_archives()
+    assert [
+        row["task_run_id"] for row in retention.read_archive("task_log", old.date())
+    ] == ["run0"]
+    assert list(tmp_path.glob("archive/*/*" + retention.PENDING_SUFFIX)) == []
@@ -0,0 +1,197 @@
+"""Test the run queue and scheduler lease."""
+import asyncio
+import datetime
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from filetransferautomation import (
+    jobs,
+    leases,
+    logs,
+    metrics,
+    progress,
+    run_queue,
+    schedules,
+    settings,
+    tasks,
+    worker,
+)
+from filetransferautomation.models import Lease, RunQueue, TaskLog
+from filetransferautomation.plugin_collection import Plugin, RunCancelledError
+
+
+def test_lease(use_database):
+    """Test a lease is held by one holder until it expires."""
+    session = use_database(leases, run_queue, logs)
+    assert leases.acquire("scheduler", "a", 30)
+    assert leases.acquire("scheduler", "a", 30)
+    assert leases.acquire("scheduler", "b", 30) is None
+
+    with session() as db:
+        db.query(Lease).update(
+            {"expires_at": datetime.datetime.now() - datetime.timedelta(seconds=1)}
+        )
+        db.commit()
+    assert leases.acquire("scheduler", "b", 30)
+    assert leases.acquire("scheduler", "a", 30) is None
+
+    leases.release("scheduler", "b")
+    assert leases.acquire("scheduler", "a", 30)
+
+
+def test_claim_and_run(monkeypatch, use_database):
+    """Test queued runs are claimed once, oldest first, and get their status."""
+    session = use_database(leases, run_queue, logs)
+    run_ids = [run_queue.enqueue(task_id) for task_id in (1, 2, 3)]
+    claimed = run_queue.claim("a", 2, 30)
+    assert [(run.run_id, run.task_id, run.attempts) for run in claimed] == [
+        (run_ids[0], 1, 1),
+        (run_ids[1], 2, 1),
+    ]
+    assert [run.run_id for run in run_queue.claim("b", 2, 30)] == [run_ids[2]]
+    assert run_queue.claim("b", 2, 30) == []
+
+    monkeypatch.setattr(settings, "WORKER_CONCURRENCY", 1)
+    monkeypatch.setattr(tasks, "run_task", lambda *args, **kwargs: "success")
+    run_id = run_queue.enqueue(4)
+    task_worker = worker.Worker("c")
+    assert task_worker.poll() == 1
+    for thread in threading.enumerate():
+        if thread.name == f"run-{run_id}":
+            thread.join()
+    assert task_worker.running == 0
+    with session() as db:
+        run = db.get(RunQueue, run_id)
+        assert (run.status, run.claimed_by) == ("success", "c")
+        assert run.finished_at
+
+
+def test_recover_expired(use_database):
+    """Test runs of a dead worker are aborted and queued again to resume."""
+    session = use_database(leases, run_queue, logs)
+
+    def expire_leases():
+        with session() as db:
+            db.query(RunQueue).update(
+                {
+                    "lease_expires_at": datetime.datetime.now()
+                    - datetime.timedelta(seconds=1)
+                }
+            )
+            db.commit()
+
+    run_id = run_queue.enqueue(1)
+    (run,) = run_queue.claim("a", 1, 30)
+    logs.add_task_log_entry(run.task_run_id, 1, "running")
+    assert run_queue.heartbeat("a", [run_id], 30) == []
+    assert run_queue.recover_expired("c", 2, 30) == []
+
+    # Taken over by another worker recovering it, the task log is left alone.
+    with session() as db:
+        db.query(RunQueue).update({"status": "recovering", "claimed_by": "d"})
+        db.commit()
+    assert run_queue.recover_expired("c", 2, 30) == []
+    with session() as db:
+        assert db.query(TaskLog).one().status == "running"
+        db.query(RunQueue).update({"status": "running", "claimed_by": "a"})
+        db.commit()
+
+    expire_leases()
+    assert run_queue.heartbeat("b", [run_id], 30) == [run_id]
+    assert run_queue.recover_expired("c", 2, 30) == [run_id]
+    with session() as db:
+        assert db.query(TaskLog).one().status == "error"
+    assert run_queue.heartbeat("a", [run_id], 30) == [run_id]
+
+    (resumed,) = run_queue.claim("b", 1, 30)
+    assert (resumed.task_run_id, resumed.attempts) == (run.task_run_id, 2)
+    run_queue.finish(run_id, "a", "success")
+    expire_leases()
+    assert run_queue.recover_expired("c", 2, 30) == []
+    with session() as db:
+        assert db.get(RunQueue, run_id).status == "error"
+
+
+def test_lost_lease_cancels_run(use_database):
+    """Test a run whose lease was lost is cancelled before its next file."""
+    session = use_database(leases, run_queue, logs)
+    run_id = run_queue.enqueue(1)
+    task_worker = worker.Worker("a")
+    run_queue.claim("a", 1, 30)
+    task_worker.run_ids.add(run_id)
+    task_worker.cancelled[run_id] = threading.Event()
+
+    task_worker.heartbeat()
+    assert not task_worker.cancelled[run_id].is_set()
+    with session() as db:
+        db.query(RunQueue).update({"claimed_by": "b"})
+        db.commit()
+    task_worker.heartbeat()
+    assert task_worker.cancelled[run_id].is_set()
+
+    plugin = Plugin("{}", {"cancelled": task_worker.cancelled[run_id]})
+    with pytest.raises(RunCancelledError):
+        plugin.host_transfer()
+
+
+def test_startup_runs_queued_once(monkeypatch, use_database):
+    """Test taking the scheduler lease back doesn't queue the startup runs again."""
+    session = use_database(leases, run_queue, logs)
+    task = SimpleNamespace(
+        task_id=1,
+        active=1,
+        schedules=[SimpleNamespace(schedule_id=1, cron="0 0 * * *")],
+    )
+    monkeypatch.setattr(tasks, "get_active_tasks", lambda: [task])
+    monkeypatch.setattr(schedules, "update_schedule_job_id", lambda *args: None)
+    monkeypatch.setattr(jobs, "startup_runs_queued", False)
+
+    asyncio.run(jobs.load_jobs())
+    jobs.unload_jobs()
+    asyncio.run(jobs.load_jobs())
+    jobs.unload_jobs()
+    with session() as db:
+        assert [run.task_id for run in db.query(RunQueue).all()] == [1]
+
+
+def test_due_runs_kept_until_queued(monkeypatch, use_database):
+    """Test due runs are queued on the next tick when queueing them failed."""
+    session = use_database(leases, run_queue, logs)
+    monkeypatch.setattr(jobs, "due_task_ids", [1, 2])
+
+    def fail(task_ids):
+        raise RuntimeError("database is locked")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(run_queue, "enqueue_many", fail)
+        with pytest.raises(RuntimeError):
+            jobs.run_due_jobs()
+    assert jobs.due_task_ids == [1, 2]
+
+    jobs.run_due_jobs()
+    assert jobs.due_task_ids == []
+    with session() as db:
+        assert [run.task_id for run in db.query(RunQueue).all()] == [1, 2]
+
+
+def test_run_in_progress_ends_on_error(monkeypatch):
+    """Test a failing run isn't counted in progress and its transfers are aborted."""
+    reporter = progress.ProgressReporter()
+    monkeypatch.setattr(progress, "reporter", reporter)
+    before = metrics.TASK_RUNS_IN_PROGRESS.value()
+    with pytest.raises(RuntimeError), tasks.run_in_progress("run1"):
+        reporter.start("run1", 1, "a.txt", 100)
+        assert metrics.TASK_RUNS_IN_PROGRESS.value() == before + 1
+        raise RuntimeError("host not found")
+    assert metrics.TASK_RUNS_IN_PROGRESS.value() == before
+    assert [change["status"] for change in reporter.changes()[1]] == ["aborted"]
+
+
+def test_queue_depth(use_database):
+    """Test the queue depth metric counts runs not claimed yet."""
+    use_database(leases, run_queue, logs)
+    run_queue.enqueue_many([1, 2, 3])
+    run_queue.claim("a", 1, 30)
+    assert "fta_task_queue_depth 2.0" in metrics.TASK_QUEUE_DEPTH.render()
@@ -0,0 +1,130 @@
+"""Test SMTP connection pool."""
+from email.message import EmailMessage
+import io
+import smtplib
+
+from filetransferautomation import settings, smtp_pool
+
+
+class FakeSMTP:
+    """SMTP session that records what it is asked to do."""
+
+    sessions: list["FakeSMTP"] = []
+
+    def __init__(self, host, port, timeout):
+        """Connect."""
+        self.sent: list = []
+        self.noops = 0
+        self.alive = True
+        FakeSMTP.sessions.append(self)
+
+    def send_message(self, message):
+        """Send, or fail when disconnected or refused."""
+        if not self.alive:
+            raise smtplib.SMTPServerDisconnected()
+        if message["To"] == "refused@example.com":
+            raise smtplib.SMTPRecipientsRefused({})
+        self.sent.append(message["Subject"])
+        if message["Cc"] == "refused@example.com":
+            return {"refused@example.com": (550, b"unknown")}
+        return {}
+
+    def noop(self):
+        """Check connection."""
+        self.noops += 1
+        return (250, b"OK") if self.alive else (421, b"closing")
+
+    def rset(self):
+        """Reset transaction."""
+
+    def quit(self):
+        """Quit."""
+        self.alive = False
+
+    def close(self):
+        """Close."""
+
+
+def message(
+    subject: str, to: str = "to@example.com", cc: str | None = None
+) -> EmailMessage:
+    """Get a message."""
+    mail = EmailMessage()
+    mail["Subject"] = subject
+    mail["To"] = to
+    if cc:
+        mail["Cc"] = cc
+    return mail
+
+
+def test_pool_reuses_sessions(monkeypatch, caplog):
+    """Test sessions are reused, checked when idle and reconnected when dropped."""
+    monkeypatch.setattr(smtplib, "SMTP", FakeSMTP)
+    monkeypatch.setattr(settings, "SMTP_POOL_NOOP_AFTER_SEC", 0)
+    FakeSMTP.sessions = []
+    pool = smtp_pool.SMTPPool()
+
+    errors = pool.send_messages(
+        [message("1"), message("2", "refused@example.com"), message("3")]
+    )
+    assert errors[0] is None and errors[2] is None
+    assert isinstance(errors[1], smtplib.SMTPRecipientsRefused)
+    assert pool.submit([message("4")]).result() == [None]
+    assert len(FakeSMTP.sessions) == 1
+    assert FakeSMTP.sessions[0].sent == ["1", "3", "4"]
+    assert FakeSMTP.sessions[0].noops == 1
+
+    FakeSMTP.sessions[0].alive = False
+    assert pool.send_messages([message("5")]) == [None]
+    assert [session.sent for session in FakeSMTP.sessions] == [["1", "3", "4"], ["5"]]
+
+    assert pool.send_messages([message("6", cc="refused@example.com")]) == [None]
+    assert "'refused@example.com' (550 unknown)" in caplog.text
+
+    pool.close_all()
+    assert not FakeSMTP.sessions[1].alive
+
+
+class DataSMTP:
+    """SMTP session accepting a mail sent with send_data."""
+
+    def __init__(self):
+        """Init."""
+        self.data = b""
+
+    def ehlo_or_helo_if_needed(self):
+        """Greet."""
+
+    def mail(self, sender):
+        """Accept the sender."""
+        return 250, b"OK"
+
+    def rcpt(self, recipient):
+        """Accept a recipient."""
+        return 250, b"OK"
+
+    def docmd(self, command):
+        """Start the DATA."""
+        return 354, b"go ahead"
+
+    def send(self, data):
+        """Receive data."""
+        self.data += data
+
+    def getreply(self):
+        """Accept the mail."""
+        return 250, b"OK"
+
+
+def test_send_data_throttled():
+    """Test every chunk of the DATA passes the throttle of the mail."""
+    throttled = []
+    data = io.BytesIO(b".dot\r\n" + b"x" * 100_000 + b"\r\n")
+    mail = smtp_pool.SpooledMail(
+        "from@example.com", ["to@example.com"], data, throttled.append
+    )
+    smtp = DataSMTP()
+    assert smtp_pool.send_data(smtp, mail) == {}
+    assert smtp.data.startswith(b"..dot\r\n")
+    assert len(throttled) == 2
+    assert sum(throttled) == len(smtp.data)
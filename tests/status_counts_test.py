@@ -0,0 +1,76 @@
+"""Test task run status counters."""
+import datetime
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from filetransferautomation import migrations, tasks
+from filetransferautomation.models import FileLog, TaskLog
+from filetransferautomation.status_counts import (
+    count_status_change,
+    get_status_counts,
+    rebuild_status_counts,
+)
+
+
+def test_status_counts():
+    """Test incremental counters match a rebuild from the log tables."""
+    engine = create_engine("sqlite://")
+    migrations.upgrade(engine)
+    now = datetime.datetime.now()
+
+    with Session(engine) as db:
+        for task_run_id, status, files in (
+            ("run1", "success", 2),
+            ("run2", "success", 0),
+            ("run3", "error", 0),
+            ("run4", "running", 0),
+        ):
+            db.add(
+                TaskLog(
+                    task_run_id=task_run_id, task_id=1, status="running", start_time=now
+                )
+            )
+            count_status_change(db, task_run_id, now.date(), None, "running")
+            for number in range(files):
+                db.add(
+                    FileLog(
+                        task_run_id=task_run_id,
+                        task_id=1,
+                        step_id=1,
+                        file_name=f"{number}.txt",
+                        status="downloaded",
+                    )
+                )
+            db.flush()
+            if status != "running":
+                count_status_change(db, task_run_id, now.date(), "running", status)
+                db.query(TaskLog).filter(TaskLog.task_run_id == task_run_id).update(
+                    {"status": status}
+                )
+        db.commit()
+
+        expected = {"success": 1, "no_files": 1, "error": 1, "running": 1}
+        assert get_status_counts(db) == expected
+        assert get_status_counts(db, now.date() + datetime.timedelta(days=1)) == {
+            "success": 0,
+            "no_files": 0,
+            "error": 0,
+            "running": 0,
+        }
+
+    with engine.begin() as connection:
+        rebuild_status_counts(connection)
+    with Session(engine) as db:
+        assert get_status_counts(db) == expected
+
+
+def test_status_days_must_be_positive():
+    """Test the status of the last 0 or fewer days is refused."""
+    app = FastAPI()
+    app.include_router(tasks.router, prefix="/tasks")
+    client = TestClient(app)
+    assert client.get("/tasks/status", params={"days": 0}).status_code == 422
+    assert client.get("/tasks/status", params={"days": -1}).status_code == 422
@@ -0,0 +1,31 @@
+"""Test task run tracing."""
+from filetransferautomation import settings, tracing
+
+
+def test_chrome_trace(monkeypatch):
+    """Test spans are kept for sampled runs only and old runs are dropped."""
+    monkeypatch.setattr(settings, "TRACE_RETAIN_RUNS", 2)
+    tracer = tracing.Tracer()
+
+    monkeypatch.setattr(settings, "TRACE_SAMPLE_RATE", 0)
+    assert not tracer.start_run("skipped")
+    with tracer.span("skipped", "task"):
+        pass
+    assert tracer.chrome_trace("skipped") is None
+
+    monkeypatch.setattr(settings, "TRACE_SAMPLE_RATE", 1)
+    for task_run_id in ("run1", "run2", "run3"):
+        assert tracer.start_run(task_run_id)
+    assert tracer.traced_runs() == ["run2", "run3"]
+
+    with tracer.span("run3", "task", task_id=1), tracer.span(
+        "run3", "transfer", "sftp_download", file="a.txt"
+    ):
+        pass
+    events = tracer.chrome_trace("run3")["traceEvents"]
+    assert [event["name"] for event in events] == ["task", "transfer"]
+    assert events[1]["cat"] == "sftp_download"
+    assert events[1]["args"] == {"file": "a.txt"}
+    assert events[0]["ph"] == "X"
+    assert events[0]["ts"] <= events[1]["ts"]
+    assert events[0]["dur"] >= events[1]["dur"]